@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import time
+
+import torch
+import torchaudio
+
+from src.audio.tts.profiles import INFERENCE_PROFILES
+from src.audio.lib.CosyVoice.cosyvoice.utils.file_utils import load_wav
+from generate_audio import init_tts_model
+
+SENTENCES = [
+    "纳兰嫣然明眸紧紧的盯着不远处那身子略显单薄的青年。",
+    "他...真的变了。",
+    "那便是萧家的那个小家伙？不是说是个不能储存斗气的废物么？",
+    "巨树之上，加刑天望着萧炎，眼中有着几缕诧异，可看他现在这副气度，可不象是外强内干强行装出来的。",
+]
+
+
+def benchmark(
+    tts_model: str,
+    profile: str,
+    speech_file: str,
+    sentences,
+    output_dir: str,
+    num_threads: int = None,
+    batch_workers: int = 0,
+):
+    """
+    测试一个推理配置的实时率和质量
+    Returns:
+        {
+            "profile": 配置名,
+            "load_secs": 模型加载耗时,
+            "rtf": 合成耗时 / 音频时长，小于 1 表示快于实时,
+            "secs_per_char": 平均每字的音频时长，与 default 差别过大说明语速或截断异常,
+            "speaker_similarity": 合成语音与音源的说话人嵌入余弦相似度，越高越像,
+            "batch": batch_workers 大于 0 时 compare_batch 的结果,
+        }
+    """
+    start = time.perf_counter()
+    model = init_tts_model(tts_model, profile, num_threads)
+    load_secs = time.perf_counter() - start
+    model.register("speaker", speech_file)
+    model.prepare_voices()
+
+    os.makedirs(output_dir, exist_ok=True)
+    # 预热，首次推理包含 JIT/ONNX 的初始化
+    model.generate(sentences[0], "正常语速", "speaker", os.path.join(output_dir, "warmup.wav"))
+
+    torch.manual_seed(0)
+    synth_secs = 0.0
+    audio_secs = 0.0
+    similarities = []
+    for i, sentence in enumerate(sentences):
+        output_file = os.path.join(output_dir, f"{i}.wav")
+        start = time.perf_counter()
+        model.generate(sentence, "正常语速", "speaker", output_file)
+        synth_secs += time.perf_counter() - start
+
+        speech, sample_rate = torchaudio.load(output_file)
+        audio_secs += speech.shape[1] / sample_rate
+        similarities.append(_speaker_similarity(model, output_file, speech_file))
+
+    result = {
+        "profile": profile,
+        "load_secs": load_secs,
+        "rtf": synth_secs / audio_secs,
+        "secs_per_char": audio_secs / sum(len(sentence) for sentence in sentences),
+        "speaker_similarity": sum(similarities) / len(similarities) if similarities[0] is not None else None,
+    }
+    if batch_workers > 0:
+        result["batch"] = compare_batch(model, sentences, output_dir, batch_workers)
+    del model
+    return result
+
+
+def compare_batch(model, sentences, output_dir: str, workers: int = 4):
+    """
+    检查批量合成与逐句合成一致，并测量 LLM 并发推理的加速
+    Returns:
+        {
+            "max_diff": 固定随机种子、LLM 不并发时，批量与逐句合成的最大采样差,
+            "sequential_secs": 逐句合成的耗时,
+            "batch_secs": llm_workers=workers 时批量合成的耗时,
+            "speedup": sequential_secs / batch_secs,
+        }
+    """
+    requests = [
+        {
+            "tts_text": sentence,
+            "instruct_text": "正常语速",
+            "speech_key": "speaker",
+            "output_path": os.path.join(output_dir, f"batch_{i}.wav"),
+        }
+        for i, sentence in enumerate(sentences)
+    ]
+    sequential_files = [os.path.join(output_dir, f"sequential_{i}.wav") for i in range(len(requests))]
+
+    torch.manual_seed(0)
+    start = time.perf_counter()
+    for request, output_file in zip(requests, sequential_files):
+        model.generate(request["tts_text"], request["instruct_text"], request["speech_key"], output_file, segment_workers=1)
+    sequential_secs = time.perf_counter() - start
+
+    # 随机数的消耗顺序与逐句合成相同，输出应当一致
+    torch.manual_seed(0)
+    model.generate_batch(requests, llm_workers=1)
+    max_diff = 0.0
+    for request, output_file in zip(requests, sequential_files):
+        batch, _ = torchaudio.load(request["output_path"])
+        sequential, _ = torchaudio.load(output_file)
+        if batch.shape != sequential.shape:
+            max_diff = float("inf")
+            break
+        max_diff = max(max_diff, (batch - sequential).abs().max().item())
+
+    start = time.perf_counter()
+    model.generate_batch(requests, llm_workers=workers)
+    batch_secs = time.perf_counter() - start
+    return {
+        "max_diff": max_diff,
+        "sequential_secs": sequential_secs,
+        "batch_secs": batch_secs,
+        "speedup": sequential_secs / batch_secs,
+    }
+
+
+def _speaker_similarity(model, output_file: str, speech_file: str):
+    frontend = getattr(model, "frontend", None)
+    if frontend is None:
+        return None
+    output_embedding = frontend._extract_spk_embedding(load_wav(output_file, 16000))
+    speech_embedding = frontend._extract_spk_embedding(load_wav(speech_file, 16000))
+    return torch.nn.functional.cosine_similarity(output_embedding, speech_embedding).item()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tts_model", type=str, default="CosyVoice")
+    parser.add_argument("--profiles", type=str, nargs="+", default=list(INFERENCE_PROFILES))
+    parser.add_argument("--speech_file", type=str, default=os.path.join("data", "speech", "male1.wav"))
+    parser.add_argument("--text_file", type=str, default=None, help="每行一句，默认使用内置的句子")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--output_dir", type=str, default=os.path.join("results", "benchmark"))
+    parser.add_argument(
+        "--batch_workers",
+        type=int,
+        default=0,
+        help="大于 0 时检查批量合成与逐句合成一致，并测量该 LLM 并发数下批量合成的加速",
+    )
+
+    args = parser.parse_args()
+
+    sentences = SENTENCES
+    if args.text_file:
+        with open(args.text_file, "r") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = []
+    for profile in args.profiles:
+        print(f"Benchmark profile {profile}...")
+        try:
+            result = benchmark(
+                args.tts_model,
+                profile,
+                args.speech_file,
+                sentences,
+                os.path.join(args.output_dir, profile),
+                args.threads,
+                args.batch_workers,
+            )
+        except Exception as e:
+            # 如 onnx 文件不存在、CPU 不支持等，跳过该配置
+            print(f"Profile {profile} failed: {e}")
+            continue
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+
+    print(f"{'profile':<12}{'load(s)':>10}{'rtf':>10}{'s/char':>10}{'similarity':>12}")
+    for result in results:
+        similarity = result["speaker_similarity"]
+        print(
+            f"{result['profile']:<12}{result['load_secs']:>10.1f}{result['rtf']:>10.3f}"
+            f"{result['secs_per_char']:>10.3f}{similarity if similarity is None else round(similarity, 3)!s:>12}"
+        )
+    for result in results:
+        if "batch" in result:
+            batch = result["batch"]
+            print(
+                f"{result['profile']}: batch max_diff={batch['max_diff']:.2e}, "
+                f"sequential {batch['sequential_secs']:.1f}s, batch {batch['batch_secs']:.1f}s, "
+                f"speedup {batch['speedup']:.2f}x"
+            )
+    with open(os.path.join(args.output_dir, "benchmark.json"), "w") as f:
+        json.dump(results, f, indent=4, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
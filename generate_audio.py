@@ -3,23 +3,38 @@ import logging
 import os
 import json
 
-from src.dialog import split_text
-from src.audio import gen_audio_desc, gen_audio, gen_speech, get_wav_secs
-from src.utils.chat_model import OpenAIChatModel
-from src.audio.tta import MakeAnAudioTTAModel, AudioGenTTAModel
-from src.audio.tts import CosyVoiceTTSModel
-
-def init_chat_model(model: str):
-    if "gpt" in model.lower():
-        return OpenAIChatModel(model_name=model.lower())
-    else:
-        raise NotImplementedError()
+from src.dialog import RoleRegistry, split_text, extract_dialog_stream, extract_role, gen_interval
+from src.audio import gen_audio_desc, gen_audio, gen_speech, gen_speech_stream, get_wav_secs
+from src.utils.chat_model import OpenAIChatModel, with_fixture
+from src.utils.cache import ResponseCache
+from src.utils.rate_limit import RetryPolicy
+from src.utils.model_pool import ModelPool
+from src.utils.file_cache import FileCache
+from src.audio.tta import MakeAnAudioTTAModel, AudioGenTTAModel, StubTTAModel, CachedTTAModel
+from src.audio.tts import CosyVoiceTTSModel, StubTTSModel, TTSWorkerPool
+from src.audio.tts.profiles import INFERENCE_PROFILES, get_profile
+
+def init_chat_model(model: str, cache_file: str = None, fixture_file: str = None, fixture_mode: str = "replay"):
+    def init_model():
+        cache = ResponseCache(cache_file) if cache_file else None
+        if "gpt" in model.lower():
+            return OpenAIChatModel(model_name=model.lower(), cache=cache, policy=RetryPolicy())
+        else:
+            raise NotImplementedError()
 
-def init_tts_model(tts_model: str):
+    return with_fixture(init_model, fixture_file, fixture_mode)
+
+def init_tts_model(tts_model: str, profile: str = "default", num_threads: int = None):
     if tts_model.lower() == 'cosyvoice':
         return CosyVoiceTTSModel(
-            model_dir=os.path.join("src", "audio", "lib", "CosyVoice", "pretrained_models", "CosyVoice2-0.5B")
+            model_dir=os.path.join("src", "audio", "lib", "CosyVoice", "pretrained_models", "CosyVoice2-0.5B"),
+            voice_bank_dir=os.path.join("results", "voice_bank"),
+            frontend_cache_file=os.path.join("results", "tts_frontend_cache.pkl"),
+            num_threads=num_threads,
+            **get_profile(profile),
         )
+    elif tts_model.lower() == 'stub':
+        return StubTTSModel()
     else:
         raise NotImplementedError()
 
@@ -28,85 +43,252 @@ def init_tta_model(tta_model: str):
         return MakeAnAudioTTAModel()
     elif tta_model.lower() == 'audiogen':
         return AudioGenTTAModel()
+    elif tta_model.lower() == 'stub':
+        return StubTTAModel()
     else:
         raise NotImplementedError()
 
+def stream_chunk(
+    text: str,
+    dialog_dir: str,
+    i: int,
+    output_dir: str,
+    chat_model,
+    tts_model,
+    role_timbre_map,
+    male_speech_map,
+    female_speech_map,
+    registry=None,
+    interval_mode="hybrid",
+    protect_top=2,
+):
+    """
+    流式提取对话，每解析出一句就开始配音，并写出 dialog/role/interval 文件
+    """
+    role_file = os.path.join(dialog_dir, f"role_{i}.json")
+    if os.path.exists(role_file):
+        roles = json.load(open(role_file))
+    else:
+        roles = extract_role(text, chat_model, registry)
+        with open(role_file, "w") as f:
+            json.dump(roles, f, indent=4, ensure_ascii=False)
+        if registry is not None:
+            registry.save()
+
+    dialogs, role_timbre_map = gen_speech_stream(
+        dialogs=extract_dialog_stream(text, chat_model),
+        roles=roles,
+        model=tts_model,
+        output_dir=output_dir,
+        role_timbre_map=role_timbre_map,
+        male_speech_map=male_speech_map,
+        female_speech_map=female_speech_map,
+        registry=registry,
+        protect_top=protect_top,
+    )
+    with open(os.path.join(dialog_dir, f"dialog_{i}.json"), "w") as f:
+        json.dump(dialogs, f, indent=4, ensure_ascii=False)
+
+    interval_file = os.path.join(dialog_dir, f"interval_{i}.json")
+    if not os.path.exists(interval_file):
+        intervals = gen_interval(dialogs, chat_model, mode=interval_mode)
+        with open(interval_file, "w") as f:
+            json.dump(intervals, f, indent=4, ensure_ascii=False)
+    return role_timbre_map
+
+def load_speech_maps(speech_source_dir: str):
+    male_speech_map = {}
+    female_speech_map = {}
+    for file in os.listdir(speech_source_dir):
+        if file.endswith(".wav"):
+            speech_key = file.split(".")[0]
+            speech_file = os.path.join(speech_source_dir, file)
+            if speech_key.startswith("male"):
+                male_speech_map[speech_key] = speech_file
+            elif speech_key.startswith("female"):
+                female_speech_map[speech_key] = speech_file
+    return male_speech_map, female_speech_map
+
+def list_chunks(text_file: str, chat_model, stream: bool = False):
+    """
+    列出一个文本的所有分块及其结果目录
+    """
+    text_file_name = os.path.basename(text_file).split(".")[0]
+
+    dialog_dir = os.path.join("results", "dialog", f"{text_file_name}")
+    if stream:
+        os.makedirs(dialog_dir, exist_ok=True)
+    assert os.path.exists(dialog_dir), f"Run process_text.py first"
+
+    speech_output_dir = os.path.join("results", "speech", text_file_name)
+    os.makedirs(speech_output_dir, exist_ok=True)
+
+    # 整本书的角色表，由 process_text.py 生成，没有时从各块的角色文件累积
+    registry = RoleRegistry(os.path.join(dialog_dir, "role_registry.json"))
+
+    chunks = []
+    for i, chunk_file in enumerate(split_text(text_file, chat_model)):
+        chunk_speech_output_dir = os.path.join(speech_output_dir, str(i))
+        os.makedirs(chunk_speech_output_dir, exist_ok=True)
+        chunks.append(
+            {
+                "name": f"{text_file_name}_{i}",
+                "index": i,
+                "chunk_file": chunk_file,
+                "dialog_dir": dialog_dir,
+                "output_dir": chunk_speech_output_dir,
+                "registry": registry,
+            }
+        )
+    return chunks
+
+def load_chunk_results(chunk):
+    dialog_dir, i = chunk["dialog_dir"], chunk["index"]
+    dialogs = json.load(open(os.path.join(dialog_dir, f"dialog_{i}.json")))
+    intervals = json.load(open(os.path.join(dialog_dir, f"interval_{i}.json")))
+    roles = json.load(open(os.path.join(dialog_dir, f"role_{i}.json")))
+    return dialogs, intervals, roles
+
 def main():
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
     logger.addHandler(logging.StreamHandler())
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--text_file", type=str, required=True)
+    parser.add_argument("--text_file", type=str, nargs="+", required=True, help="可以给出多个文本，模型只加载一次")
     parser.add_argument("--chat_model", type=str, required=True, default="gpt-4o")
     parser.add_argument("--tts_model", type=str, required=True, default="CosyVoice")
     parser.add_argument("--tta_model", type=str, required=True, default="Make-An-Audio")
     parser.add_argument("--speech_source_dir", type=str, default=os.path.join("data", "speech"))
     parser.add_argument("--role_timbre_file", type=str, default=os.path.join("results", "role_timbre.json"))
+    parser.add_argument("--protect_top", type=int, default=2, help="男女各自台词最多的前 N 个人物不会被回收音色")
+    parser.add_argument("--cache_file", type=str, default=os.path.join("results", "chat_cache.db"))
+    parser.add_argument("--no_cache", action="store_true")
+    parser.add_argument("--chat_fixture", type=str, default=None, help="对话录制文件，用于录制/回放")
+    parser.add_argument("--fixture_mode", type=str, default="replay", choices=["replay", "record", "auto"])
+    parser.add_argument("--stream", action="store_true", help="流式提取对话并同时配音，无需先运行 process_text.py")
+    parser.add_argument("--interval_mode", type=str, default="hybrid", choices=["llm", "local", "hybrid"])
+    parser.add_argument("--utterance_cache_dir", type=str, default=os.path.join("results", "utterance_cache"))
+    parser.add_argument("--utterance_cache_gb", type=float, default=10, help="语音缓存最多占用的空间")
+    parser.add_argument("--no_utterance_cache", action="store_true")
+    parser.add_argument("--tts_workers", type=int, default=0, help="多进程配音的进程数，0 表示在主进程中配音")
+    parser.add_argument("--tts_threads", type=int, default=None, help="每个配音进程的线程数，默认平分 CPU 核数")
+    parser.add_argument("--effect_library_dir", type=str, default=os.path.join("results", "effect_library"))
+    parser.add_argument(
+        "--effect_similarity",
+        type=float,
+        default=None,
+        help="音效描述相似度不低于此值时复用音效库中相近的音效，默认按文本嵌入取值（hash 为 0.85，CLAP 尚未校准，不做近似复用）",
+    )
+    parser.add_argument("--effect_library_gb", type=float, default=2, help="音效库最多占用的空间")
+    parser.add_argument("--no_effect_library", action="store_true")
+    parser.add_argument("--tts_profile", type=str, default="default", choices=list(INFERENCE_PROFILES), help="CosyVoice 推理配置，见 src/audio/tts/profiles.py")
     
     args = parser.parse_args()
-    text_file_name = os.path.basename(args.text_file).split(".")[0]
-
-    dialog_dir = os.path.join("results", "dialog", f"{text_file_name}")
-    assert os.path.exists(dialog_dir), f"Run process_text.py first"
 
     # 载入音源
-    male_speech_map = {}
-    female_speech_map = {}
-    
-    for file in os.listdir(args.speech_source_dir):
-        if file.endswith(".wav"):
-            speech_key = file.split(".")[0]
-            speech_file = os.path.join(args.speech_source_dir, file)
-            if speech_key.startswith("male"):
-                male_speech_map[speech_key] = speech_file
-            elif speech_key.startswith("female"):
-                female_speech_map[speech_key] = speech_file
+    male_speech_map, female_speech_map = load_speech_maps(args.speech_source_dir)
 
-    # 载入角色配音表（如果有的话）
+    # 载入音色分配状态（如果有的话），兼容旧版的人物到音色的映射
     if os.path.exists(args.role_timbre_file):
         role_timbre_map = json.load(open(args.role_timbre_file))
     else:
         role_timbre_map = {}
 
-    speech_output_dir = os.path.join("results", "speech", text_file_name)
     os.makedirs(os.path.join("results", "speech"), exist_ok=True)
-    os.makedirs(speech_output_dir, exist_ok=True)
 
-    for i in range(len(split_text(args.text_file))):
-        dialog_file = os.path.join(dialog_dir, f"dialog_{i}.json")
-        dialogs = json.load(open(dialog_file))
-        
-        interval_file = os.path.join(dialog_dir, f"interval_{i}.json")
-        intervals = json.load(open(interval_file))
+    # 每个模型在整个进程中只加载一次，按阶段处理所有文本的所有分块，阶段结束时释放
+    pool = ModelPool()
+    chat_model = pool.get(
+        "chat",
+        init_chat_model,
+        args.chat_model,
+        None if args.no_cache else args.cache_file,
+        args.chat_fixture,
+        args.fixture_mode,
+    )
 
-        role_file = os.path.join(dialog_dir, f"role_{i}.json")
-        roles = json.load(open(role_file))
+    chunks = []
+    for text_file in args.text_file:
+        chunks += list_chunks(text_file, chat_model, args.stream)
+
+    utterance_cache = None
+    if not args.no_utterance_cache:
+        utterance_cache = FileCache(args.utterance_cache_dir, int(args.utterance_cache_gb * 1024**3))
+
+    # 阶段一：配音
+    if args.tts_workers > 0:
+        tts_model = pool.get(
+            "tts",
+            TTSWorkerPool,
+            init_tts_model,
+            (args.tts_model, args.tts_profile),
+            args.tts_workers,
+            args.tts_threads,
+        )
+    else:
+        tts_model = pool.get("tts", init_tts_model, args.tts_model, args.tts_profile, args.tts_threads)
+    # 音色特征有缓存时直接载入，新音色一次性提取
+    for speech_key, speech_file in (male_speech_map | female_speech_map).items():
+        tts_model.register(speech_key, speech_file)
+    tts_model.prepare_voices()
+
+    for chunk in chunks:
+        dialog_file = os.path.join(chunk["dialog_dir"], f"dialog_{chunk['index']}.json")
+        if args.stream and not os.path.exists(dialog_file):
+            logger.info(f"Streaming dialogs and speech from {chunk['chunk_file']}")
+            with open(chunk["chunk_file"], "r") as f:
+                text = f.read()
+            role_timbre_map = stream_chunk(
+                text,
+                chunk["dialog_dir"],
+                chunk["index"],
+                chunk["output_dir"],
+                chat_model,
+                tts_model,
+                role_timbre_map,
+                male_speech_map,
+                female_speech_map,
+                chunk["registry"],
+                args.interval_mode,
+                args.protect_top,
+            )
 
-        logger.info(f"Load {len(dialogs)} dialogs, {len(roles)} roles from {text_file_name}_{i}")
+        dialogs, intervals, roles = load_chunk_results(chunk)
+        logger.info(f"Load {len(dialogs)} dialogs, {len(roles)} roles from {chunk['name']}")
 
         logger.info("Generating speech...")
-        chunk_speech_output_dir = os.path.join(speech_output_dir, str(i))
-        os.makedirs(chunk_speech_output_dir, exist_ok=True)
         role_timbre_map = gen_speech(
             dialogs=dialogs,
             roles=roles,
             intervals=intervals,
-            model=init_tts_model(args.tts_model),
-            output_dir=chunk_speech_output_dir,
+            model=tts_model,
+            output_dir=chunk["output_dir"],
             role_timbre_map=role_timbre_map,
             male_speech_map=male_speech_map,
             female_speech_map=female_speech_map,
+            registry=chunk["registry"],
+            utterance_cache=utterance_cache,
+            protect_top=args.protect_top,
         )
-        speech_output_file = os.path.join(chunk_speech_output_dir, f"speech.wav")
+        speech_output_file = os.path.join(chunk["output_dir"], f"speech.wav")
         logger.info(f"Generating {get_wav_secs(speech_output_file)}s speech")
 
         with open(args.role_timbre_file, "w") as f:
             json.dump(role_timbre_map, f, indent=4, ensure_ascii=False)
 
-        logger.info("Generating audio description...")
-        
-        chunk_audio_output_dir = chunk_speech_output_dir
+    del tts_model
+    pool.release("tts")
+    if utterance_cache is not None:
+        logger.info(f"Utterance cache: {utterance_cache.stats()}")
+
+    # 阶段二：音效描述，依赖配音的时长
+    chunk_audio_descs = []
+    for chunk in chunks:
+        dialogs, intervals, _ = load_chunk_results(chunk)
+        logger.info(f"Generating audio description for {chunk['name']}...")
+
+        chunk_audio_output_dir = chunk["output_dir"]
         audio_desc_file = os.path.join(chunk_audio_output_dir, "audio_desc.json")
         if os.path.exists(audio_desc_file):
             logger.info(f"Already exists: {audio_desc_file}")
@@ -116,23 +298,38 @@ def main():
             audio_descs = gen_audio_desc(
                 dialogs=dialogs,
                 intervals=intervals,
-                speech_source_dir=chunk_speech_output_dir,
-                model=init_chat_model(args.chat_model),
+                speech_source_dir=chunk_audio_output_dir,
+                model=chat_model,
             )
             with open(audio_desc_file, "w") as f:
                 json.dump(audio_descs, f, indent=4, ensure_ascii=False)
             logger.info(f"Generate {len(audio_descs)} audio description")
             logger.info(f"Save audio description to {audio_desc_file}")
+        chunk_audio_descs.append(audio_descs)
 
-        logger.info("Generating audio...")
+    # 阶段三：音效
+    tta_model = pool.get("tta", init_tta_model, args.tta_model)
+    if not args.no_effect_library:
+        tta_model = CachedTTAModel(
+            tta_model,
+            args.effect_library_dir,
+            args.effect_similarity,
+            int(args.effect_library_gb * 1024**3),
+        )
+    for chunk, audio_descs in zip(chunks, chunk_audio_descs):
+        logger.info(f"Generating audio for {chunk['name']}...")
         gen_audio(
             audio_descs=audio_descs,
-            output_dir=chunk_audio_output_dir,
-            model=init_tta_model(args.tta_model),
+            output_dir=chunk["output_dir"],
+            model=tta_model,
         )
-        audio_output_file = os.path.join(chunk_audio_output_dir, "audio.wav")
+        audio_output_file = os.path.join(chunk["output_dir"], "audio.wav")
         logger.info(f"Generating {get_wav_secs(audio_output_file)}s audio")
 
+    del tta_model
+    pool.release()
+    logger.info(f"Model load time: {pool.load_secs}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,31 +1,277 @@
 import argparse
+import asyncio
+import copy
 import os
 import json
 from tqdm import tqdm
 
-from src.dialog import split_text, extract_dialog, extract_role, gen_interval
+from src.dialog import (
+    RoleRegistry,
+    split_text,
+    extract_all_async,
+    extract_dialog_async,
+    extract_role_async,
+    gen_interval_async,
+    merge_roles,
+)
 
-from src.utils.chat_model import OpenAIChatModel
+from src.utils.chat_model import (
+    OpenAIChatModel,
+    AsyncOpenAIChatModel,
+    AsyncChatModel,
+    with_fixture,
+)
+from src.utils.cache import ResponseCache
+from src.utils.rate_limit import RetryPolicy
+from src.utils.tokenizer import Tokenizer
 import logging
 
-def init_chat_model(model: str):
+logger = logging.getLogger(__name__)
+
+def init_chat_model(model: str, cache: ResponseCache = None, policy: RetryPolicy = None):
+    if "gpt" in model.lower():
+        return OpenAIChatModel(model_name=model.lower(), cache=cache, policy=policy)
+    else:
+        raise NotImplementedError()
+
+def init_async_chat_model(
+    model: str,
+    cache: ResponseCache = None,
+    max_concurrency: int = 8,
+    policy: RetryPolicy = None,
+):
     if "gpt" in model.lower():
-        return OpenAIChatModel(model_name=model.lower())
+        return AsyncOpenAIChatModel(
+            model_name=model.lower(),
+            cache=cache,
+            max_concurrency=max_concurrency,
+            policy=policy,
+        )
     else:
         raise NotImplementedError()
 
+async def load_or_generate(output_file: str, generate, desc: str):
+    if os.path.exists(output_file):
+        logger.info(f"Already exists: {output_file}")
+        with open(output_file, "r") as f:
+            return json.load(f)
+    result = await generate()
+    with open(output_file, "w") as f:
+        json.dump(result, f, indent=4, ensure_ascii=False)
+    logger.info(f"{desc} {len(result)} items, save to {output_file}")
+    return result
+
+class RegistryWindows:
+    """
+    按窗口共享整本书的角色表：同一窗口内的分块并发提取角色，提示词都带上前面窗口结束时的角色表快照，
+    各块的增量再按分块顺序合并，结果与请求完成的先后无关
+    Args:
+        registry (RoleRegistry): 角色表
+        num_chunks (int): 分块数
+        window (int): 每个窗口的分块数，1 时逐块提取
+    """
+
+    def __init__(self, registry: RoleRegistry, num_chunks: int, window: int = 8):
+        self.registry = registry
+        self.window = max(1, window)
+        self.merged = [asyncio.Event() for _ in range(num_chunks)]
+        # 窗口序号 -> 该窗口提示词使用的角色表
+        self.snapshots = {0: copy.deepcopy(registry)}
+
+    async def snapshot(self, i: int):
+        w = i // self.window
+        if w > 0:
+            await self.merged[w * self.window - 1].wait()
+        return self.snapshots[w]
+
+    async def wait_previous(self, i: int):
+        if i > 0:
+            await self.merged[i - 1].wait()
+
+    def finish(self, i: int):
+        # 窗口的最后一块合并后，下一个窗口才能取快照；出错时也要放行后面的分块
+        if (i + 1) % self.window == 0:
+            self.snapshots[(i + 1) // self.window] = copy.deepcopy(self.registry)
+        self.merged[i].set()
+
+
+async def load_or_extract_roles(
+    role_output_file: str,
+    text: str,
+    model: AsyncChatModel,
+    windows: RegistryWindows,
+    i: int,
+    desc: str,
+):
+    try:
+        delta = None
+        if os.path.exists(role_output_file):
+            logger.info(f"Already exists: {role_output_file}")
+            with open(role_output_file, "r") as f:
+                roles = json.load(f)
+        else:
+            snapshot = await windows.snapshot(i)
+            delta = await extract_role_async(text, model, snapshot, merge=False)
+        await windows.wait_previous(i)
+        registry = windows.registry
+        if delta is None:
+            # 续跑时已有的角色文件也合并进角色表
+            registry.update(roles)
+        else:
+            roles = merge_roles(delta, text, registry)
+            with open(role_output_file, "w") as f:
+                json.dump(roles, f, indent=4, ensure_ascii=False)
+            logger.info(f"{desc} {len(roles)} items, save to {role_output_file}")
+        registry.save()
+        return roles
+    finally:
+        windows.finish(i)
+
+async def process_chunk(
+    i: int,
+    chunk_file: str,
+    text_result_dir: str,
+    model: AsyncChatModel,
+    mode: str = "separate",
+    windows: RegistryWindows = None,
+    interval_mode: str = "hybrid",
+):
+    with open(chunk_file, "r") as f:
+        text = f.read()
+
+    dialog_output_file = os.path.join(text_result_dir, f"dialog_{i}.json")
+    role_output_file = os.path.join(text_result_dir, f"role_{i}.json")
+    interval_output_file = os.path.join(text_result_dir, f"interval_{i}.json")
+
+    # 一次请求同时生成三个文件，已有对话文件时间隔需要与之对应，退回逐个生成
+    if mode == "combined" and not os.path.exists(dialog_output_file):
+        dialogs, roles, intervals = await extract_all_async(text, model)
+        outputs = [(dialog_output_file, dialogs), (interval_output_file, intervals)]
+        if not os.path.exists(role_output_file):
+            outputs.append((role_output_file, roles))
+        for output_file, result in outputs:
+            with open(output_file, "w") as f:
+                json.dump(result, f, indent=4, ensure_ascii=False)
+        logger.info(
+            f"Extract {len(dialogs)} dialogs, {len(roles)} roles from {chunk_file} in one call"
+        )
+
+    if windows is not None:
+        extract_roles = load_or_extract_roles(
+            role_output_file,
+            text,
+            model,
+            windows,
+            i,
+            f"Extract roles from {chunk_file}:",
+        )
+    else:
+        extract_roles = load_or_generate(
+            role_output_file,
+            lambda: extract_role_async(text, model),
+            f"Extract roles from {chunk_file}:",
+        )
+
+    async def extract_dialogs_and_intervals():
+        dialogs = await load_or_generate(
+            dialog_output_file,
+            lambda: extract_dialog_async(text, model),
+            f"Extract dialogs from {chunk_file}:",
+        )
+        # 间隔只依赖本段的对话，不等角色提取
+        intervals = await load_or_generate(
+            interval_output_file,
+            lambda: gen_interval_async(dialogs, model, mode=interval_mode),
+            f"Generate intervals from {chunk_file}:",
+        )
+        return dialogs, intervals
+
+    # 对话和角色互不依赖，同时提取
+    (dialogs, intervals), roles = await asyncio.gather(
+        extract_dialogs_and_intervals(), extract_roles
+    )
+    return dialogs, roles, intervals
+
+async def process_chunks(
+    chunk_files,
+    text_result_dir: str,
+    model: AsyncChatModel,
+    mode: str = "separate",
+    registry: RoleRegistry = None,
+    interval_mode: str = "hybrid",
+    registry_window: int = 8,
+):
+    # 所有分块同时提交，并发数由模型的信号量限制
+    windows = None
+    if registry is not None:
+        windows = RegistryWindows(registry, len(chunk_files), registry_window)
+    tasks = [
+        process_chunk(
+            i,
+            chunk_file,
+            text_result_dir,
+            model,
+            mode,
+            windows,
+            interval_mode,
+        )
+        for i, chunk_file in enumerate(chunk_files)
+    ]
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+        await task
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--text_file", type=str, required=True)
     parser.add_argument("--model", type=str, default="gpt-4o")
+    parser.add_argument("--cache_file", type=str, default=os.path.join("results", "chat_cache.db"))
+    parser.add_argument("--no_cache", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=None, help="每分钟请求数限制")
+    parser.add_argument("--tpm", type=float, default=None, help="每分钟 token 数限制")
+    parser.add_argument("--max_retries", type=int, default=6)
+    parser.add_argument("--timeout", type=float, default=600, help="单次请求超时秒数")
+    parser.add_argument("--chat_fixture", type=str, default=None, help="对话录制文件，用于录制/回放")
+    parser.add_argument("--fixture_mode", type=str, default="replay", choices=["replay", "record", "auto"])
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="separate",
+        choices=["separate", "combined"],
+        help="combined: 一次请求同时提取对话、角色和间隔",
+    )
+    parser.add_argument(
+        "--interval_mode",
+        type=str,
+        default="hybrid",
+        choices=["llm", "local", "hybrid"],
+        help="local: 按规则生成对话间隔; hybrid: 只把规则无法确定的句子交给大模型",
+    )
+    parser.add_argument("--no_role_registry", action="store_true", help="每块独立提取全部角色，不使用整本书的角色表")
+    parser.add_argument(
+        "--registry_window",
+        type=int,
+        default=8,
+        help="同时提取角色的分块数，窗口内的分块共用前面窗口累积的角色表，1 时逐块提取",
+    )
+    parser.add_argument("--split_method", type=str, default="local", choices=["local", "llm"])
+    parser.add_argument("--split_refine", action="store_true", help="本地切分后用大模型微调切分点")
+    parser.add_argument("--max_input_tokens", type=int, default=6000, help="每块文本最多的输入 token 数")
+    parser.add_argument("--max_output_tokens", type=int, default=12000, help="每块预计最多的输出 token 数")
 
     args = parser.parse_args()
 
-    logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
     logger.addHandler(logging.StreamHandler())
 
-    model = init_chat_model(args.model)
+    cache = None if args.no_cache else ResponseCache(args.cache_file)
+    # 同步和异步模型共用一个策略，限流额度不会重复计算
+    policy = RetryPolicy(
+        max_retries=args.max_retries, timeout=args.timeout, rpm=args.rpm, tpm=args.tpm
+    )
+    model = with_fixture(
+        lambda: init_chat_model(args.model, cache, policy), args.chat_fixture, args.fixture_mode
+    )
 
     text_file_name = os.path.basename(args.text_file).split(".")[0]
 
@@ -34,46 +280,40 @@ def main():
     os.makedirs(os.path.join("results", "dialog"), exist_ok=True)
     os.makedirs(text_result_dir, exist_ok=True)
 
-    chunk_files = split_text(args.text_file, model)
-    for i, chunk_file in enumerate(tqdm(chunk_files)):
-        with open(chunk_file, "r") as f:
-            text = f.read()
-
-        # extrac dialog
-        dialog_output_file = os.path.join(text_result_dir, f"dialog_{i}.json")
-        if os.path.exists(dialog_output_file):
-            logger.info(f"Already exists: {dialog_output_file}")
-        else:
-            dialogs = extract_dialog(text, model)
-            os.makedirs(os.path.join("results", "dialog"), exist_ok=True)
-            with open(dialog_output_file, "w") as f:
-                json.dump(dialogs, f, indent=4, ensure_ascii=False)
-            logger.info(f"Extract {len(dialogs)} dialogs from {chunk_file}")
-            logger.info(f"Save dialogs to {dialog_output_file}")
-
-        # extract roles
-        role_output_file = os.path.join(text_result_dir, f"role_{i}.json")
-        if os.path.exists(role_output_file):
-            logger.info(f"Already exists: {role_output_file}")
-        else:
-            roles = extract_role(text, model)
-            with open(role_output_file, "w") as f:
-                json.dump(roles, f, indent=4, ensure_ascii=False)
-            logger.info(f"Extract {len(roles)} roles from {chunk_file}")
-            logger.info(f"Save roles to {role_output_file}")
+    chunk_files = split_text(
+        args.text_file,
+        model,
+        max_input_tokens=args.max_input_tokens,
+        max_output_tokens=args.max_output_tokens,
+        method=args.split_method,
+        refine=args.split_refine,
+        max_workers=args.concurrency,
+        tokenizer=Tokenizer(args.model),
+    )
 
-        # generate intervals
-        interval_output_file = os.path.join(
-            text_result_dir, f"interval_{i}.json"
+    async_model = with_fixture(
+        lambda: init_async_chat_model(args.model, cache, args.concurrency, policy),
+        args.chat_fixture,
+        args.fixture_mode,
+        is_async=True,
+    )
+    registry = None
+    if not args.no_role_registry:
+        registry = RoleRegistry(os.path.join(text_result_dir, "role_registry.json"))
+    asyncio.run(
+        process_chunks(
+            chunk_files,
+            text_result_dir,
+            async_model,
+            args.mode,
+            registry,
+            args.interval_mode,
+            args.registry_window,
         )
-        if os.path.exists(interval_output_file):
-            logger.info(f"Already exists: {interval_output_file}")
-        else:
-            intervals = gen_interval(dialogs, model)
-            with open(interval_output_file, "w") as f:
-                json.dump(intervals, f, indent=4, ensure_ascii=False)
-            logger.info(f"Generate {len(intervals)} intervals from {chunk_file}")
-            logger.info(f"Save intervals to {interval_output_file}")
+    )
+
+    if cache is not None:
+        logger.info(f"Chat cache: {cache.stats()}")
 
 
 if __name__ == "__main__":
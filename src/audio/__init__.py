@@ -1,6 +1,17 @@
 import os, sys
+from ..utils.lazy import lazy_exports
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib", "CosyVoice"))
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib", "CosyVoice", "third_party", "Matcha-TTS"))
 
-from .audio import gen_audio_desc, gen_audio, get_wav_secs
-from .speech import gen_speech
+# 按需导入：只用到 wav 读写、桩模型等模块时不必载入 torch 和 CosyVoice
+_EXPORTS = {
+    "gen_audio_desc": ".audio",
+    "gen_audio": ".audio",
+    "get_wav_secs": ".audio",
+    "gen_speech": ".speech",
+    "gen_speech_stream": ".speech",
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
@@ -1,6 +1,5 @@
 from typing import Dict, List
 import os, json
-from tqdm import tqdm
 
 from ..utils.ffmpeg import create_silence, concat, cut
 from ..utils.chat_model import ChatModel
@@ -61,17 +60,18 @@ def gen_audio_desc(
 
 
 def gen_audio(audio_descs: List[Dict], output_dir: str, model: TTAModel):
-    for i, audio in enumerate(tqdm(audio_descs)):
-        desc = audio["audio_desc"]
-        duration = min(audio["end"] - audio["start"], 300)
+    # 整个分块的音效一次提交，由模型按时长分组批量生成
+    descs, durations, output_paths = [], [], []
+    for i, audio in enumerate(audio_descs):
         output_path = os.path.join(output_dir, f"audio_{i}.wav")
         if os.path.exists(output_path):
             continue
-        model.generate(
-            desc,
-            duration,
-            output_path,
-        )
+        descs.append(audio["audio_desc"])
+        durations.append(min(audio["end"] - audio["start"], 300))
+        output_paths.append(output_path)
+    if descs:
+        print(f"Generating {len(descs)} audio effects")
+        model.generate_batch(descs, durations, output_paths)
 
     audio_files = []
 
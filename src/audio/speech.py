@@ -1,13 +1,16 @@
-from typing import Dict, List
-import os, copy
+from typing import Dict, Iterable, List
+import os, copy, re
 from tqdm import tqdm
-import shutil
-import subprocess
 
 from ..utils.alloc import LRUAllocator
 from ..utils.ffmpeg import concat, create_silence
+from ..utils.file_cache import FileCache, Manifest
+from ..dialog.registry import RoleRegistry, NARRATOR
 from .tts import TTSModel
 
+# 心理活动（os）的效果，见 src.utils.effects.PRESETS
+OS_EFFECTS = ["os"]
+
 
 def gen_speech(
     dialogs: List[Dict],
@@ -15,9 +18,12 @@ def gen_speech(
     intervals: List[Dict],
     model: TTSModel,
     output_dir: str,
-    role_timbre_map: Dict = {},
-    male_speech_map: Dict = {},
-    female_speech_map: Dict = {},
+    role_timbre_map: Dict = None,
+    male_speech_map: Dict = None,
+    female_speech_map: Dict = None,
+    registry: RoleRegistry = None,
+    utterance_cache: FileCache = None,
+    protect_top: int = 2,
 ):
     """
     生成人物对话配音
@@ -26,39 +32,239 @@ def gen_speech(
         roles (List[Dict]): 人物列表
         intervals (List[Dict]): 对话之间的时间间隔
         model (TTSModel): 语音合成模型
-        role_timbre_map (Dict): 人物到音色的映射
+        role_timbre_map (Dict): 音色分配状态（gen_speech 的返回值），也可以是旧版的人物到音色的映射
         male_speech_map (Dict): 男音色到音频文件映射（wav格式）
         female_speech_map (Dict): 女音色到音频文件映射（wav格式）
+        registry (RoleRegistry): 整本书的角色表，给出时按角色表查找说话人，称谓和前缀相同的说话人使用同一音色
+        utterance_cache (FileCache): 语音缓存，按文本、指令、音源和模型版本寻址，
+            给出时已有文件与当前对话不一致会重新生成，相同的句子直接复用
+        protect_top (int): 男女音色各自台词最多的前 N 个人物不会被回收音色
     Returns:
-        role_timbre_map (Dict): 更新的人物到音色的映射
+        role_timbre_map (Dict): 更新的音色分配状态，{"male": ..., "female": ...}，
+            包含人物到音色的映射、使用顺序和台词数，可以 json 序列化，供下一分块继续使用
     """
+    male_speech_map = male_speech_map or {}
+    female_speech_map = female_speech_map or {}
+    role_dic = _build_role_dic(roles, registry)
+    for dialog in dialogs:
+        _assign_role(dialog, role_dic)
+
+    # 注册音色对应的音源文件
+    for timbre_key, speech_file in (male_speech_map | female_speech_map).items():
+        model.register(timbre_key, speech_file)
+
+    # 从给定的音色表（含使用顺序）恢复 LRU 分配器
+    male_timbre_allocator, female_timbre_allocator = _load_allocators(
+        role_timbre_map, role_dic, male_speech_map, female_speech_map, protect_top
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    speech_files = male_speech_map | female_speech_map
+    manifest = Manifest(output_dir) if utterance_cache is not None else None
+
+    # 按对话顺序分配音色，再整体交给模型批量合成
+    requests = []
+    cache_keys = {}
+    for idx, dialog in enumerate(dialogs):
+        request = _tts_request(
+            idx,
+            dialog,
+            output_dir,
+            male_timbre_allocator,
+            female_timbre_allocator,
+            skip_existing=utterance_cache is None,
+        )
+        if request is None:
+            continue
+        is_os = dialog["role"].endswith("(os)")
+        if utterance_cache is not None:
+            key = utterance_cache.make_key(
+                request["tts_text"],
+                request["instruct_text"],
+                is_os,
+                model.version,
+                files=[speech_files[request["speech_key"]]],
+            )
+            if _reuse_speech(request["output_path"], key, utterance_cache, manifest):
+                continue
+            cache_keys[request["output_path"]] = key
+        if is_os:
+            # 心理活动在合成时直接加效果，只写一次文件
+            request["effects"] = OS_EFFECTS
+        requests.append(request)
+
+    if utterance_cache is not None:
+        # 合成前先记录待生成文件的缓存键，中断后留下的文件不会被当作旧版本的文件
+        for output_file, key in cache_keys.items():
+            manifest.set(os.path.basename(output_file), key)
+        manifest.save()
+
+    if requests:
+        model.generate_batch(requests)
+
+    if utterance_cache is not None:
+        # 缓存最终（处理过 os 的）文件
+        for output_file, key in cache_keys.items():
+            utterance_cache.put(key, output_file)
+        utterance_cache.evict()
+
+    concat_speech(dialogs, intervals, output_dir)
+
+    return _dump_allocators(male_timbre_allocator, female_timbre_allocator)
+
+
+def gen_speech_stream(
+    dialogs: Iterable[Dict],
+    roles: List[Dict],
+    model: TTSModel,
+    output_dir: str,
+    role_timbre_map: Dict = None,
+    male_speech_map: Dict = None,
+    female_speech_map: Dict = None,
+    registry: RoleRegistry = None,
+    protect_top: int = 2,
+):
+    """
+    边接收对话边生成配音，用于对接流式提取的对话，不做合并
+    Args:
+        dialogs (Iterable[Dict]): 对话迭代器，如 extract_dialog_stream 的返回值
+        其余参数同 gen_speech
+    Returns:
+        dialogs (List[Dict]): 接收到的全部对话
+        role_timbre_map (Dict): 更新的音色分配状态
+    """
+    male_speech_map = male_speech_map or {}
+    female_speech_map = female_speech_map or {}
+    role_dic = _build_role_dic(roles, registry)
+
+    for timbre_key, speech_file in (male_speech_map | female_speech_map).items():
+        model.register(timbre_key, speech_file)
+
+    male_timbre_allocator, female_timbre_allocator = _load_allocators(
+        role_timbre_map, role_dic, male_speech_map, female_speech_map, protect_top
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    received = []
+    ttfas = []
+    for idx, dialog in enumerate(tqdm(dialogs)):
+        received.append(copy.deepcopy(dialog))
+        _assign_role(dialog, role_dic)
+        metrics = _synthesize(
+            idx,
+            dialog,
+            model,
+            output_dir,
+            male_timbre_allocator,
+            female_timbre_allocator,
+        )
+        if metrics is not None and metrics["ttfa"] is not None:
+            ttfas.append(metrics["ttfa"])
+
+    if ttfas:
+        print(f"Time to first audio: avg {sum(ttfas) / len(ttfas):.2f}s, max {max(ttfas):.2f}s")
+    return received, _dump_allocators(male_timbre_allocator, female_timbre_allocator)
+
+
+def concat_speech(dialogs: List[Dict], intervals: List[Dict], output_dir: str):
+    """
+    按对话顺序合并配音，并在对话之间插入静音
+    """
+    audio_files = []
+    for idx, dialog in enumerate(dialogs):
+        tts_key = f"{dialog['role']}_{idx}"
+        audio_file = os.path.join(output_dir, f"{tts_key}.wav")
+        audio_files.append(audio_file)
+
+        interval = intervals[idx]["interval"]
+        if interval:
+            silence_file = os.path.join(output_dir, f"silence_{interval}.wav")
+            create_silence(interval, silence_file)
+            audio_files.append(silence_file)
+    concat(audio_files, os.path.join(output_dir, f"speech.wav"))
+
+
+def _build_role_dic(roles: List[Dict], registry: RoleRegistry = None):
+    if registry is not None:
+        # 兼容没有角色表时生成的角色文件，合并是幂等的
+        registry.update(roles)
+        return registry
     role_dic = {}
     for role in roles:
         role_dic[role["name"]] = role
         for name in role["alias"]:
             role_dic[name] = role
     # 固定旁白
-    role_dic["旁白"] = {"name": "旁白", "gender": "男", "personality": "冷静客观平淡", "alias": []}
+    role_dic["旁白"] = NARRATOR
+    return role_dic
 
-    for dialog in dialogs:
-        if dialog["instruct"] is None:
-            dialog["instruct"] = ""
 
-        role_name = _get_role_name(dialog)
+def _assign_role(dialog: Dict, role_dic: Dict):
+    if dialog["instruct"] is None:
+        dialog["instruct"] = ""
 
-        if role_name not in role_dic:
-            print(f"unknown role: {dialog['role']}")
-            dialog["personality"] = None
-            dialog["gender"] = "男"
-            continue
-        role = role_dic[role_name]
-        dialog["personality"] = role["personality"]
-        dialog["gender"] = role["gender"]
+    role_name = _get_role_name(dialog)
+
+    if role_name not in role_dic:
+        print(f"unknown role: {dialog['role']}")
+        dialog["name"] = role_name
+        dialog["personality"] = None
+        dialog["gender"] = "男"
+        return
+    role = role_dic[role_name]
+    # 统一用角色名分配音色，称谓和角色名使用同一音色
+    dialog["name"] = role["name"]
+    dialog["personality"] = role["personality"]
+    dialog["gender"] = role["gender"]
+
+
+def _load_allocators(
+    role_timbre_map: Dict,
+    role_dic: Dict,
+    male_speech_map: Dict,
+    female_speech_map: Dict,
+    protect_top: int = 0,
+):
+    role_timbre_map = role_timbre_map or {}
+    male_candidates = list(male_speech_map.keys())
+    female_candidates = list(female_speech_map.keys())
+    if _is_allocator_state(role_timbre_map):
+        return (
+            LRUAllocator.from_dict(male_candidates, role_timbre_map["male"], protect_top),
+            LRUAllocator.from_dict(female_candidates, role_timbre_map["female"], protect_top),
+        )
+    # 旧版的人物到音色的映射，没有使用顺序
+    male_timbre_map, female_timbre_map = _split_timbre_map(
+        role_timbre_map, role_dic, male_speech_map, female_speech_map
+    )
+    return (
+        LRUAllocator(male_candidates, male_timbre_map, protect_top),
+        LRUAllocator(female_candidates, female_timbre_map, protect_top),
+    )
 
-    # 注册音色对应的音源文件
-    for timbre_key, speech_file in (male_speech_map | female_speech_map).items():
-        model.register(timbre_key, speech_file)
 
+def _dump_allocators(male_timbre_allocator: LRUAllocator, female_timbre_allocator: LRUAllocator):
+    return {
+        "male": male_timbre_allocator.to_dict(),
+        "female": female_timbre_allocator.to_dict(),
+    }
+
+
+def _is_allocator_state(role_timbre_map: Dict):
+    return all(
+        isinstance(role_timbre_map.get(gender), dict) and "allocated" in role_timbre_map[gender]
+        for gender in ("male", "female")
+    )
+
+
+def _split_timbre_map(
+    role_timbre_map: Dict,
+    role_dic: Dict,
+    male_speech_map: Dict,
+    female_speech_map: Dict,
+):
     male_timbre_map = {}
     female_timbre_map = {}
     for k, v in role_timbre_map.items():
@@ -74,86 +280,111 @@ def gen_speech(
                     female_timbre_map[alias] = v
         else:
             raise ValueError(f"Speech file {v} not found in male or female speech map")
+    return male_timbre_map, female_timbre_map
 
-    # 从给定的音色表基础上初始化 LRU 分配器
-    male_timbre_allocator = LRUAllocator(
-        candidates=list(male_speech_map.keys()),
-        allocated=male_timbre_map,
-    )
-    female_timbre_allocator = LRUAllocator(
-        candidates=list(female_speech_map.keys()),
-        allocated=female_timbre_map,
+
+def _synthesize(
+    idx: int,
+    dialog: Dict,
+    model: TTSModel,
+    output_dir: str,
+    male_timbre_allocator: LRUAllocator,
+    female_timbre_allocator: LRUAllocator,
+):
+    request = _tts_request(
+        idx,
+        dialog,
+        output_dir,
+        male_timbre_allocator,
+        female_timbre_allocator,
     )
+    if request is None:
+        return None
 
-    os.makedirs(output_dir, exist_ok=True)
+    if dialog["role"].endswith("(os)"):
+        # 效果在写出完整文件前应用，中断时不会留下未处理的文件
+        request["effects"] = OS_EFFECTS
+    # 流式生成，边生成边写文件
+    return model.generate_stream(**request)
 
-    for idx, dialog in enumerate(tqdm(dialogs)):
-        tts_key = f"{dialog['role']}_{idx}"
-        output_file = os.path.join(output_dir, f"{tts_key}.wav")
-        if os.path.exists(output_file):
-            continue
-        import re
-        tags = [
-            "[breath]",
-            "[noise]",
-            "[laughter]",
-            "[cough]",
-            "[clucking]",
-            "[accent]",
-            "[quick_breath]",
-            "[hissing]",
-            "[sigh]",
-            "[vocalized-noise",
-            "[lipsmack]",
-            "[mn]",
-            "<strong>", "</strong>"
-            "<laughter>", "</laughter>"
-        ]
-        def is_valid_tag(match):
-            return match.group(0) in tags
-
-        pattern = re.compile(r"\[[^\]]*\]|<[^>]*>")
-
-        # 删除不合法标签
-        tts_text = dialog["content"]
-        tts_text = pattern.sub(
-            lambda match: match.group(0) if is_valid_tag(match) else "", tts_text
-        )
-        instruct_text = _get_instruct_text(dialog)
 
-        role_name = _get_role_name(dialog)
+def _tts_request(
+    idx: int,
+    dialog: Dict,
+    output_dir: str,
+    male_timbre_allocator: LRUAllocator,
+    female_timbre_allocator: LRUAllocator,
+    skip_existing: bool = True,
+):
+    """
+    分配音色并生成 generate 的参数，skip_existing 时已生成过的对话返回 None
+    """
+    tts_key = f"{dialog['role']}_{idx}"
+    output_file = os.path.join(output_dir, f"{tts_key}.wav")
+    if skip_existing and os.path.exists(output_file):
+        return None
 
-        # 分配音色
-        if dialog["gender"] == "女":
-            speech_key = female_timbre_allocator.get(role_name)
-        else:
-            speech_key = male_timbre_allocator.get(role_name)
+    role_name = dialog["name"]
 
-        model.generate(
-            tts_text,
-            instruct_text,
-            speech_key,
-            output_file,
-        )
+    # 分配音色
+    if dialog["gender"] == "女":
+        speech_key = female_timbre_allocator.get(role_name)
+    else:
+        speech_key = male_timbre_allocator.get(role_name)
 
-        if dialog["role"].endswith("(os)"):
-            _transform_os(output_file)
+    return {
+        "tts_text": _clean_tts_text(dialog["content"]),
+        "instruct_text": _get_instruct_text(dialog),
+        "speech_key": speech_key,
+        "output_path": output_file,
+    }
 
-    # 合并
-    audio_files = []
-    for idx, dialog in enumerate(dialogs):
-        tts_key = f"{dialog['role']}_{idx}"
-        audio_file = os.path.join(output_dir, f"{tts_key}.wav")
-        audio_files.append(audio_file)
 
-        interval = intervals[idx]["interval"]
-        if interval:
-            silence_file = os.path.join(output_dir, f"silence_{interval}.wav")
-            create_silence(interval, silence_file)
-            audio_files.append(silence_file)
-    concat(audio_files, os.path.join(output_dir, f"speech.wav"))
+def _reuse_speech(output_file: str, key: str, utterance_cache: FileCache, manifest: Manifest):
+    """
+    已有文件与当前对话一致，或缓存命中时返回 True，否则删除过期的文件
+    """
+    file_name = os.path.basename(output_file)
+    if os.path.exists(output_file):
+        # 目录还没有记录文件时，已有文件来自旧版本，视为有效，避免升级后全部重新生成
+        recorded = manifest.get(file_name)
+        if recorded == key or (recorded is None and manifest.legacy):
+            manifest.set(file_name, key)
+            return True
+        # 插入或修改对话后序号错位，文件已过期；先删除，不能覆盖写入与缓存共享的硬链接
+        os.remove(output_file)
+    if utterance_cache.fetch(key, output_file):
+        manifest.set(file_name, key)
+        return True
+    return False
 
-    return male_timbre_map | female_timbre_map
+
+def _clean_tts_text(text: str):
+    tags = [
+        "[breath]",
+        "[noise]",
+        "[laughter]",
+        "[cough]",
+        "[clucking]",
+        "[accent]",
+        "[quick_breath]",
+        "[hissing]",
+        "[sigh]",
+        "[vocalized-noise",
+        "[lipsmack]",
+        "[mn]",
+        "<strong>", "</strong>"
+        "<laughter>", "</laughter>"
+    ]
+    def is_valid_tag(match):
+        return match.group(0) in tags
+
+    pattern = re.compile(r"\[[^\]]*\]|<[^>]*>")
+
+    # 删除不合法标签
+    return pattern.sub(
+        lambda match: match.group(0) if is_valid_tag(match) else "", text
+    )
 
 
 def _get_role_name(dialog: Dict[str, str]):
@@ -191,21 +422,3 @@ def _get_instruct_text(dialog: Dict[str, str]):
         return sep.join([text for text in texts if text])
 
     return cat(personality, emo, speed2instruct(speed), instruct)
-
-
-def _transform_os(file: str):
-    # todo
-    # 目前仅加混响
-    origin_file = file.replace(".wav", "_origin.wav")
-    shutil.move(file, origin_file)
-    subprocess.check_output(
-        [
-            "ffmpeg",
-            "-i",
-            origin_file,
-            "-af",
-            "aecho=0.5:0.8:50:0.8",
-            "-y",
-            file,
-        ]
-    )
@@ -1,3 +1,14 @@
-from .tta_model import TTAModel
-from .audiogen import AudioGenTTAModel
-from .make_an_audio import MakeAnAudioTTAModel
\ No newline at end of file
+from ...utils.lazy import lazy_exports
+
+# 按需导入，AudioGen 依赖 audiocraft，Make-An-Audio 在第一次生成时才载入 torch
+_EXPORTS = {
+    "TTAModel": ".tta_model",
+    "AudioGenTTAModel": ".audiogen",
+    "MakeAnAudioTTAModel": ".make_an_audio",
+    "StubTTAModel": ".stub",
+    "CachedTTAModel": ".library",
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
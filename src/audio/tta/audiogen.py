@@ -1,10 +1,36 @@
-from audiocraft.models import AudioGen
-from audiocraft.data.audio import audio_write
+import os
+import math
+from typing import List
 
 from .tta_model import TTAModel
 
 
 class AudioGenTTAModel(TTAModel):
+    """
+    Args:
+        model_dir (str): 预训练模型目录，第一次生成时载入并常驻
+        batch_size (int): 每批同时生成的音效数
+    """
+
+    # 时长分桶的最小上限（秒），之后每档翻倍：5、10、20、40……
+    MIN_BUCKET = 5
+
+    def __init__(self, model_dir: str = "./facebook/audiogen-medium", batch_size: int = 8):
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.model = None
+
+    @property
+    def version(self):
+        return f"AudioGen-{os.path.basename(os.path.normpath(self.model_dir))}"
+
+    def clip_duration(self, duration: float):
+        # 所在时长分桶的上限
+        bucket = self.MIN_BUCKET
+        while bucket < duration:
+            bucket *= 2
+        return bucket
+
     def generate(
         self,
         desc,
@@ -12,14 +38,49 @@ class AudioGenTTAModel(TTAModel):
         output_path,
         **kwargs,
     ):
-        autogen = AudioGen.get_pretrained("./facebook/audiogen-medium")
-        autogen.set_generation_params(duration=duration)
-
-        audio = autogen.generate([desc])[0]
-        audio_write(
-            output_path.replace(".wav", ""),
-            audio.cpu(),
-            autogen.sample_rate,
-            strategy="loudness",
-            loudness_compressor=True,
-        )
+        self.generate_batch([desc], [duration], [output_path], **kwargs)
+
+    def generate_batch(
+        self,
+        descs: List[str],
+        durations: List[int],
+        output_paths: List[str],
+        **kwargs,
+    ):
+        """
+        按时长粗分桶，同一桶的描述按桶内最长的时长一起生成，再裁剪到各自的时长
+        """
+        from audiocraft.models import AudioGen
+        from audiocraft.data.audio import audio_write
+
+        if self.model is None:
+            self.model = AudioGen.get_pretrained(self.model_dir)
+        for gen_duration, requests in self._groups(descs, durations, output_paths):
+            self.model.set_generation_params(duration=gen_duration)
+            for start in range(0, len(requests), self.batch_size):
+                batch = requests[start : start + self.batch_size]
+                audios = self.model.generate([desc for desc, _, _ in batch])
+                for audio, (_, duration, output_path) in zip(audios, batch):
+                    audio_write(
+                        output_path.replace(".wav", ""),
+                        audio[..., : int(max(duration, 0.1) * self.model.sample_rate)].cpu(),
+                        self.model.sample_rate,
+                        strategy="loudness",
+                        loudness_compressor=True,
+                    )
+
+    def close(self):
+        self.model = None
+
+    def _groups(self, descs: List[str], durations: List[int], output_paths: List[str]):
+        """
+        Returns:
+            [(生成时长, [(描述, 时长, 输出路径)])]，按生成时长排序
+        """
+        buckets = {}
+        for request in zip(descs, durations, output_paths):
+            buckets.setdefault(self.clip_duration(request[1]), []).append(request)
+        return [
+            (max(1, math.ceil(max(duration for _, duration, _ in requests))), requests)
+            for _, requests in sorted(buckets.items())
+        ]
@@ -0,0 +1,84 @@
+import os
+import tempfile
+from typing import List
+
+from ...utils.effect_library import EffectLibrary
+from ...utils.effects import fit_duration
+from ..tts.sink import read_wav, write_wav
+from .tta_model import TTAModel
+
+
+class CachedTTAModel(TTAModel):
+    """
+    带音效库的音效生成，相同或相近的描述复用已生成的音效，其余交给 model 批量生成
+    Args:
+        model (TTAModel): 音效生成模型
+        library_dir (str): 音效库目录，可以在多本书之间共享
+        threshold (float): 近似命中的相似度阈值，默认按模型的文本嵌入取值，见 DEFAULT_THRESHOLDS
+        max_bytes (int): 音效库最多占用的字节数
+    """
+
+    def __init__(self, model: TTAModel, library_dir: str, threshold: float = None, max_bytes: int = None):
+        self.model = model
+        # 模型有文本编码器（如 Make-An-Audio 的 CLAP）时用它做近似查找，阈值默认按文本嵌入取值
+        self.library = EffectLibrary(library_dir, model.embed_text, model.text_embedding, threshold, max_bytes)
+
+    @property
+    def version(self):
+        return self.model.version
+
+    def generate(
+        self,
+        desc,
+        duration,
+        output_path,
+        **kwargs,
+    ):
+        self.generate_batch([desc], [duration], [output_path], **kwargs)
+
+    def generate_batch(
+        self,
+        descs: List[str],
+        durations: List[int],
+        output_paths: List[str],
+        **kwargs,
+    ):
+        version = self.model.version
+        misses = []
+        for desc, duration, output_path in zip(descs, durations, output_paths):
+            clip_file = self.library.fetch_exact(desc, version, self.model.clip_duration(duration))
+            if clip_file is not None:
+                _write_clip(clip_file, duration, output_path)
+            else:
+                misses.append((desc, duration, output_path))
+
+        # 规范化后相同的描述只生成一次：key -> [描述, 生成时长, [(时长, 输出路径)]]
+        pending = {}
+        nearest = self.library.nearest([desc for desc, _, _ in misses], version)
+        for (desc, duration, output_path), hit in zip(misses, nearest):
+            if hit is not None:
+                clip_file, _, similarity = hit
+                print(f"Reuse effect ({similarity:.2f}) for: {desc}")
+                _write_clip(clip_file, duration, output_path)
+                continue
+            request = pending.setdefault(self.library.make_key(desc, version), [desc, 0, []])
+            request[1] = max(request[1], self.model.clip_duration(duration))
+            request[2].append((duration, output_path))
+
+        if pending:
+            # 生成完整的音效放入音效库，再裁剪到各自的时长
+            with tempfile.TemporaryDirectory(dir=self.library.cache_dir) as tmp_dir:
+                new_descs, clip_durations, outputs = map(list, zip(*pending.values()))
+                clip_files = [os.path.join(tmp_dir, f"{i}.wav") for i in range(len(new_descs))]
+                self.model.generate_batch(new_descs, clip_durations, clip_files, **kwargs)
+                self.library.add(new_descs, clip_durations, version, clip_files)
+                for clip_file, requests in zip(clip_files, outputs):
+                    for duration, output_path in requests:
+                        _write_clip(clip_file, duration, output_path)
+        self.library.save()
+        print(f"Effect library: {self.library.stats()}")
+
+
+def _write_clip(clip_file: str, duration: float, output_path: str):
+    audio, sample_rate = read_wav(clip_file)
+    write_wav(output_path, fit_duration(audio, sample_rate, duration), sample_rate)
@@ -1,11 +1,72 @@
-import subprocess
 import os
+import sys
+from contextlib import contextmanager
+from typing import List
 
-from ...utils.ffmpeg import cut
+import numpy as np
+
+from ..tts.sink import write_wav
 from .tta_model import TTAModel
 
+LIB_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "lib", "Make-An-Audio"))
+
 
 class MakeAnAudioTTAModel(TTAModel):
+    """
+    Make-An-Audio 音效生成，扩散模型、CLAP 文本编码器和 BigVGAN 声码器在第一次生成时载入并常驻，
+    之后每个音效只需采样
+    Args:
+        config (str): 模型配置，相对 Make-An-Audio 目录
+        ckpt (str): 扩散模型权重，相对 Make-An-Audio 目录
+        vocoder_dir (str): BigVGAN 声码器目录，相对 Make-An-Audio 目录
+        ddim_steps (int): DDIM 采样步数
+        scale (float): classifier-free guidance 系数
+        gen_duration (int): 生成的时长（秒），生成 10s 效果更好，再裁剪到要求时长
+        sample_rate (int): 声码器输出的采样率
+        batch_size (int): generate_batch 每批同时采样的音效数
+        seed (int): 随机种子，None 时不固定
+    """
+
+    # 嵌入方式变化时改名，音效库据此重新计算已有描述的嵌入
+    text_embedding = "clap-cls"
+
+    def __init__(
+        self,
+        config: str = os.path.join("configs", "text_to_audio", "txt2audio_args.yaml"),
+        ckpt: str = os.path.join("useful_ckpts", "maa1_full.ckpt"),
+        vocoder_dir: str = os.path.join("useful_ckpts", "bigvgan"),
+        ddim_steps: int = 100,
+        scale: float = 3.0,
+        gen_duration: int = 10,
+        sample_rate: int = 16000,
+        batch_size: int = 4,
+        seed: int = None,
+    ):
+        self.config = config
+        self.ckpt = ckpt
+        self.vocoder_dir = vocoder_dir
+        self.ddim_steps = ddim_steps
+        self.scale = scale
+        self.gen_duration = gen_duration
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.seed = seed
+        self.sampler = None
+        self.vocoder = None
+        # 批大小 -> 无条件的文本编码
+        self._uc = {}
+
+    @property
+    def version(self):
+        return (
+            f"MakeAnAudio-{os.path.basename(self.ckpt)}-{self.ddim_steps}-{self.scale}"
+            f"-{self.gen_duration}-{self.seed}"
+        )
+
+    def clip_duration(self, duration: float):
+        # 总是生成 gen_duration 秒
+        return self.gen_duration
+
     def generate(
         self,
         desc,
@@ -13,32 +74,131 @@ class MakeAnAudioTTAModel(TTAModel):
         output_path,
         **kwargs,
     ):
-        output_path = os.path.abspath(output_path)
-        output_name, ext = os.path.splitext(output_path)
-        cwd = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "lib", "Make-An-Audio"))
-        subprocess.check_output(
-            [
-                "python",
-                "gen_wav.py",
-                "--prompt",
-                desc,
-                "--ddim_steps",
-                "100",
-                "--duration",
-                "10",
-                "--scale",
-                "3",
-                "--n_samples",
-                "1",
-                "--save_name",
-                output_name,
-            ],
-            cwd=cwd,
-        )
-        # 生成 10s 效果更好，再裁剪到要求时长
-        cut(
-            f"{output_name}_0{ext}",
-            output_path,
-            0,
-            duration,
-        )
+        self.generate_batch([desc], [duration], [output_path], **kwargs)
+
+    def generate_batch(
+        self,
+        descs: List[str],
+        durations: List[int],
+        output_paths: List[str],
+        **kwargs,
+    ):
+        """
+        所有音效都生成 gen_duration 秒，每 batch_size 个描述一起采样，再裁剪到各自的时长
+        """
+        for start in range(0, len(descs), self.batch_size):
+            end = start + self.batch_size
+            wavs = self.sample(descs[start:end])
+            for wav, duration, output_path in zip(wavs, durations[start:end], output_paths[start:end]):
+                write_wav(output_path, wav[: int(max(duration, 0.1) * self.sample_rate)], self.sample_rate)
+
+    def sample(self, descs: List[str]):
+        """
+        一次采样生成多个 gen_duration 秒的音效
+        Returns:
+            wavs (List[np.ndarray]): [-1, 1] 范围的浮点音频
+        """
+        import torch
+
+        self._load()
+        model = self.sampler.model
+        n_samples = len(descs)
+        latent_width = _dur_to_size(self.gen_duration)
+        shape = [model.first_stage_model.embed_dim, 10, latent_width]
+        if self.seed is not None:
+            torch.manual_seed(self.seed)
+        with torch.no_grad():
+            start_code = torch.randn(n_samples, *shape, device=model.device, dtype=torch.float32)
+            c = model.get_learned_conditioning(descs)
+            samples, _ = self.sampler.sample(
+                S=self.ddim_steps,
+                conditioning=c,
+                batch_size=n_samples,
+                shape=shape,
+                verbose=False,
+                unconditional_guidance_scale=self.scale,
+                unconditional_conditioning=self._unconditional(n_samples),
+                x_T=start_code,
+            )
+            specs = model.decode_first_stage(samples)
+            wavs = [self.vocoder.vocode(spec) for spec in specs]
+        length = self.sample_rate * self.gen_duration
+        return [np.pad(wav, (0, max(0, length - len(wav)))) for wav in wavs]
+
+    def embed_text(self, descs: List[str]):
+        """
+        CLAP 的句向量：[CLS] 位置的输出经 CLAP 投影层后归一化，与 CLAP 训练时的文本表示一致。
+        不对逐 token 的条件编码取平均，其中大部分是补齐到 max_length 的 padding
+        """
+        import torch
+
+        self._load()
+        encoder = self.sampler.model.cond_stage_model
+        batch = encoder.tokenizer(
+            descs,
+            padding=True,
+            truncation=True,
+            max_length=encoder.max_length,
+            return_tensors="pt",
+        ).to(encoder.device)
+        with torch.no_grad():
+            z = encoder.caption_encoder(batch)
+        z = torch.nn.functional.normalize(z.float(), dim=-1)
+        return z.cpu().numpy()
+
+    def _unconditional(self, n_samples: int):
+        # 无条件的文本编码对每个音效都一样，每种批大小只计算一次
+        if self.scale == 1.0:
+            return None
+        if n_samples not in self._uc:
+            self._uc[n_samples] = self.sampler.model.get_learned_conditioning(n_samples * [""])
+        return self._uc[n_samples]
+
+    def close(self):
+        self.sampler = None
+        self.vocoder = None
+        self._uc = {}
+
+    def _load(self):
+        if self.sampler is not None:
+            return
+        import torch
+
+        if LIB_DIR not in sys.path:
+            sys.path.append(LIB_DIR)
+        from omegaconf import OmegaConf
+        from ldm.util import instantiate_from_config
+        from ldm.models.diffusion.ddim import DDIMSampler
+        from vocoder.bigvgan.models import VocoderBigVGAN
+
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        print(f"Loading Make-An-Audio from {self.ckpt}")
+        # 配置中 CLAP 等权重是相对 Make-An-Audio 目录的路径
+        with _chdir(LIB_DIR):
+            config = OmegaConf.load(self.config)
+            model = instantiate_from_config(config.model)
+            state_dict = torch.load(self.ckpt, map_location="cpu")["state_dict"]
+            model.load_state_dict(state_dict, strict=False)
+            model = model.eval().to(device)
+            model.cond_stage_model.to(device)
+            model.cond_stage_model.device = device
+            self.vocoder = VocoderBigVGAN(self.vocoder_dir, device=device)
+        self.sampler = DDIMSampler(model)
+
+
+def _dur_to_size(duration: float):
+    # 与 Make-An-Audio 的 gen_wav.py 一致，每秒 7.8 帧，按 4 对齐
+    latent_width = int(duration * 7.8)
+    if latent_width % 4 != 0:
+        latent_width = (latent_width // 4 + 1) * 4
+    return latent_width
+
+
+@contextmanager
+def _chdir(path: str):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,27 @@
+import zlib
+
+from ..tts.stub import write_tone
+from .tta_model import TTAModel
+
+
+class StubTTAModel(TTAModel):
+    """
+    不依赖模型的 TTA 桩实现，生成指定时长的合成音效，用于离线测试和性能分析
+    """
+
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+
+    @property
+    def version(self):
+        return f"stub-{self.sample_rate}"
+
+    def generate(
+        self,
+        desc,
+        duration,
+        output_path,
+        **kwargs,
+    ):
+        pitch = 200 + zlib.crc32(desc.encode("utf-8")) % 800
+        write_tone(output_path, max(duration, 0.1), pitch, self.sample_rate, noise=0.5)
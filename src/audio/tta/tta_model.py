@@ -1,7 +1,20 @@
 from abc import ABC, abstractmethod
+from typing import List
+
+from ...utils.effect_library import hash_embedding
 
 
 class TTAModel(ABC):
+    # 文本嵌入的名字，音效库用于近似查找，重写 embed_text 的模型需要一并修改
+    text_embedding = "hash"
+
+    @property
+    def version(self):
+        """
+        模型版本，用于音效库的键，模型或影响输出的参数变化时应当不同
+        """
+        return type(self).__name__
+
     @abstractmethod
     def generate(
         self,
@@ -17,3 +30,34 @@ class TTAModel(ABC):
         output_path: 输出路径
         """
         ...
+
+    def generate_batch(
+        self,
+        descs: List[str],
+        durations: List[int],
+        output_paths: List[str],
+        **kwargs,
+    ):
+        """
+        批量生成音效，默认逐个调用 generate
+        Args:
+            descs: 描述文本
+            durations: 音频时长，单位秒
+            output_paths: 输出路径
+        """
+        for desc, duration, output_path in zip(descs, durations, output_paths):
+            self.generate(desc, duration, output_path, **kwargs)
+
+    def clip_duration(self, duration: float):
+        """
+        请求 duration 秒的音效时模型实际生成的时长，音效库保存这么长的完整音效，复用时再裁剪
+        """
+        return duration
+
+    def embed_text(self, descs: List[str]):
+        """
+        描述文本的嵌入，默认使用不依赖模型的 hash_embedding
+        Returns:
+            embeddings (np.ndarray): (len(descs), D)，已归一化
+        """
+        return hash_embedding(descs)
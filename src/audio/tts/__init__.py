@@ -1,2 +1,14 @@
-from .tts_model import TTSModel
-from .cosyvoice import CosyVoiceTTSModel
\ No newline at end of file
+from ...utils.lazy import lazy_exports
+
+# 按需导入，CosyVoice 依赖 torch，桩模型和进程池不需要
+_EXPORTS = {
+    "TTSModel": ".tts_model",
+    "CosyVoiceTTSModel": ".cosyvoice",
+    "StubTTSModel": ".stub",
+    "WavSink": ".sink",
+    "TTSWorkerPool": ".worker_pool",
+}
+
+__all__ = list(_EXPORTS)
+
+__getattr__ = lazy_exports(__name__, _EXPORTS)
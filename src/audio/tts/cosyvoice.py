@@ -1,16 +1,27 @@
 import os
+import hashlib
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 import torch
 import torchaudio
+from tqdm import tqdm
 from hyperpyyaml import load_hyperpyyaml
 
 from ..lib.CosyVoice.cosyvoice.cli.model import CosyVoice2Model
 from ..lib.CosyVoice.cosyvoice.cli.frontend import CosyVoiceFrontEnd
 from ..lib.CosyVoice.cosyvoice.utils.file_utils import load_wav
 
+from ...utils.effects import apply_effects, crossfade
+from ...utils.lru import LRUCache
 from .tts_model import TTSModel
+from .voice_bank import VoiceBank
 
 
 class CosyVoiceTTSModel(TTSModel):
+    # 相邻分段拼接时交叉淡化的时长（秒），避免接缝处的爆音
+    CROSSFADE_SECS = 0.02
+
     def __init__(
         self,
         model_dir: str,
@@ -18,7 +29,29 @@ class CosyVoiceTTSModel(TTSModel):
         load_jit=False,
         load_trt=False,
         load_onnx=False,
+        voice_bank_dir: str = None,
+        frontend_cache_file: str = None,
+        frontend_cache_size: int = 20000,
+        fp16=False,
+        int8=False,
+        bf16=False,
+        num_threads: int = None,
+        num_interop_threads: int = None,
     ):
+        """
+        Args:
+            fp16 (bool): GPU 半精度推理
+            int8 (bool): LLM 的线性层动态量化为 int8，用于 CPU
+            bf16 (bool): LLM 和 flow 使用 bf16 自动混合精度，CPU 不支持时忽略
+            num_threads (int): torch 算子内并行的线程数
+            num_interop_threads (int): torch 算子间并行的线程数，只能在进程中第一次推理前设置
+            voice_bank_dir (str): 音源提示特征的缓存目录，None 时只在内存中缓存
+            frontend_cache_file (str): 文本规范化和分词结果的持久化文件，None 时只在内存中缓存
+            frontend_cache_size (int): 文本规范化和分词结果最多缓存的条目数
+        """
+        _set_threads(num_threads, num_interop_threads)
+        fp16 = fp16 and torch.cuda.is_available()
+
         with open(os.path.join(model_dir, "cosyvoice.yaml"), "r") as f:
             configs = load_hyperpyyaml(
                 f,
@@ -26,7 +59,7 @@ class CosyVoiceTTSModel(TTSModel):
                     "qwen_pretrain_path": os.path.join(model_dir, "CosyVoice-BlankEN")
                 },
             )
-        self.model = CosyVoice2Model(configs["llm"], configs["flow"], configs["hift"], fp16=False)
+        self.model = CosyVoice2Model(configs["llm"], configs["flow"], configs["hift"], fp16=fp16)
         self.model.load(
             os.path.join(model_dir, "llm.pt"),
             os.path.join(model_dir, "flow.pt"),
@@ -43,7 +76,9 @@ class CosyVoiceTTSModel(TTSModel):
         )
 
         if load_jit:
-            self.model.load_jit(os.path.join(model_dir, "flow.encoder.fp32.zip"))
+            self.model.load_jit(
+                os.path.join(model_dir, f"flow.encoder.{'fp16' if fp16 else 'fp32'}.zip")
+            )
         if load_trt is True and load_onnx is True:
             load_onnx = False
             print(
@@ -58,16 +93,84 @@ class CosyVoiceTTSModel(TTSModel):
                 os.path.join(model_dir, "flow.decoder.estimator.fp16.Volta.plan")
             )
 
+        if int8:
+            # 自回归的 LLM 是 CPU 上的主要耗时，线性层量化后权重只需读取四分之一
+            torch.quantization.quantize_dynamic(
+                self.model.llm, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+        if bf16 and not _cpu_supports_bf16():
+            print("CPU does not support bf16, force set bf16 to False")
+            bf16 = False
+        if bf16:
+            # LLM 在 CosyVoice 内部的线程中推理，autocast 只对当前线程生效，因此包装推理函数本身
+            if not int8:
+                self.model.llm.inference = _bf16_generator(self.model.llm.inference)
+            self.model.flow.inference = _bf16_function(self.model.flow.inference)
+        self.precision = "fp16" if fp16 else "int8" if int8 else "bf16" if bf16 else "fp32"
+        if int8 and bf16:
+            self.precision = "int8-bf16"
+
         self.sample_rate = configs["sample_rate"]
         del configs
 
+        self._version = _model_version(model_dir, self.sample_rate)
+        self._weights_version = _weights_version(model_dir)
+        self.voice_bank = VoiceBank(voice_bank_dir, self._version)
+        # 旁白等指令文本大量重复，重跑时相同的句子也无需重新处理
+        self.frontend_cache = LRUCache(frontend_cache_size, frontend_cache_file, self._version)
+        self.speech_files = {}
         self.speech_input_dic = {}
 
+    @property
+    def version(self):
+        # 语音缓存的键，还取决于生成语音的 LLM、flow 和声码器权重
+        return f"CosyVoice2-{self._version}-{self._weights_version}-{self.precision}"
+
     def register(self, key, speech_file: str):
+        # 只记录音源文件，第一次使用时再提取特征（优先读取缓存）
+        if self.speech_files.get(key) != speech_file:
+            self.speech_files[key] = speech_file
+            self.speech_input_dic.pop(key, None)
+
+    def prepare_voices(self, keys=None, max_workers: int = 4):
+        """
+        一次性提取所有未缓存音色的特征并写入缓存
+        Args:
+            keys (List[str]): 需要准备的音色，默认为全部已注册的音色
+            max_workers (int): 同时提取的音色数，onnx 推理时会释放 GIL
+        """
+        keys = [key for key in (keys or self.speech_files) if key not in self.speech_input_dic]
+        missing = []
+        for key in keys:
+            features = self.voice_bank.get(self.speech_files[key])
+            if features is None:
+                missing.append(key)
+            else:
+                self.speech_input_dic[key] = features
+        if not missing:
+            return
+        print(f"Extracting {len(missing)} voices")
+        with ThreadPoolExecutor(max_workers) as executor:
+            results = executor.map(
+                lambda key: self._extract_voice(self.speech_files[key]), missing
+            )
+            for key, features in zip(missing, results):
+                self.speech_input_dic[key] = features
+
+    def _speech_input(self, speech_key):
+        if speech_key not in self.speech_input_dic:
+            assert speech_key in self.speech_files, f"speech_key not found: {speech_key}"
+            speech_file = self.speech_files[speech_key]
+            features = self.voice_bank.get(speech_file)
+            if features is None:
+                features = self._extract_voice(speech_file)
+            self.speech_input_dic[speech_key] = features
+        return self.speech_input_dic[speech_key]
+
+    def _extract_voice(self, speech_file: str):
         speech_16k = load_wav(speech_file, 16000)
-        self.speech_input_dic[key] = get_model_input_from_speech(
-            self.frontend, speech_16k, self.sample_rate
-        )
+        features = get_model_input_from_speech(self.frontend, speech_16k, self.sample_rate)
+        return self.voice_bank.put(speech_file, features)
 
     @torch.no_grad()
     def generate(
@@ -76,23 +179,126 @@ class CosyVoiceTTSModel(TTSModel):
         instruct_text,
         speech_key,
         output_path,
+        effects=None,
+        segment_workers: int = None,
         **kwargs,
     ):
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        """
+        Args:
+            effects (List): 写出前依次应用的效果，如 ["os"]
+            segment_workers (int): 长文本按 text_normalize 分段后，LLM 同时推理的段数，默认见 _synthesize
+        Returns:
+            tts_speech (torch.Tensor): 生成的音频，形状为 (1, samples)
+        """
+        model_inputs = self._segment_inputs(tts_text, instruct_text, speech_key)
+        speeches = self._synthesize(model_inputs, segment_workers)
+        if not speeches:
+            # 文本规范化后为空（如只有标点），写一段短静音保证文件存在
+            speeches = [torch.zeros(1, self.sample_rate // 10)]
+        tts_speech = self._post_process(speeches, effects)
+        print("generate speech len {}".format(tts_speech.shape[1] / self.sample_rate))
+        torchaudio.save(output_path, tts_speech, sample_rate=self.sample_rate)
+        return tts_speech
+
+    @torch.no_grad()
+    def stream_blocks(self, tts_text, instruct_text, speech_key, **kwargs):
+        """
+        使用 CosyVoice2 的流式推理，逐块返回生成的语音
+        """
+        for model_input in self._segment_inputs(tts_text, instruct_text, speech_key):
+            for model_output in self.model.tts(**model_input, stream=True, speed=1.0):
+                yield model_output["tts_speech"]
+
+    @torch.no_grad()
+    def generate_batch(
+        self,
+        requests: List[Dict],
+        llm_workers: int = None,
+        **kwargs,
+    ):
+        """
+        批量合成多句语音：所有句子的分段一起推理，LLM 阶段并发，flow 和 hift 逐段，llm_workers 为 1 时结果与逐句 generate 一致
+        Args:
+            requests (List[Dict]): 每项包含 generate 的参数 tts_text, instruct_text, speech_key, output_path
+            llm_workers (int): LLM 阶段同时推理的段数，默认见 _synthesize
+        """
+        # 按 text_normalize 的分段展开，每段为一个推理单元
+        units = []
+        for req_idx, request in enumerate(requests):
+            for model_input in self._segment_inputs(
+                request["tts_text"], request["instruct_text"], request["speech_key"]
+            ):
+                units.append({"request": req_idx, "model_input": model_input, "speech": None})
+
+        speeches = self._synthesize([unit["model_input"] for unit in units], llm_workers, progress=True)
+        for unit, speech in zip(units, speeches):
+            unit["speech"] = speech
+
+        for req_idx, request in enumerate(requests):
+            speeches = [unit["speech"] for unit in units if unit["request"] == req_idx]
+            if not speeches:
+                # 文本规范化后为空（如只有标点），写一段短静音保证文件存在
+                speeches = [torch.zeros(1, self.sample_rate // 10)]
+            torchaudio.save(
+                request["output_path"],
+                self._post_process(speeches, request.get("effects")),
+                sample_rate=self.sample_rate,
+            )
+
+    def close(self):
+        if self.frontend_cache.cache_file:
+            self.frontend_cache.save()
+        print(f"TTS frontend cache: {self.frontend_cache.stats()}")
+        print(f"Voice bank: {self.voice_bank.stats()}")
+
+    def _post_process(self, speeches: List[torch.Tensor], effects=None):
+        """
+        拼接各段语音并应用效果，效果在内存中处理，只写一次文件
+        """
+        tts_speech = crossfade(
+            [speech.cpu().numpy() for speech in speeches], int(self.CROSSFADE_SECS * self.sample_rate)
+        )
+        if effects:
+            tts_speech = apply_effects(tts_speech, self.sample_rate, effects)
+        return torch.from_numpy(tts_speech)
 
-        assert (
-            speech_key in self.speech_input_dic
-        ), f"speech_key not found: {speech_key}"
-        prompt_speech_input = self.speech_input_dic[speech_key]
-
-        for text in self.frontend.text_normalize(
-            tts_text, split=True, text_frontend=True
-        ):
-            tts_text_token, tts_text_token_len = self.frontend._extract_text_token(text)
-            prompt_text_token, prompt_text_token_len = (
-                self.frontend._extract_text_token(instruct_text + "<|endofprompt|>")
+    def _synthesize(self, model_inputs: List[Dict], workers: int = None, progress: bool = False):
+        """
+        逐段推理 LLM -> flow -> hift，与 CosyVoice2 的 token2wav（finalize=True）相同，单段和多段走同一条路径
+        Args:
+            workers (int): LLM 同时推理的段数。默认 GPU 上为 4；CPU 上 torch 算子本身已用满所有核，并发的线程
+                只会互相争抢，默认为 1，此时每段依次完成全部三步，随机数的消耗顺序与逐句合成相同
+        Returns:
+            speeches (List[torch.Tensor]): 每段的音频，形状为 (1, samples)
+        """
+        if workers is None:
+            workers = 4 if torch.cuda.is_available() else 1
+        if workers <= 1 or len(model_inputs) <= 1:
+            return [
+                self._vocode(self._flow_mel(self._llm_tokens(model_input), model_input))
+                for model_input in tqdm(model_inputs, disable=not progress)
+            ]
+        with ThreadPoolExecutor(min(workers, len(model_inputs))) as executor:
+            tokens = list(
+                tqdm(executor.map(self._llm_tokens, model_inputs), total=len(model_inputs), disable=not progress)
             )
+        return [
+            self._vocode(self._flow_mel(token, model_input))
+            for token, model_input in zip(tokens, model_inputs)
+        ]
 
+    def _segment_inputs(self, tts_text: str, instruct_text: str, speech_key: str):
+        """
+        按 text_normalize 的分段构造模型输入，每段一个
+        """
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        prompt_speech_input = self._speech_input(speech_key)
+        prompt_text_token, prompt_text_token_len = self._text_token(
+            instruct_text + "<|endofprompt|>"
+        )
+        model_inputs = []
+        for text in self._text_normalize(tts_text):
+            tts_text_token, tts_text_token_len = self._text_token(text)
             model_input = {
                 "text": tts_text_token,
                 "text_len": tts_text_token_len,
@@ -100,20 +306,125 @@ class CosyVoiceTTSModel(TTSModel):
                 "prompt_text_len": prompt_text_token_len,
                 **prompt_speech_input,
             }
+            model_inputs.append(
+                {
+                    k: v.to(device) if isinstance(v, torch.Tensor) else v
+                    for k, v in model_input.items()
+                }
+            )
+        return model_inputs
 
-            model_input = {
-                k: v.to(device) if isinstance(v, torch.Tensor) else v
-                for k, v in model_input.items()
-            }
+    def _text_normalize(self, text: str):
+        return self.frontend_cache.get_or_compute(
+            ("normalize", text),
+            lambda: list(self.frontend.text_normalize(text, split=True, text_frontend=True)),
+        )
+
+    def _text_token(self, text: str):
+        return self.frontend_cache.get_or_compute(
+            ("token", text),
+            lambda: tuple(t.cpu() for t in self.frontend._extract_text_token(text)),
+        )
+
+    def _llm_tokens(self, model_input: Dict):
+        llm = self.model.llm
+        with getattr(self.model, "llm_context", nullcontext()):
+            return torch.tensor(
+                list(
+                    llm.inference(
+                        text=model_input["text"],
+                        text_len=model_input["text_len"],
+                        prompt_text=model_input["prompt_text"],
+                        prompt_text_len=model_input["prompt_text_len"],
+                        prompt_speech_token=torch.zeros(1, 0, dtype=torch.int32).to(model_input["text"].device),
+                        prompt_speech_token_len=torch.zeros(1, dtype=torch.int32).to(model_input["text"].device),
+                        embedding=model_input["llm_embedding"],
+                    )
+                )
+            ).unsqueeze(dim=0)
+
+    def _flow_mel(self, token, model_input: Dict):
+        # CosyVoice2 的 flow 只支持 batch size 1
+        device = model_input["text"].device
+        prompt_token = model_input["flow_prompt_speech_token"]
+        prompt_feat = model_input["prompt_speech_feat"]
+        mel, _ = self.model.flow.inference(
+            token=token.to(device),
+            token_len=torch.tensor([token.shape[1]], dtype=torch.int32).to(device),
+            prompt_token=prompt_token,
+            prompt_token_len=torch.tensor([prompt_token.shape[1]], dtype=torch.int32).to(device),
+            prompt_feat=prompt_feat,
+            prompt_feat_len=torch.tensor([prompt_feat.shape[1]], dtype=torch.int32).to(device),
+            embedding=model_input["flow_embedding"],
+            finalize=True,
+        )
+        return mel
+
+    def _vocode(self, mel: torch.Tensor):
+        # 每段单独声码，HiFT 的基频预测和激励源只看到该段的帧
+        speech, _ = self.model.hift.inference(
+            speech_feat=mel, cache_source=torch.zeros(1, 1, 0).to(mel.device)
+        )
+        return speech.cpu()
+
+
+def _set_threads(num_threads: int = None, num_interop_threads: int = None):
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            print(f"Warning: can not set interop threads: {e}")
+
+
+def _cpu_supports_bf16():
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def _bf16_generator(fn):
+    def wrapper(*args, **kwargs):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            yield from fn(*args, **kwargs)
+
+    return wrapper
+
+
+def _bf16_function(fn):
+    def wrapper(*args, **kwargs):
+        with torch.autocast("cpu", dtype=torch.bfloat16):
+            mel, cache = fn(*args, **kwargs)
+        # hift 保持 fp32
+        return mel.float(), cache
+
+    return wrapper
+
+
+def _model_version(model_dir: str, sample_rate: int):
+    # 提示特征只取决于特征提取、语音 tokenizer 和说话人嵌入模型，同 _weights_version 按大小和修改时间区分
+    parts = [os.path.basename(os.path.normpath(model_dir)), str(sample_rate)]
+    for name in ("cosyvoice.yaml", "campplus.onnx", "speech_tokenizer_v2.onnx"):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
 
-            tts_speeches = []
-            for model_output in self.model.tts(**model_input, stream=False, speed=1.0):
-                speech_len = model_output["tts_speech"].shape[1] / self.sample_rate
-                print("generate speech len {}".format(speech_len))
-                tts_speeches.append(model_output["tts_speech"])
 
-        tts_speeches = torch.concat(tts_speeches, dim=1)
-        torchaudio.save(output_path, tts_speeches, sample_rate=self.sample_rate)
+def _weights_version(model_dir: str):
+    # 只按大小和修改时间区分，避免每次启动都读取上 G 的权重
+    parts = []
+    for name in ("llm.pt", "flow.pt", "hift.pt"):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:16]
 
 
 def get_model_input_from_speech(
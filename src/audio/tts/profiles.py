@@ -0,0 +1,19 @@
+# CosyVoice 推理配置，均为 CosyVoiceTTSModel 的参数
+#   load_jit: flow encoder 使用 TorchScript
+#   load_onnx: flow decoder 的 estimator 使用 onnxruntime
+#   fp16: GPU 半精度
+#   int8: LLM 的线性层动态量化为 int8（CPU）
+#   bf16: LLM 和 flow 使用 bf16 自动混合精度（需要 CPU 支持 avx512_bf16 或 amx）
+INFERENCE_PROFILES = {
+    "default": {},
+    "cpu": {"load_jit": True, "load_onnx": True},
+    "cpu-int8": {"load_jit": True, "load_onnx": True, "int8": True},
+    "cpu-bf16": {"load_jit": True, "load_onnx": True, "bf16": True},
+    "gpu-fp16": {"load_jit": True, "fp16": True},
+}
+
+
+def get_profile(name: str):
+    if name not in INFERENCE_PROFILES:
+        raise ValueError(f"Unknown inference profile: {name}, choose from {list(INFERENCE_PROFILES)}")
+    return dict(INFERENCE_PROFILES[name])
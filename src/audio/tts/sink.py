@@ -0,0 +1,95 @@
+import os
+import wave
+
+import numpy as np
+
+
+class WavSink:
+    """
+    增量写入 16 位 wav 文件，每收到一块音频就追加到文件
+    Args:
+        output_path (str): 输出路径
+        sample_rate (int): 采样率
+        channels (int): 声道数
+    """
+
+    def __init__(self, output_path: str, sample_rate: int, channels: int = 1):
+        self.output_path = output_path
+        self.sample_rate = sample_rate
+        self.samples = 0
+        # 先写到临时文件，完整结束后再替换，避免中断后留下被当作已完成的文件
+        self._tmp_path = output_path + ".part"
+        self._file = wave.open(self._tmp_path, "wb")
+        self._file.setnchannels(channels)
+        self._file.setsampwidth(2)
+        self._file.setframerate(sample_rate)
+
+    def write(self, block):
+        """
+        Args:
+            block: [-1, 1] 范围的浮点音频，numpy 数组或 torch 张量，形状为 (samples,) 或 (1, samples)
+        """
+        block = to_mono(block)
+        self._file.writeframes(
+            (np.clip(block, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+        )
+        self.samples += len(block)
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.output_path)
+
+    def discard(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 出错时丢弃不完整的文件
+            self.discard()
+
+
+def to_mono(block):
+    """
+    把 numpy 数组或 torch 张量形式的音频块转成一维 float32 数组
+    """
+    if hasattr(block, "detach"):
+        block = block.detach().cpu().numpy()
+    return np.asarray(block, dtype=np.float32).reshape(-1)
+
+
+def read_wav(path: str):
+    """
+    读取 16 位 wav 文件
+    Returns:
+        audio (np.ndarray): [-1, 1] 范围的浮点音频，多声道时取平均
+        sample_rate (int): 采样率
+    """
+    with wave.open(path, "rb") as f:
+        sample_rate, channels = f.getframerate(), f.getnchannels()
+        audio = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2")
+    audio = audio.astype(np.float32) / 32768
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    return audio, sample_rate
+
+
+def write_wav(path: str, audio, sample_rate: int):
+    """
+    写出 16 位单声道 wav 文件
+    Args:
+        audio: [-1, 1] 范围的浮点音频，numpy 数组或 torch 张量
+    """
+    with WavSink(path, sample_rate) as sink:
+        sink.write(audio)
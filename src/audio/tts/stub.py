@@ -0,0 +1,87 @@
+import re
+import zlib
+
+import numpy as np
+
+from ...utils.effects import apply_effects
+from .sink import write_wav
+from .tts_model import TTSModel
+
+
+class StubTTSModel(TTSModel):
+    """
+    不依赖模型的 TTS 桩实现，按文本长度生成时长接近真实语音的合成音频，用于离线测试和性能分析
+    Args:
+        chars_per_sec (float): 正常语速下每秒的字数
+        sample_rate (int): 采样率，与 CosyVoice2 一致
+    """
+
+    def __init__(self, chars_per_sec: float = 4.5, sample_rate: int = 24000):
+        self.chars_per_sec = chars_per_sec
+        self.sample_rate = sample_rate
+        self.speech_files = {}
+
+    @property
+    def version(self):
+        return f"stub-{self.sample_rate}-{self.chars_per_sec}"
+
+    def register(self, key, speech_file: str):
+        self.speech_files[key] = speech_file
+
+    def generate(
+        self,
+        tts_text,
+        instruct_text,
+        speech_key,
+        output_path,
+        effects=None,
+        **kwargs,
+    ):
+        assert speech_key in self.speech_files, f"speech_key not found: {speech_key}"
+        secs = self.duration(tts_text, instruct_text)
+        audio = tone(secs, self._pitch(speech_key), self.sample_rate)
+        audio = apply_effects(audio, self.sample_rate, effects)
+        write_wav(output_path, audio, self.sample_rate)
+        return audio[None]
+
+    def stream_blocks(self, tts_text, instruct_text, speech_key, block_secs: float = 0.5, **kwargs):
+        assert speech_key in self.speech_files, f"speech_key not found: {speech_key}"
+        audio = tone(self.duration(tts_text, instruct_text), self._pitch(speech_key), self.sample_rate)
+        block_size = int(block_secs * self.sample_rate)
+        for start in range(0, len(audio), block_size):
+            yield audio[start : start + block_size]
+
+    def _pitch(self, speech_key: str):
+        # 不同音色使用不同的基频
+        return 100 + zlib.crc32(speech_key.encode("utf-8")) % 200
+
+    def duration(self, tts_text: str, instruct_text: str = ""):
+        text = re.sub(r"\[[^\]]*\]|<[^>]*>", "", tts_text)
+        n_chars = len(re.sub(r"[\s，。！？、；：“”‘’「」『』（）…—,.!?;:\"'()-]", "", text))
+        rate = self.chars_per_sec
+        if "非常慢速" in instruct_text:
+            rate *= 0.6
+        elif "慢速" in instruct_text:
+            rate *= 0.8
+        elif "非常快速" in instruct_text:
+            rate *= 1.4
+        elif "快速" in instruct_text:
+            rate *= 1.2
+        return max(0.5, n_chars / rate)
+
+
+def tone(secs: float, pitch: float, sample_rate: int, noise: float = 0.0):
+    """生成一段带包络的正弦音（可混入噪声）"""
+    t = np.arange(int(secs * sample_rate)) / sample_rate
+    # 每 0.25 秒一个音节
+    envelope = 0.5 * (1 - np.cos(2 * np.pi * 4 * t))
+    audio = 0.3 * envelope * np.sin(2 * np.pi * pitch * t)
+    if noise:
+        rng = np.random.default_rng(int(pitch))
+        audio = (1 - noise) * audio + noise * 0.3 * rng.uniform(-1, 1, len(t))
+    return audio
+
+
+def write_tone(output_path: str, secs: float, pitch: float, sample_rate: int, noise: float = 0.0):
+    """写出 tone 生成的音频，16 位单声道 wav"""
+    write_wav(output_path, tone(secs, pitch, sample_rate, noise), sample_rate)
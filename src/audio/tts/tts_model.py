@@ -1,10 +1,40 @@
 from abc import ABC, abstractmethod
+from typing import Dict, List
+import os
+import time
+import tempfile
+
+import numpy as np
+
+from ...utils.effects import apply_effects
+from .sink import WavSink, read_wav, to_mono
 
 
 class TTSModel(ABC):
+    """
+    配音模型的接口
+    子类必须提供 sample_rate（输出音频的采样率），可以是实例属性或 property，
+    generate_stream 和 stream_blocks 依赖它写出音频
+    """
+
+    sample_rate: int
+
     @abstractmethod
     def register(self, key: str, speech_file: str): ...
 
+    @property
+    def version(self):
+        """
+        模型版本，用于语音缓存的键，模型或影响输出的参数变化时应当不同
+        """
+        return type(self).__name__
+
+    def prepare_voices(self, keys=None):
+        """
+        提前准备已注册音色的特征，默认在第一次使用时准备
+        """
+        pass
+
     @abstractmethod
     def generate(
         self,
@@ -12,6 +42,7 @@ class TTSModel(ABC):
         instruct_text: str,
         speech_key: str,
         output_path: str,
+        effects: List = None,
         **kwargs,
     ): 
         """
@@ -20,5 +51,83 @@ class TTSModel(ABC):
         instruct_text: 指令文本
         output_path: 输出路径
         speech_key: 音源对应的 key（注册音源时所指定的），为 None 时自动分配
+        effects: 写出前依次应用的效果，见 src.utils.effects.apply_effects
+        Returns
+        生成（并处理过）的音频，[-1, 1] 范围的浮点波形，形状为 (1, samples)
         """
         ...
+
+    def generate_batch(self, requests: List[Dict], **kwargs):
+        """
+        批量生成语音，默认逐句调用 generate
+        Args:
+            requests: 每项包含 generate 的参数 tts_text, instruct_text, speech_key, output_path，可选 effects
+        """
+        for request in requests:
+            self.generate(**request, **kwargs)
+
+    def generate_stream(
+        self,
+        tts_text: str,
+        instruct_text: str,
+        speech_key: str,
+        output_path: str = None,
+        sink=None,
+        effects: List = None,
+        **kwargs,
+    ):
+        """
+        流式生成语音，每生成一块音频就写入 sink，不必等整句生成完
+        Args:
+            output_path: 输出路径，未给出 sink 时增量写入此文件
+            sink: 接收音频块的对象，需实现 write(block)，block 为 [-1, 1] 范围的浮点音频
+            effects: 写出前依次应用的效果；回声等效果跨越块边界，给出时收齐整句处理后再写入 sink
+        Returns:
+            {
+                "ttfa": 从开始到生成第一块音频的秒数,
+                "elapsed": 总耗时,
+                "secs": 音频时长,
+            }
+        """
+        own_sink = sink is None
+        if own_sink:
+            sink = WavSink(output_path, self.sample_rate)
+        start = time.perf_counter()
+        ttfa = None
+        samples = 0
+        blocks = []
+        try:
+            for block in self.stream_blocks(tts_text, instruct_text, speech_key, **kwargs):
+                if ttfa is None:
+                    ttfa = time.perf_counter() - start
+                if effects:
+                    blocks.append(to_mono(block))
+                    continue
+                samples += block.shape[-1]
+                sink.write(block)
+            if effects:
+                audio = apply_effects(np.concatenate(blocks), self.sample_rate, effects)
+                samples = audio.shape[-1]
+                sink.write(audio)
+        except BaseException:
+            if own_sink:
+                sink.discard()
+            raise
+        if own_sink:
+            sink.close()
+        return {
+            "ttfa": ttfa,
+            "elapsed": time.perf_counter() - start,
+            "secs": samples / self.sample_rate,
+        }
+
+    def stream_blocks(self, tts_text: str, instruct_text: str, speech_key: str, **kwargs):
+        """
+        依次返回生成的音频块，默认整句生成后作为一块返回
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, "speech.wav")
+            audio = self.generate(tts_text, instruct_text, speech_key, output_path, **kwargs)
+            if audio is None:
+                audio, _ = read_wav(output_path)
+        yield audio
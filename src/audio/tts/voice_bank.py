@@ -0,0 +1,72 @@
+from typing import Dict, Optional
+import os
+import hashlib
+
+import torch
+
+
+class VoiceBank:
+    """
+    音源提示特征的磁盘缓存，以音源文件内容哈希和模型版本为键，每个音色只需提取一次
+    Args:
+        cache_dir (str): 缓存目录，None 时只在内存中缓存
+        version (str): 模型版本，提取特征的模型变化时缓存失效
+    """
+
+    def __init__(self, cache_dir: Optional[str], version: str):
+        self.cache_dir = cache_dir
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._features: Dict[str, Dict] = {}
+        # (路径, 大小, 修改时间) -> 内容哈希，避免每次注册都重新读文件
+        self._hashes: Dict[tuple, str] = {}
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, speech_file: str):
+        stat = os.stat(speech_file)
+        file_id = (os.path.abspath(speech_file), stat.st_size, stat.st_mtime_ns)
+        if file_id not in self._hashes:
+            with open(speech_file, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            self._hashes[file_id] = digest
+        return hashlib.sha256(
+            f"{self._hashes[file_id]}:{self.version}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, speech_file: str):
+        key = self.key(speech_file)
+        if key not in self._features and self.cache_dir:
+            path = self._path(key)
+            if os.path.exists(path):
+                try:
+                    self._features[key] = torch.load(path, map_location="cpu")
+                except Exception as e:
+                    print(f"Warning: broken voice cache {path}: {e}")
+        if key in self._features:
+            self.hits += 1
+            return self._features[key]
+        self.misses += 1
+        return None
+
+    def put(self, speech_file: str, features: Dict):
+        key = self.key(speech_file)
+        features = {
+            k: v.detach().cpu() if isinstance(v, torch.Tensor) else v
+            for k, v in features.items()
+        }
+        self._features[key] = features
+        if self.cache_dir:
+            # 先写临时文件再替换，避免中断时留下不完整的缓存；多进程可能同时写同一个音色
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            torch.save(features, tmp_path)
+            os.replace(tmp_path, path)
+        return features
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "voices": len(self._features)}
+
+    def _path(self, key: str):
+        return os.path.join(self.cache_dir, f"{key}.pt")
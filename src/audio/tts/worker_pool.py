@@ -0,0 +1,159 @@
+from typing import Dict, List
+import os
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import util
+
+from .tts_model import TTSModel
+
+
+class TTSWorkerPool(TTSModel):
+    """
+    多进程语音合成，每个进程常驻一个模型实例并固定线程数，用于无 GPU 的多核机器
+
+    与 TTSModel 接口一致，可以直接传给 gen_speech。音色分配仍在主进程中完成，
+    子进程只负责合成，按预计耗时从长到短分发，减少最后的长尾
+    Args:
+        model_factory: 创建 TTSModel 的模块级函数，需要可以被 pickle
+        factory_args (tuple): model_factory 的参数
+        num_workers (int): 进程数
+        threads_per_worker (int): 每个进程的 torch 线程数，默认平分 CPU 核数
+    """
+
+    def __init__(
+        self,
+        model_factory,
+        factory_args: tuple = (),
+        num_workers: int = 4,
+        threads_per_worker: int = None,
+    ):
+        self.model_factory = model_factory
+        self.factory_args = factory_args
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        self.speech_files = {}
+        self._executor = None
+        self._version = None
+        self._sample_rate = None
+
+    @property
+    def version(self):
+        # 与子进程中的模型一致，进程池和单进程共用语音缓存
+        if self._version is None:
+            self._version = self._submit(_worker_version).result()
+        return self._version
+
+    @property
+    def sample_rate(self):
+        if self._sample_rate is None:
+            self._sample_rate = self._submit(_worker_sample_rate).result()
+        return self._sample_rate
+
+    def register(self, key: str, speech_file: str):
+        # 子进程在第一次用到该音色时注册，音色特征由 VoiceBank 在进程间共享
+        self.speech_files[key] = speech_file
+
+    def generate(self, tts_text, instruct_text, speech_key, output_path, effects=None, **kwargs):
+        request = {
+            "tts_text": tts_text,
+            "instruct_text": instruct_text,
+            "speech_key": speech_key,
+            "output_path": output_path,
+            "effects": effects,
+        }
+        return self._submit(
+            _worker_generate, request, self.speech_files[speech_key], kwargs, True
+        ).result()
+
+    def generate_batch(self, requests: List[Dict], **kwargs):
+        # 最长的先合成
+        requests = sorted(requests, key=predict_cost, reverse=True)
+        futures = [
+            self._submit(
+                _worker_generate, request, self.speech_files[request["speech_key"]], kwargs, False
+            )
+            for request in requests
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+    def close(self):
+        # 子进程退出时关闭各自的模型（保存前端缓存等），shutdown 会等待子进程退出
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _submit(self, fn, *args):
+        if self._executor is None:
+            print(f"Start {self.num_workers} TTS workers, {self.threads_per_worker} threads each")
+            # fork 会复制父进程的 torch 线程池状态，统一使用 spawn
+            self._executor = ProcessPoolExecutor(
+                self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_factory, self.factory_args, self.threads_per_worker),
+            )
+        # 子进程在 submit 时按需启动，启动时导入主模块就会载入 torch，线程数只能通过环境变量传入
+        with _thread_env(self.threads_per_worker):
+            return self._executor.submit(fn, *args)
+
+
+def predict_cost(request: Dict):
+    # 合成耗时大致与文本长度成正比
+    return len(request["tts_text"])
+
+
+THREAD_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+@contextmanager
+def _thread_env(threads: int):
+    saved = {name: os.environ.get(name) for name in THREAD_ENV}
+    os.environ.update({name: str(threads) for name in THREAD_ENV})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+
+_worker_model: TTSModel = None
+
+
+def _init_worker(model_factory, factory_args: tuple, threads: int):
+    global _worker_model
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+    _worker_model = model_factory(*factory_args)
+    util.Finalize(None, _worker_close, exitpriority=0)
+
+
+def _worker_close():
+    close = getattr(_worker_model, "close", None)
+    if callable(close):
+        close()
+
+
+def _worker_version():
+    return _worker_model.version
+
+
+def _worker_sample_rate():
+    return _worker_model.sample_rate
+
+
+def _worker_generate(request: Dict, speech_file: str, kwargs: Dict, return_audio: bool):
+    _worker_model.register(request["speech_key"], speech_file)
+    audio = _worker_model.generate(**request, **kwargs)
+    # 批量合成时结果已写入文件，不必再传回主进程
+    if return_audio:
+        return audio
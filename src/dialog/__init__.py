@@ -1,3 +1,12 @@
-from .dialog import extract_dialog, gen_interval
-from .role import extract_role
+from .dialog import (
+    extract_dialog,
+    extract_dialog_async,
+    extract_dialog_stream,
+    gen_interval,
+    gen_interval_async,
+)
+from .interval import gen_interval_local
+from .combined import extract_all, extract_all_async
+from .role import extract_role, extract_role_async, merge_roles
+from .registry import RoleRegistry
 from .text import split_text
\ No newline at end of file
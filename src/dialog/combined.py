@@ -0,0 +1,141 @@
+from typing import List, Dict
+
+from ..utils.chat_model import ChatModel, AsyncChatModel
+from .dialog import TEXT_TO_DIALOG_SYSTEM, _filter_dialogs
+
+
+def extract_all(text: str, model: ChatModel):
+    """
+    一次请求同时提取对话、角色和对话间隔，文本只发送一次
+    Args:
+        text (str): 文本
+        model (str): openai 模型
+    Returns:
+        dialogs (List[Dict]): 同 extract_dialog
+        roles (List[Dict]): 同 extract_role
+        intervals (List[Dict]): 同 gen_interval
+    """
+    result = model.generate(
+        TEXT_TO_ALL.format(text=text),
+        TEXT_TO_DIALOG_SYSTEM,
+        max_completion_tokens=16384,
+        return_type="json",
+    )
+    return _split_result(result)
+
+
+async def extract_all_async(text: str, model: AsyncChatModel):
+    """
+    extract_all 的异步版本
+    """
+    result = await model.generate(
+        TEXT_TO_ALL.format(text=text),
+        TEXT_TO_DIALOG_SYSTEM,
+        max_completion_tokens=16384,
+        return_type="json",
+    )
+    return _split_result(result)
+
+
+def _split_result(result: Dict):
+    if not isinstance(result, dict):
+        raise ValueError(f"Expect a json object, got {type(result).__name__}")
+    if not isinstance(result.get("dialogs"), list) or not isinstance(result.get("roles"), list):
+        raise ValueError("Expect `dialogs` and `roles` arrays in the response")
+
+    roles = []
+    for role in result["roles"]:
+        if not role.get("name"):
+            raise ValueError(f"Role without name: {role}")
+        roles.append(
+            {
+                "name": role["name"],
+                "gender": role.get("gender") or "男",
+                "personality": role.get("personality"),
+                "alias": role.get("alias") or [],
+            }
+        )
+
+    raw_dialogs = []
+    for dialog in result["dialogs"]:
+        if not dialog.get("role") or not isinstance(dialog.get("content"), str):
+            raise ValueError(f"Dialog without role or content: {dialog}")
+        raw_dialogs.append(
+            {
+                "role": dialog["role"],
+                "content": dialog["content"],
+                "speed": dialog.get("speed") or 3,
+                "emo": dialog.get("emo"),
+                "instruct": dialog.get("instruct"),
+                "interval": dialog.get("interval"),
+            }
+        )
+    raw_dialogs = _filter_dialogs(raw_dialogs)
+
+    dialogs: List[Dict] = []
+    intervals: List[Dict] = []
+    for dialog in raw_dialogs:
+        interval = dialog.pop("interval")
+        if not isinstance(interval, int) or interval < 0:
+            interval = 1
+        dialogs.append(dialog)
+        intervals.append(
+            {
+                "role": dialog["role"],
+                "content": dialog["content"],
+                "interval": interval,
+            }
+        )
+    return dialogs, roles, intervals
+
+
+TEXT_TO_ALL = """
+帮我把这段文本转换成广播剧的台本，返回一个`json`对象，包含`roles`和`dialogs`两个数组。
+
+### roles
+
+文本中出现的所有角色，每个对象包含：
+
+`name`: 角色名
+`gender`: 角色性别，男或女
+`personality`: 角色性格，一句话概括
+`alias`: 角色名字未揭晓时旁白给出的一些称谓，类型为数组
+
+### dialogs
+
+按顺序把文本转换成对话，每个对象包含：
+
+`role`: 说话人。非对话内容作为`旁白`；人物的心理描写需要单独提取出来，用`人物(os)`表示
+`content`: 说话内容。你可以适当浓缩旁白的内容，但是对话内容不应随意更改
+`speed`: 用一个`1-5`（慢-快）的数字表示语速
+`emo`: 从 高兴、悲伤、惊讶、愤怒、恐惧、厌恶、冷静、严肃 中选一个表示主要情感，没有特别的情感可以为`null`
+`instruct`: 特别的语气，用一个与人物无关的词概括，如神秘、凶猛、好奇、优雅、孤独，没有则为`null`
+`interval`: 与下一句间隔的秒数。正常情况下为`1`，对话被打断时为`0`
+
+你也可以直接在`content`中插入下面的标签，以辅助语气的需要
+[breath] [noise] [laughter] [cough] [clucking] [accent] [quick_breath] [hissing] [sigh] [vocalized-noise] [lipsmack] [mn]
+<strong>, </strong>
+<laughter>, </laughter>
+
+### 返回格式及示例
+
+注意：你只需要返回一个json格式的对象，不需要任何其他输出！！！请返回全部内容，不要省略文本中的信息！！！
+
+```json
+{{
+    "roles": [
+        {{"name": "纳兰嫣然", "gender": "女", "personality": "高傲倔强", "alias": []}},
+        {{"name": "加刑天", "gender": "男", "personality": "老成持重", "alias": []}}
+    ],
+    "dialogs": [
+        {{"role": "旁白", "content": "纳兰嫣然明眸紧紧的盯着不远处那身子略显单薄的青年。", "speed": 3, "emo": null, "instruct": null, "interval": 1}},
+        {{"role": "纳兰嫣然(os)", "content": "他...真的变了。", "speed": 2, "emo": "惊讶", "instruct": null, "interval": 1}},
+        {{"role": "加刑天", "content": "<laughter>呵呵</laughter>，那便是萧家的那个小家伙？", "speed": 3, "emo": "惊讶", "instruct": "轻笑", "interval": 0}}
+    ]
+}}
+```
+
+### 文本
+
+{text}
+"""
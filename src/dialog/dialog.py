@@ -1,15 +1,24 @@
 from typing import List, Dict
 import json
+import re
 
-from ..utils.chat_model import ChatModel
+from ..utils.chat_model import ChatModel, AsyncChatModel
+from ..utils.json_parser import parse_json_array
+from .schema import SchemaError, validate_dialogs, validate_intervals
+from .interval import (
+    predict_intervals,
+    interval_pairs_prompt,
+    validate_interval_pairs,
+)
 
 
-def extract_dialog(text: str, model: ChatModel):
+def extract_dialog(text: str, model: ChatModel, max_continuations: int = 3):
     """
     从一段文本中提取对话信息，包含以下信息：
     Args:
         text (str): 文本
         model (str): openai 模型
+        max_continuations (int): 回复被截断时，最多对剩余文本续写的次数
     Returns:
         [{
             "role": 角色名（"旁白"或人物名或"<人物>(os)"）,
@@ -19,32 +28,153 @@ def extract_dialog(text: str, model: ChatModel):
             "instruct": 其他关于语气的描述
         }]
     """
-    dialogs = model.generate(
+    dialogs = []
+    for _ in range(max_continuations + 1):
+        response = model.generate(
+            TEXT_TO_DIALOG.format(text=text),
+            TEXT_TO_DIALOG_SYSTEM,
+            max_completion_tokens=16384,
+            return_type="text",
+        )
+        items, text = _parse_dialogs(response, text)
+        dialogs += items
+        if not text:
+            break
+    else:
+        _warn_discarded(text, max_continuations)
+    return _filter_dialogs(dialogs)
+
+
+async def extract_dialog_async(text: str, model: AsyncChatModel, max_continuations: int = 3):
+    """
+    extract_dialog 的异步版本
+    """
+    dialogs = []
+    for _ in range(max_continuations + 1):
+        response = await model.generate(
+            TEXT_TO_DIALOG.format(text=text),
+            TEXT_TO_DIALOG_SYSTEM,
+            max_completion_tokens=16384,
+            return_type="text",
+        )
+        items, text = _parse_dialogs(response, text)
+        dialogs += items
+        if not text:
+            break
+    else:
+        _warn_discarded(text, max_continuations)
+    return _filter_dialogs(dialogs)
+
+
+def extract_dialog_stream(text: str, model: ChatModel):
+    """
+    extract_dialog 的流式版本，每解析出一句对话就立即返回
+    Args:
+        text (str): 文本
+        model (str): openai 模型
+    Yields:
+        与 extract_dialog 返回的每个对象格式相同
+    """
+    for dialog in model.generate_stream(
         TEXT_TO_DIALOG.format(text=text),
         TEXT_TO_DIALOG_SYSTEM,
         max_completion_tokens=16384,
-        return_type="json",
+    ):
+        for dialog in validate_dialogs([dialog]):
+            if not _is_punctuation_only(dialog["content"]):
+                yield dialog
+
+
+def _parse_dialogs(response: str, text: str):
+    """
+    容错地解析对话数组
+    Returns:
+        dialogs (List[Dict]): 所有完整的对话
+        remaining (str): 回复被截断时尚未转换的文本，完整时为 None
+    """
+    dialogs, complete = parse_json_array(response)
+    if not dialogs and not complete:
+        raise SchemaError(f"No json array in response: {response[:100]}")
+    dialogs = validate_dialogs(dialogs)
+    if complete:
+        return dialogs, None
+    remaining = _remaining_text(text, dialogs)
+    if remaining:
+        print(
+            f"Warning: dialogs truncated after {len(dialogs)} items, "
+            f"continue with {len(remaining)} remaining characters"
+        )
+    return dialogs, remaining
+
+
+def _warn_discarded(text: str, max_continuations: int):
+    print(
+        f"Warning: dialogs still truncated after {max_continuations} continuations, "
+        f"discard {len(text)} remaining characters: {text[:50]}"
     )
-    # 筛掉只含符号的
-    def is_punctuation_only(text: str):
-        return all(
-            c in "，。！？,.!?"
-            for c in text
+
+
+def _remaining_text(text: str, dialogs: List[Dict]):
+    """
+    按顺序在原文中定位每句对话，返回最后一句之后的文本；
+    定位不到的句子按内容长度估计位置，宁可少量重复也不丢弃文本
+    """
+    tag_pattern = re.compile(r"\[[^\]]*\]|<[^>]*>")
+    cursor = 0
+    # 最后一次定位之后，未能定位的句子的总字数
+    unlocated = 0
+    for dialog in dialogs:
+        content = tag_pattern.sub("", dialog["content"]).strip()
+        # 旁白可能被浓缩，用句尾的一小段定位
+        key = content.rstrip(TRAILING_PUNCTUATION)[-12:]
+        pos = text.find(key, cursor) if key else -1
+        if pos >= 0:
+            cursor = pos + len(key)
+            unlocated = 0
+        else:
+            unlocated += len(content)
+    if unlocated:
+        estimate = min(len(text), cursor + unlocated)
+        print(
+            f"Warning: can not locate the last dialogs in the source text, "
+            f"estimate the truncation at character {estimate} of {len(text)}"
         )
+        cursor = estimate
+    while cursor < len(text) and text[cursor] in TRAILING_PUNCTUATION:
+        cursor += 1
+    return text[cursor:].strip()
+
+
+TRAILING_PUNCTUATION = "，。！？,.!?…~～”」』\"'"
 
+
+def _filter_dialogs(dialogs: List[Dict]):
+    # 筛掉只含符号的
     dialogs = [
         dialog for dialog in dialogs
-        if not is_punctuation_only(dialog["content"])   
+        if not _is_punctuation_only(dialog["content"])   
     ]
     return dialogs
 
 
-def gen_interval(dialogs: List[Dict], model: ChatModel):
+def _is_punctuation_only(text: str):
+    return all(
+        c in "，。！？,.!?"
+        for c in text
+    )
+
+
+def gen_interval(
+    dialogs: List[Dict], model: ChatModel = None, max_retries: int = 1, mode: str = "llm"
+):
     """
     生成对话之间的时间间隔
     Args:
         dialogs (List[Dict]): 对话列表
         model (str): openai 模型
+        max_retries (int): 返回数量与对话不一致时的重试次数，仍不一致时按内容对齐
+        mode (str): llm: 由大模型生成全部间隔; local: 按规则生成，不请求大模型;
+            hybrid: 按规则生成，只把规则无法确定的句子交给大模型
     Returns:
         [{
             "role": 当前说话的角色，与输入一致,
@@ -52,6 +182,96 @@ def gen_interval(dialogs: List[Dict], model: ChatModel):
             "interval": 与下一句间隔的秒数,
         }]
     """
+    if mode != "llm":
+        intervals, ambiguous = predict_intervals(dialogs)
+        if mode == "local" or not ambiguous:
+            return intervals
+        try:
+            values = model.generate(
+                interval_pairs_prompt(dialogs, ambiguous),
+                validate=lambda result: validate_interval_pairs(result, ambiguous),
+            )
+        except (SchemaError, ValueError) as e:
+            print(f"Warning: invalid intervals, keep local prediction: {e}")
+            values = {}
+        return _apply_intervals(intervals, values)
+
+    error = None
+    for _ in range(max_retries + 1):
+        try:
+            return model.generate(
+                _interval_prompt(dialogs),
+                validate=lambda intervals: validate_intervals(intervals, dialogs),
+            )
+        except SchemaError as e:
+            print(f"Warning: invalid intervals: {e}")
+            error = e
+    return _align_intervals(error.value, dialogs)
+
+
+async def gen_interval_async(
+    dialogs: List[Dict], model: AsyncChatModel = None, max_retries: int = 1, mode: str = "llm"
+):
+    """
+    gen_interval 的异步版本
+    """
+    if mode != "llm":
+        intervals, ambiguous = predict_intervals(dialogs)
+        if mode == "local" or not ambiguous:
+            return intervals
+        try:
+            values = await model.generate(
+                interval_pairs_prompt(dialogs, ambiguous),
+                validate=lambda result: validate_interval_pairs(result, ambiguous),
+            )
+        except (SchemaError, ValueError) as e:
+            print(f"Warning: invalid intervals, keep local prediction: {e}")
+            values = {}
+        return _apply_intervals(intervals, values)
+
+    error = None
+    for _ in range(max_retries + 1):
+        try:
+            return await model.generate(
+                _interval_prompt(dialogs),
+                validate=lambda intervals: validate_intervals(intervals, dialogs),
+            )
+        except SchemaError as e:
+            print(f"Warning: invalid intervals: {e}")
+            error = e
+    return _align_intervals(error.value, dialogs)
+
+
+def _apply_intervals(intervals: List[Dict], values: Dict[int, int]):
+    for idx, value in values.items():
+        intervals[idx]["interval"] = value
+    return intervals
+
+
+def _align_intervals(intervals, dialogs: List[Dict], default: int = 1):
+    """按内容把模型返回的间隔对齐到对话上，缺失的使用默认间隔"""
+    if not isinstance(intervals, list):
+        intervals = []
+    intervals = [
+        interval for interval in intervals
+        if isinstance(interval, dict) and isinstance(interval.get("interval"), (int, float))
+    ]
+    aligned = []
+    j = 0
+    for dialog in dialogs:
+        value = default
+        for k in range(j, len(intervals)):
+            if intervals[k].get("content") == dialog["content"]:
+                value = intervals[k]["interval"]
+                j = k + 1
+                break
+        aligned.append(
+            {"role": dialog["role"], "content": dialog["content"], "interval": value}
+        )
+    return aligned
+
+
+def _interval_prompt(dialogs: List[Dict]):
     dialogs = [
         {
             "role": dialog["role"],
@@ -59,13 +279,9 @@ def gen_interval(dialogs: List[Dict], model: ChatModel):
         }
         for dialog in dialogs
     ]
-
-    intervals = model.generate(
-        DIALOG_TO_INTERVAL.format(
-            dialogs=json.dumps(dialogs, indent=4, ensure_ascii=False)
-        ),
+    return DIALOG_TO_INTERVAL.format(
+        dialogs=json.dumps(dialogs, indent=4, ensure_ascii=False)
     )
-    return intervals
 
 
 TEXT_TO_DIALOG_SYSTEM = """
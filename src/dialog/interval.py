@@ -0,0 +1,156 @@
+from typing import List, Dict
+import json
+
+from .schema import SchemaError
+
+
+# 被打断：破折号结尾
+INTERRUPT_ENDINGS = ("——", "—", "--", "-")
+# 欲言又止：省略号结尾
+ELLIPSIS_ENDINGS = ("……", "…", "...", "。。。")
+# 引出对话的旁白，如 "萧炎淡淡道："
+LEAD_IN_ENDINGS = ("：", ":")
+# 完整的句末标点（含引号、括号）
+SENTENCE_ENDINGS = ("。", "！", "？", "!", "?", ".", "”", "」", "』", "\"", "'", "）", ")", "】")
+
+
+def predict_interval(dialog: Dict, next_dialog: Dict = None):
+    """
+    按规则预测一句对话与下一句之间的间隔
+    Args:
+        dialog (Dict): 当前对话
+        next_dialog (Dict): 下一句对话，None 表示最后一句
+    Returns:
+        interval (int): 间隔秒数
+        ambiguous (bool): 规则无法确定，可以交给大模型判断
+    """
+    if next_dialog is None:
+        return 1, False
+
+    content = _strip_tags(dialog["content"]).rstrip()
+    next_content = _strip_tags(next_dialog["content"]).lstrip()
+    role, next_role = dialog["role"], next_dialog["role"]
+    same_speaker = _speaker(role) == _speaker(next_role)
+
+    # 话被打断或下一句接着破折号、省略号续上，不停顿
+    if content.endswith(INTERRUPT_ENDINGS):
+        return 0, False
+    if next_content.startswith(INTERRUPT_ENDINGS + ELLIPSIS_ENDINGS):
+        return 0, False
+
+    # 旁白引出对话，紧接着说
+    if role == "旁白" and next_role != "旁白" and content.endswith(LEAD_IN_ENDINGS):
+        return 0, False
+
+    # 心理活动与说出口的话切换时留出停顿
+    if role.endswith("(os)") != next_role.endswith("(os)") and role != "旁白" and next_role != "旁白":
+        return 1, False
+
+    if content.endswith(ELLIPSIS_ENDINGS):
+        # 同一人停顿后继续说；换人时可能是被接话，也可能是沉默，交给大模型判断
+        return 1, not same_speaker
+
+    # 句子没说完就被拆开了
+    if not content.endswith(SENTENCE_ENDINGS):
+        return (0, False) if same_speaker else (1, True)
+
+    return 1, False
+
+
+def gen_interval_local(dialogs: List[Dict]):
+    """
+    按规则生成对话之间的时间间隔，不请求大模型
+    Returns:
+        同 gen_interval
+    """
+    intervals, _ = predict_intervals(dialogs)
+    return intervals
+
+
+def predict_intervals(dialogs: List[Dict]):
+    """
+    Returns:
+        intervals (List[Dict]): 同 gen_interval
+        ambiguous (List[int]): 规则无法确定的对话下标
+    """
+    intervals = []
+    ambiguous = []
+    for idx, dialog in enumerate(dialogs):
+        next_dialog = dialogs[idx + 1] if idx + 1 < len(dialogs) else None
+        value, unsure = predict_interval(dialog, next_dialog)
+        if unsure:
+            ambiguous.append(idx)
+        intervals.append(
+            {"role": dialog["role"], "content": dialog["content"], "interval": value}
+        )
+    return intervals, ambiguous
+
+
+def interval_pairs_prompt(dialogs: List[Dict], indices: List[int]):
+    """
+    只把规则无法确定的相邻两句发给大模型
+    """
+    pairs = [
+        {
+            "id": idx,
+            "role": dialogs[idx]["role"],
+            "content": dialogs[idx]["content"],
+            "next_role": dialogs[idx + 1]["role"],
+            "next_content": dialogs[idx + 1]["content"],
+        }
+        for idx in indices
+    ]
+    return DIALOG_PAIRS_TO_INTERVAL.format(
+        pairs=json.dumps(pairs, indent=4, ensure_ascii=False)
+    )
+
+
+def validate_interval_pairs(result: List[Dict], indices: List[int]):
+    """
+    校验大模型对相邻两句的判断，返回 id 到间隔的映射，缺失的 id 沿用规则的结果
+    """
+    if not isinstance(result, list):
+        raise SchemaError(f"Expect an interval array, got {type(result).__name__}")
+    values = {}
+    for item in result:
+        if (
+            isinstance(item, dict)
+            and item.get("id") in indices
+            and isinstance(item.get("interval"), (int, float))
+            and item["interval"] >= 0
+        ):
+            values[item["id"]] = item["interval"]
+    return values
+
+
+def _speaker(role: str):
+    return role[:-4] if role.endswith("(os)") else role
+
+
+def _strip_tags(content: str):
+    # 去掉结尾的 </strong> 等标签再判断标点
+    while content.endswith(">") and "<" in content:
+        content = content[: content.rfind("<")].rstrip()
+    return content
+
+
+DIALOG_PAIRS_TO_INTERVAL = """
+下面是一段音频中相邻的两句对话，`role`/`content` 是当前这句，`next_role`/`next_content` 是下一句。
+{pairs}
+
+请你判断每组两句之间间隔的时间（单位为秒）。
+
+注意：对话被打断或紧接着回应时应当设置停顿为`0`，正常情况下相隔`1`，沉默、犹豫时可以更长。
+
+注意：你只需要返回一个json格式的数组，不需要任何其他输出！！！
+
+返回格式如下定义
+
+[
+    {{
+        "id": 与输入一致,
+        "interval": 与下一句间隔的秒数
+    }},
+    ...
+]
+"""
@@ -0,0 +1,182 @@
+from typing import Dict, List
+import bisect
+import copy
+import json
+import os
+
+
+# 固定旁白
+NARRATOR = {"name": "旁白", "gender": "男", "personality": "冷静客观平淡", "alias": []}
+
+
+class RoleRegistry:
+    """
+    整本书的角色表，跨分块累积角色的名字、称谓、性别和性格
+
+    名字和称谓都可以用来查找角色，查不到时按前缀匹配，如 "萧炎哥哥" -> "萧炎"、"纳兰" -> "纳兰嫣然"，
+    已知名字后只能跟敬称或括号标注，"萧炎的父亲" 不会匹配到 "萧炎"
+    Args:
+        registry_file (str): 持久化文件，存在时自动载入
+    """
+
+    # 前缀匹配的最短长度，避免单字误匹配
+    MIN_PREFIX = 2
+    # 已知名字后可以跟的敬称，其余后缀（如 "的父亲"）可能是另一个人
+    HONORIFICS = {
+        "哥", "哥哥", "大哥", "姐", "姐姐", "大姐", "弟", "弟弟", "妹", "妹妹", "兄", "老弟",
+        "师兄", "师姐", "师弟", "师妹", "前辈", "老师", "大师", "先生", "公子", "少爷",
+        "小姐", "姑娘", "夫人", "大人", "殿下", "阁下", "陛下", "长老",
+    }
+
+    def __init__(self, registry_file: str = None):
+        self.registry_file = registry_file
+        self.roles: Dict[str, Dict] = {}
+        # 名字/称谓 -> 角色名
+        self._lookup: Dict[str, str] = {}
+        # 排序后的名字/称谓，用于二分查找前缀
+        self._keys: List[str] = []
+        if registry_file and os.path.exists(registry_file):
+            with open(registry_file, "r") as f:
+                self.update(json.load(f))
+
+    def __len__(self):
+        return len(self.roles)
+
+    def __contains__(self, name: str):
+        return self.resolve(name) is not None
+
+    def __getitem__(self, name: str):
+        role = self.resolve(name)
+        if role is None:
+            raise KeyError(name)
+        return role
+
+    def resolve(self, name: str):
+        """
+        按名字、称谓或前缀查找角色，找不到返回 None
+        """
+        if name == NARRATOR["name"]:
+            return NARRATOR
+        canonical = self._lookup.get(name)
+        if canonical is None:
+            canonical = self._match_prefix(name)
+        return self.roles.get(canonical) if canonical is not None else None
+
+    def update(self, roles: List[Dict]):
+        """
+        合并新提取的角色，返回新增或发生变化的角色
+        Args:
+            roles (List[Dict]): 角色列表，gender 为 None 时保留已知的性别
+        Returns:
+            changed (List[Dict]): 合并后的角色
+        """
+        changed = []
+        for role in roles:
+            name = role["name"]
+            if name == NARRATOR["name"]:
+                continue
+            # 模型可能用称谓返回已知角色，前缀相同的可能是不同角色，不做合并
+            name = self._lookup.get(name, name)
+            if name not in self.roles:
+                self.roles[name] = {
+                    "name": name,
+                    "gender": role.get("gender") or "男",
+                    "personality": role.get("personality"),
+                    "alias": [],
+                }
+                updated = True
+            else:
+                updated = self._merge(self.roles[name], role)
+            for alias in [role["name"]] + list(role.get("alias") or []):
+                updated = self._add_alias(name, alias) or updated
+            self._index(name, name)
+            if updated:
+                changed.append(copy.deepcopy(self.roles[name]))
+        return changed
+
+    def chunk_roles(self, roles: List[Dict], text: str):
+        """
+        分块的完整角色列表：本次提取到的角色，加上名字或称谓在文本中出现的已知角色
+        Args:
+            roles (List[Dict]): 本次提取到的角色
+            text (str): 分块文本
+        Returns:
+            roles (List[Dict]): 角色表中合并后的角色
+        """
+        names = []
+        for role in roles:
+            name = self._lookup.get(role["name"])
+            if name is not None and name not in names:
+                names.append(name)
+        for key in self._keys:
+            name = self._lookup[key]
+            if name not in names and key in text:
+                names.append(name)
+        return [copy.deepcopy(self.roles[name]) for name in names]
+
+    def save(self, registry_file: str = None):
+        registry_file = registry_file or self.registry_file
+        tmp_file = registry_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(list(self.roles.values()), f, indent=4, ensure_ascii=False)
+        os.replace(tmp_file, registry_file)
+
+    def to_prompt(self):
+        """
+        已知角色的紧凑表示，每行 名字|性别|称谓
+        """
+        return "\n".join(
+            f"{role['name']}|{role['gender']}|{','.join(role['alias'])}"
+            for role in self.roles.values()
+        )
+
+    def _merge(self, known: Dict, role: Dict):
+        updated = False
+        gender = role.get("gender")
+        if gender and gender != known["gender"]:
+            print(f"Warning: gender of {known['name']} changed: {known['gender']} -> {gender}")
+            known["gender"] = gender
+            updated = True
+        personality = role.get("personality")
+        if personality and not known["personality"]:
+            known["personality"] = personality
+            updated = True
+        return updated
+
+    def _add_alias(self, name: str, alias: str):
+        if not alias or alias == name or alias == NARRATOR["name"]:
+            return False
+        # 称谓已属于其他角色时保留原有的归属
+        if self._lookup.get(alias, name) != name:
+            return False
+        if alias in self.roles[name]["alias"]:
+            return False
+        self.roles[name]["alias"].append(alias)
+        self._index(alias, name)
+        return True
+
+    def _index(self, key: str, name: str):
+        if key not in self._lookup:
+            bisect.insort(self._keys, key)
+        self._lookup[key] = name
+
+    def _match_prefix(self, name: str):
+        if len(name) < self.MIN_PREFIX:
+            return None
+        # 已知名字是查询的前缀且后面是敬称或括号标注（如 "(os)"），取最长的
+        for end in range(len(name) - 1, self.MIN_PREFIX - 1, -1):
+            rest = name[end:]
+            if rest not in self.HONORIFICS and not rest.startswith(("(", "（")):
+                continue
+            canonical = self._lookup.get(name[:end])
+            if canonical is not None:
+                return canonical
+        # 查询是已知名字的前缀，只有唯一对应的角色时才采用
+        candidates = set()
+        i = bisect.bisect_left(self._keys, name)
+        while i < len(self._keys) and self._keys[i].startswith(name):
+            candidates.add(self._lookup[self._keys[i]])
+            i += 1
+        if len(candidates) == 1:
+            return candidates.pop()
+        return None
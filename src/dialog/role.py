@@ -1,12 +1,17 @@
-from ..utils.chat_model import ChatModel
+from functools import partial
 
+from ..utils.chat_model import ChatModel, AsyncChatModel
+from .registry import RoleRegistry
+from .schema import validate_roles
 
-def extract_role(text: str, model: ChatModel):
+
+def extract_role(text: str, model: ChatModel, registry: RoleRegistry = None):
     """
         从一段文本中提取角色信息，包含以下信息：
         Args:
             text (str): 文本
             model (str): openai 模型
+            registry (RoleRegistry): 整本书的角色表，非空时只让模型提取新角色和需要修正的已知角色，并合并到角色表中
         Returns:
             [{
                 "name": 角色名,
@@ -14,13 +19,54 @@ def extract_role(text: str, model: ChatModel):
                 "personality": 角色性格，一句话概括,
                 "alias": [角色名字未揭晓时旁白给出的一些称谓，类型为数组]
             }]
+        有角色表时返回该分块用到的全部角色（以角色表中合并后的信息为准）
     """
+    prompt, validate = _role_prompt(text, registry)
     roles = model.generate(
-        TEXT_TO_ROLE.format(text=text),
+        prompt,
+        TEXT_TO_ROLE_SYSTEM,
+        return_type='json',
+        validate=validate,
+    )
+    return merge_roles(roles, text, registry)
+
+
+async def extract_role_async(
+    text: str, model: AsyncChatModel, registry: RoleRegistry = None, merge: bool = True
+):
+    """
+        extract_role 的异步版本
+        merge 为 False 时角色表只用于提示词，直接返回模型给出的增量，由调用方用 merge_roles 合并
+    """
+    prompt, validate = _role_prompt(text, registry)
+    roles = await model.generate(
+        prompt,
         TEXT_TO_ROLE_SYSTEM,
-        return_type='json'
+        return_type='json',
+        validate=validate,
+    )
+    return merge_roles(roles, text, registry) if merge else roles
+
+
+def merge_roles(roles, text: str, registry: RoleRegistry = None):
+    """
+    把模型返回的角色增量合并到角色表，返回分块的完整角色列表
+    """
+    if registry is None:
+        return roles
+    # 模型只返回增量，合并后按角色表补全分块的角色列表，role_{i}.json 仍是完整的
+    registry.update(roles)
+    return registry.chunk_roles(roles, text)
+
+
+def _role_prompt(text: str, registry: RoleRegistry = None):
+    if registry is None or len(registry) == 0:
+        return TEXT_TO_ROLE.format(text=text), validate_roles
+    # 已知角色只发送紧凑的列表，性别缺失时沿用角色表中的性别
+    return (
+        TEXT_TO_ROLE_DELTA.format(known=registry.to_prompt(), text=text),
+        partial(validate_roles, default_gender=None),
     )
-    return roles
 
 TEXT_TO_ROLE_SYSTEM = """
 你是一个擅长阅读小说的帮手，能够梳理出小说片段中人物信息
@@ -52,3 +98,34 @@ TEXT_TO_ROLE = """
 
 {text}
 """
+
+TEXT_TO_ROLE_DELTA = """
+下面是已知的角色，每行格式为 名字|性别|称谓（多个称谓用逗号分隔）：
+
+{known}
+
+帮我找出这段文本中出现的新角色，以及需要修正或补充的已知角色（如性别有误、出现了新的称谓），包含以下信息：
+
+`name`: 角色名，已知角色使用上面的名字
+`gender`: 角色性别，男或女
+`personality`: 角色性格，一句话概括
+`alias`: 角色名字未揭晓时旁白给出的一些称谓，类型为数组，已知角色只需要给出新的称谓
+
+注意：已知且没有变化的角色不要返回，没有需要返回的角色时返回 []。你只需要返回一个json格式的数组，不需要任何其他输出！！！
+
+返回示例如下
+
+[
+    {{
+        "name": "纳兰嫣然",
+        "gender": "女",
+        "personality": "高傲倔强",
+        "alias": [],
+    }},
+    ...
+]
+
+文本：
+
+{text}
+"""
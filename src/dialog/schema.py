@@ -0,0 +1,69 @@
+from typing import List, Dict
+
+
+class SchemaError(ValueError):
+    def __init__(self, message: str, value=None):
+        super().__init__(message)
+        # 不合法的原始结果，便于调用方尽量修复
+        self.value = value
+
+
+def validate_dialogs(dialogs: List[Dict]):
+    """
+    校验 extract_dialog 的输出，补全缺省字段，丢弃缺少 role 或 content 的对象
+    """
+    if not isinstance(dialogs, list):
+        raise SchemaError(f"Expect a dialog array, got {type(dialogs).__name__}")
+    valid = []
+    for dialog in dialogs:
+        if (
+            not isinstance(dialog, dict)
+            or not isinstance(dialog.get("role"), str)
+            or not isinstance(dialog.get("content"), str)
+        ):
+            print(f"Warning: drop invalid dialog: {dialog}")
+            continue
+        speed = dialog.get("speed")
+        dialog["speed"] = min(max(speed, 1), 5) if isinstance(speed, int) else 3
+        dialog.setdefault("emo", None)
+        dialog.setdefault("instruct", None)
+        valid.append(dialog)
+    return valid
+
+
+def validate_roles(roles: List[Dict], default_gender: str = "男"):
+    """
+    校验 extract_role 的输出，补全缺省字段，丢弃缺少 name 的对象
+    Args:
+        default_gender (str): 性别缺失时的默认值，增量提取时为 None，保留角色表中已知的性别
+    """
+    if not isinstance(roles, list):
+        raise SchemaError(f"Expect a role array, got {type(roles).__name__}")
+    valid = []
+    for role in roles:
+        if not isinstance(role, dict) or not isinstance(role.get("name"), str):
+            print(f"Warning: drop invalid role: {role}")
+            continue
+        if role.get("gender") not in ("男", "女"):
+            role["gender"] = default_gender
+        role.setdefault("personality", None)
+        if not isinstance(role.get("alias"), list):
+            role["alias"] = []
+        valid.append(role)
+    return valid
+
+
+def validate_intervals(intervals: List[Dict], dialogs: List[Dict]):
+    """
+    校验 gen_interval 的输出，数量必须与对话一一对应
+    """
+    if not isinstance(intervals, list):
+        raise SchemaError(f"Expect an interval array, got {type(intervals).__name__}")
+    if len(intervals) != len(dialogs):
+        raise SchemaError(
+            f"Expect {len(dialogs)} intervals, got {len(intervals)}", intervals
+        )
+    for interval in intervals:
+        if not isinstance(interval, dict) or not isinstance(interval.get("interval"), (int, float, type(None))):
+            raise SchemaError(f"Invalid interval: {interval}", intervals)
+    return intervals
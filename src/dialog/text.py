@@ -1,13 +1,39 @@
 import os
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 from ..utils.chat_model import ChatModel
+from ..utils.tokenizer import Tokenizer
 
 
 def split_text(
     text_file: str,
     model: ChatModel=None,
-    max_chunk_lines=50,
+    max_chunk_lines=None,
+    max_input_tokens=6000,
+    max_output_tokens=12000,
+    method="local",
+    refine=False,
+    max_workers=8,
+    tokenizer: Tokenizer=None,
 ):
+    """
+    将文本切分成若干块，每块写入一个文件，并在块目录旁写出每块的 token 预估报告
+    Args:
+        text_file (str): 文本文件
+        model (ChatModel): 对话模型，method="llm" 或 refine=True 时需要
+        max_chunk_lines (int): 每块最多行数，为 None 时只按 token 预算切分（method="llm" 时默认 50）
+        max_input_tokens (int): 每块文本最多的输入 token 数
+        max_output_tokens (int): 每块提取对话时预计最多的输出 token 数，应小于 max_completion_tokens
+        method (str): "local" 按章节标题、分隔符、空行和对话密度本地切分；"llm" 逐段询问模型
+        refine (bool): 本地切分后，是否并行询问模型微调每个切分点
+        max_workers (int): 微调切分点时的最大并发数
+        tokenizer (Tokenizer): 用于计算 token 数，默认按 gpt-4o 词表
+    Returns:
+        chunk_files (List[str]): 每块对应的文件
+    """
     with open(text_file, "r") as f:
         text = f.read()
 
@@ -21,11 +47,79 @@ def split_text(
             os.path.join(chunk_dir, f"{i}.txt") for i in range(len(os.listdir(chunk_dir)))
         ]
 
+    tokenizer = tokenizer or Tokenizer()
+    if method == "llm":
+        assert model is not None, "Please provide a model"
+        merged_chunks = _split_lines_llm(text.splitlines(), model, max_chunk_lines or 50)
+    elif method == "local":
+        lines, scores = _score_lines(text.splitlines())
+        lines, scores = _split_long_lines(
+            lines, scores, tokenizer, max_input_tokens, max_output_tokens
+        )
+        budget = _Budget(
+            [_line_cost(line, tokenizer) for line in lines],
+            max_chunk_lines,
+            max_input_tokens,
+            max_output_tokens,
+        )
+        boundaries = _pack_lines(scores, budget)
+        if refine:
+            assert model is not None, "Please provide a model"
+            boundaries = _refine_boundaries(lines, boundaries, model, budget, max_workers)
+        merged_chunks = [
+            lines[start:end] for start, end in zip([0] + boundaries, boundaries + [len(lines)])
+        ]
+    else:
+        raise ValueError(f"Unknown split method: {method}")
 
-    assert model is not None, "Please provide a model"
     os.makedirs(chunk_dir, exist_ok=True)
+    chunk_files = []
+    for i, chunk in enumerate(merged_chunks):
+        chunk_file = os.path.join(chunk_dir, f"{i}.txt")
+        chunk_files.append(chunk_file)
+        with open(chunk_file, "w") as f:
+            f.write("\n".join(chunk))
+
+    report = chunk_token_report(chunk_files, tokenizer)
+    with open(os.path.join(text_dir, f"{text_name}_tokens.json"), "w") as f:
+        json.dump(report, f, indent=4, ensure_ascii=False)
+    for i, item in enumerate(report):
+        print(
+            f"Chunk[{i}]: {item['lines']} lines, {item['input_tokens']} input tokens, "
+            f"~{item['output_tokens']} output tokens in {item['chunk_file']}"
+        )
+    return chunk_files
+
+
+def chunk_token_report(chunk_files: List[str], tokenizer: Tokenizer=None):
+    """
+    统计每块的行数、输入 token 数和预计提取对话的输出 token 数
+    Returns:
+        [{
+            "chunk_file": 块文件,
+            "lines": 行数,
+            "input_tokens": 输入 token 数（不含提示词）,
+            "output_tokens": 预计输出 token 数
+        }]
+    """
+    tokenizer = tokenizer or Tokenizer()
+    report = []
+    for chunk_file in chunk_files:
+        with open(chunk_file, "r") as f:
+            lines = f.read().splitlines()
+        costs = [_line_cost(line, tokenizer) for line in lines]
+        report.append(
+            {
+                "chunk_file": chunk_file,
+                "lines": len(lines),
+                "input_tokens": sum(c[0] for c in costs),
+                "output_tokens": sum(c[1] for c in costs),
+            }
+        )
+    return report
+
 
-    text_lines = text.splitlines()
+def _split_lines_llm(text_lines: List[str], model: ChatModel, max_chunk_lines: int):
     text_lines = [line for line in text_lines if line.strip()]
 
     start = 0
@@ -54,14 +148,229 @@ def split_text(
             last_chunk = chunk
         else:
             last_chunk += chunk
-    chunk_files = []
-    for i, chunk in enumerate(merged_chunks):
-        chunk_file = os.path.join(chunk_dir, f"{i}.txt")
-        chunk_files.append(chunk_file)
-        with open(chunk_file, "w") as f:
-            f.write("\n".join(chunk))
-        print(f"Chunk[{i}]: {len(chunk)} lines in {chunk_file}")
-    return chunk_files
+    return merged_chunks
+
+
+# 章节标题，如 "第十二章 xxx"、"Chapter 3"
+HEADING_PATTERN = re.compile(
+    r"^\s*(第[0-9零一二三四五六七八九十百千万两]+[章回节卷集部篇]|chapter\s*\d+|序章|楔子|引子|尾声|番外)",
+    re.IGNORECASE,
+)
+# 场景分隔符，如 "***"、"———"、"＊＊＊"、"分割线"
+SCENE_BREAK_PATTERN = re.compile(r"^\s*([*＊·•\-—=～~#◇◆○●☆★]\s*){3,}$|^\s*[-—=]*\s*分割线\s*[-—=]*\s*$")
+QUOTE_CHARS = "“”「」『』\""
+
+
+def _score_lines(raw_lines: List[str]):
+    """
+    去掉空行和分隔符，并给每一行之前的位置打分，分数越高越适合作为切分点
+    Returns:
+        lines (List[str]): 保留的文本行
+        scores (List[float]): scores[i] 表示在 lines[i] 之前切分的得分
+    """
+    lines = []
+    gaps = []
+    breaks = []
+    gap, scene_break = 0, False
+    for line in raw_lines:
+        if not line.strip():
+            gap += 1
+        elif SCENE_BREAK_PATTERN.match(line):
+            scene_break = True
+        else:
+            lines.append(line)
+            gaps.append(gap)
+            breaks.append(scene_break)
+            gap, scene_break = 0, False
+
+    # 有的文本每段之间都有空行，只有多于常见空行数的才算分段
+    common_gap = sorted(gaps)[len(gaps) // 2] if gaps else 0
+
+    is_dialog = [any(c in QUOTE_CHARS for c in line) for line in lines]
+    scores = []
+    for i, line in enumerate(lines):
+        score = 0.0
+        if HEADING_PATTERN.match(line):
+            score += 10
+        if breaks[i]:
+            score += 8
+        if gaps[i] > common_gap:
+            score += min(gaps[i] - common_gap, 3)
+        if i > 0 and is_dialog[i - 1] and is_dialog[i]:
+            # 不要在连续的对话中间切开
+            score -= 3
+        elif i > 0 and is_dialog[i - 1] and not is_dialog[i]:
+            score += 1
+        scores.append(score)
+    return lines, scores
+
+
+# 每句对话 json 中 role/speed/emo/instruct 等字段的额外输出 token 数
+DIALOG_TOKEN_OVERHEAD = 40
+# 对话内容的输出 token 数与原文的比例，旁白可能被浓缩，标签和转义会增加一些
+OUTPUT_TOKEN_RATIO = 1.1
+SENTENCE_END_PATTERN = re.compile(r"(?<=[。！？!?…；;])(?![”」』\"])")
+
+
+def _line_cost(line: str, tokenizer: Tokenizer):
+    """
+    Returns:
+        input_tokens (int): 输入 token 数
+        output_tokens (int): 预计提取对话后输出的 token 数
+    """
+    tokens = tokenizer.count(line)
+    # 一行中每段引号内容和其间的旁白各成为一句对话
+    n_dialogs = 1 + 2 * sum(line.count(c) for c in "“「『")
+    return tokens, int(tokens * OUTPUT_TOKEN_RATIO) + n_dialogs * DIALOG_TOKEN_OVERHEAD
+
+
+def _split_long_lines(lines, scores, tokenizer, max_input_tokens, max_output_tokens):
+    """把单行就超出预算的长段落按句子拆成多行"""
+    new_lines, new_scores = [], []
+    for line, score in zip(lines, scores):
+        in_tokens, out_tokens = _line_cost(line, tokenizer)
+        if in_tokens <= max_input_tokens and out_tokens <= max_output_tokens:
+            new_lines.append(line)
+            new_scores.append(score)
+            continue
+        # 按句子装填，每行占预算的一半以内，方便与前后文拼成一块
+        pieces = []
+        piece = ""
+        for sentence in SENTENCE_END_PATTERN.split(line):
+            in_tokens, out_tokens = _line_cost(piece + sentence, tokenizer)
+            if piece and (in_tokens > max_input_tokens / 2 or out_tokens > max_output_tokens / 2):
+                pieces.append(piece)
+                piece = sentence
+            else:
+                piece += sentence
+        if piece:
+            pieces.append(piece)
+        new_lines.extend(pieces)
+        # 拆出的第一行保留原来的得分，尽量不在段落内部切分
+        new_scores.extend([score] + [-1] * (len(pieces) - 1))
+    return new_lines, new_scores
+
+
+class _Budget:
+    """用前缀和快速计算任意区间 [start, end) 的 token 数，并判断是否超出预算"""
+
+    def __init__(self, costs, max_lines, max_input_tokens, max_output_tokens):
+        self.max_lines = max_lines
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.input_prefix = [0]
+        self.output_prefix = [0]
+        for in_tokens, out_tokens in costs:
+            self.input_prefix.append(self.input_prefix[-1] + in_tokens)
+            self.output_prefix.append(self.output_prefix[-1] + out_tokens)
+
+    def fill(self, start: int, end: int):
+        """区间占预算的比例，大于 1 表示超出预算"""
+        fill = max(
+            (self.input_prefix[end] - self.input_prefix[start]) / self.max_input_tokens,
+            (self.output_prefix[end] - self.output_prefix[start]) / self.max_output_tokens,
+        )
+        if self.max_lines:
+            fill = max(fill, (end - start) / self.max_lines)
+        return fill
+
+    def fits(self, start: int, end: int):
+        return end - start <= 1 or self.fill(start, end) <= 1
+
+
+def _pack_lines(scores: List[float], budget: _Budget, min_fill: float = 0.5):
+    """
+    贪心地装填每一块，超出预算时在本块后半部分得分最高的位置切分
+    Returns:
+        boundaries (List[int]): 切分点，即每块（除第一块外）起始行的下标
+    """
+    boundaries = []
+    start = 0
+    for i in range(len(scores)):
+        if i == start:
+            continue
+        full = not budget.fits(start, i + 1)
+        # 章节标题处直接切分，除非当前块太短
+        heading = scores[i] >= 10 and budget.fill(start, i) >= min_fill / 2
+        if full or heading:
+            cut = i if heading and not full else _best_cut(scores, budget, start, i, min_fill)
+            boundaries.append(cut)
+            start = cut
+            # 第 i 行很长时，切分点之后的几行加上它仍可能超出预算，在第 i 行前再切一次
+            if not budget.fits(start, i + 1):
+                boundaries.append(i)
+                start = i
+    return boundaries
+
+
+def _best_cut(scores, budget: _Budget, start, end, min_fill):
+    """
+    在 (start, end] 中选择切分点，只考虑本块不超出预算且装到 min_fill 以上的位置，
+    都装不到 min_fill 时取不超出预算的最后一个位置
+    """
+    best, best_score = None, float("-inf")
+    last_fit = start + 1
+    target = min_fill * min(budget.fill(start, end), 1)
+    for cut in range(start + 1, end + 1):
+        if not budget.fits(start, cut):
+            break
+        last_fit = cut
+        if budget.fill(start, cut) < target:
+            continue
+        # 同分时优先靠后的位置，使块尽可能大
+        score = scores[cut] if cut < len(scores) else 0
+        score += 0.01 * (cut - start) / (end - start)
+        if score >= best_score:
+            best, best_score = cut, score
+    return best if best is not None else last_fit
+
+
+def _refine_boundaries(
+    lines: List[str],
+    boundaries: List[int],
+    model: ChatModel,
+    budget: _Budget,
+    max_workers: int,
+    window: int = 8,
+):
+    """
+    并行询问模型在每个切分点附近选出最合适的位置，结果不合法时保留本地切分点
+    """
+    def refine(k):
+        boundary = boundaries[k]
+        lo = max(boundaries[k - 1] + 1 if k > 0 else 1, boundary - window)
+        hi = min(boundaries[k + 1] - 1 if k + 1 < len(boundaries) else len(lines) - 1, boundary + window)
+        if hi <= lo:
+            return boundary
+        try:
+            res = model.generate(
+                TEXT_TO_BOUNDARY.format(
+                    n=hi - lo + 1,
+                    text="\n".join(
+                        f"[{j - lo + 1}] {lines[j]}" for j in range(lo, hi + 1)
+                    ),
+                ),
+                return_type="json",
+            )
+            return lo + int(res["line"]) - 1
+        except Exception as e:
+            print(f"Warning: refine boundary {boundary} failed: {e}")
+            return boundary
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        proposed = list(executor.map(refine, range(len(boundaries))))
+
+    refined = []
+    for k, boundary in enumerate(proposed):
+        start = refined[-1] if refined else 0
+        end = boundaries[k + 1] if k + 1 < len(boundaries) else len(lines)
+        valid = (
+            start < boundary < end
+            and budget.fits(start, boundary)
+            and budget.fits(boundary, end)
+        )
+        refined.append(boundary if valid else boundaries[k])
+    return refined
 
 
 def _gen_split(lines: list[str], model: ChatModel):
@@ -104,3 +413,20 @@ TEXT_TO_CHUNKS = """
 
 {text}
 """
+
+
+TEXT_TO_BOUNDARY = """
+下面是一段小说文本，共`{n}`行，每行开头标有行号。我需要把文本切分成前后两部分，分别制作成两集广播剧。
+
+请你选出第二部分开始的行号，使得前后两部分在语义上尽量独立，如场景、时间或视角发生变化的位置。不要在人物的连续对话中间切分。
+
+注意：你只需要返回一个`json`格式的对象，不要返回其他任何内容！！！
+
+{{
+    "line": 第二部分第一行的行号
+}}
+
+下面是文本：
+
+{text}
+"""
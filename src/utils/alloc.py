@@ -1,24 +1,90 @@
 from typing import List, Dict
+import heapq
+from collections import OrderedDict
 
 
 class LRUAllocator:
-    def __init__(self, candidates: List[str], allocated: Dict[str, str] = {}):
+    """
+    从有限的候选值中为 key 分配值，候选值用完时回收最久未使用的 key 的值
+    Args:
+        candidates (List[str]): 候选值
+        allocated (Dict[str, str]): 已分配的 key 到值的映射，按从旧到新的使用顺序
+        protect_top (int): 使用次数最多的前 N 个 key 不会被回收（如台词最多的角色）
+        counts (Dict[str, int]): 各 key 的使用次数
+    """
+
+    # to_dict 最多保存的未分配 key 的使用次数
+    MAX_SAVED_COUNTS = 1000
+
+    def __init__(
+        self,
+        candidates: List[str],
+        allocated: Dict[str, str] = None,
+        protect_top: int = 0,
+        counts: Dict[str, int] = None,
+    ):
         self.candidates = candidates
-        self.allocated = allocated
-        self.free = [v for v in candidates if v not in allocated]
-        self.tracks = []
+        self.protect_top = protect_top
+        self.counts = dict(counts or {})
+        # key -> 值，顺序即使用顺序，最近使用的在末尾
+        self.allocated = OrderedDict()
+        # 值 -> 使用该值的 key（别名与角色名共用一个值）
+        self._owners = {}
+        for key, value in (allocated or {}).items():
+            self._assign(key, value)
+        self.free = [v for v in candidates if v not in self._owners]
 
     def get(self, key: str):
-        if key not in self.allocated:
+        if key in self.allocated:
+            self.allocated.move_to_end(key)
+        else:
             self._alloc(key)
-        if key in self.tracks:
-            self.tracks.remove(key)
-        self.tracks.insert(0, key)
+        self.counts[key] = self.counts.get(key, 0) + 1
         return self.allocated[key]
 
+    def to_dict(self):
+        """
+        导出完整状态（含使用顺序），可以 json 序列化，用 from_dict 恢复
+        """
+        # 被回收的 key 重新分配后继续累计使用次数，只保留使用最多的，避免状态无限增长
+        kept = set(self.allocated) | set(
+            heapq.nlargest(self.MAX_SAVED_COUNTS, self.counts, key=self.counts.get)
+        )
+        return {
+            "allocated": dict(self.allocated),
+            "counts": {key: count for key, count in self.counts.items() if key in kept},
+        }
+
+    @classmethod
+    def from_dict(cls, candidates: List[str], state: Dict, protect_top: int = 0):
+        # 音源目录变化后，不再存在的候选值需要重新分配
+        allocated = {k: v for k, v in state.get("allocated", {}).items() if v in candidates}
+        return cls(candidates, allocated, protect_top, state.get("counts"))
+
     def _alloc(self, key: str):
-        if len(self.allocated) >= len(self.candidates):
-            value = self.allocated[self.tracks.pop()]
-        else:
+        if self.free:
             value = self.free.pop()
+        else:
+            value = self.allocated[self._victim()]
+            for owner in self._owners.pop(value):
+                del self.allocated[owner]
+        self._assign(key, value)
+
+    def _victim(self):
+        # 至少留一个可回收的值
+        top = min(self.protect_top, len(self._owners) - 1)
+        protected = set()
+        if top > 0:
+            for value in heapq.nlargest(top, self._owners, key=self._value_count):
+                protected.add(value)
+        for key, value in self.allocated.items():
+            if value not in protected:
+                return key
+        return next(iter(self.allocated))
+
+    def _value_count(self, value: str):
+        return max(self.counts.get(owner, 0) for owner in self._owners[value])
+
+    def _assign(self, key: str, value: str):
         self.allocated[key] = value
+        self._owners.setdefault(value, set()).add(key)
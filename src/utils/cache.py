@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的单文件响应缓存，以内容哈希为键
+    Args:
+        db_file (str): 缓存数据库文件
+        max_entries (int): 最多保留的条目数，超出时按最近访问时间淘汰
+        max_bytes (int): 最多保留的字节数，超出时按最近访问时间淘汰
+        max_age (float): 条目最长保留时间（秒），过期视为未命中
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        max_entries: int = None,
+        max_bytes: int = None,
+        max_age: float = None,
+    ):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.dirname(db_file):
+            os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        # sqlite 连接不能跨线程使用，每个线程单独建立连接
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conn().execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn().execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+
+    @staticmethod
+    def make_key(*parts, **kwargs):
+        payload = json.dumps(
+            [parts, kwargs], sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+            self._conn().execute("DELETE FROM responses WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._conn().execute(
+            "UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?",
+            (now, key),
+        )
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), now, now),
+        )
+        self.evict()
+
+    def evict(self):
+        conn = self._conn()
+        if self.max_age is not None:
+            conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+            )
+        if self.max_entries is not None:
+            conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC, rowid DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            # 从最近访问的条目开始累加，超出上限的部分全部淘汰
+            conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (ORDER BY accessed DESC, rowid DESC) AS total
+                        FROM responses
+                    ) WHERE total > ?
+                )
+                """,
+                (self.max_bytes,),
+            )
+
+    def stats(self):
+        entries, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        self._conn().execute("DELETE FROM responses")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None 即自动提交，配合 WAL 支持多进程并发读写
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
@@ -1,6 +1,15 @@
 from abc import ABC, abstractmethod
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError
+import asyncio
+import copy
 import json
+import os
+import threading
+
+from .cache import ResponseCache
+from .json_parser import extract_json, JSONArrayStream
+from .rate_limit import RetryPolicy
+from .tokenizer import estimate_tokens
 
 
 class ChatModel(ABC):
@@ -10,39 +19,390 @@ class ChatModel(ABC):
         prompt: str,
         system="You are a helpful assistant.",
         return_type="json",
+        validate=None,
         **kwargs,
-    ): ...
+    ):
+        """
+        Args:
+            prompt: 用户输入
+            system: 系统提示词
+            return_type: "json" 时解析回复中的 json，否则返回原文
+            validate: 校验解析后的结果，抛出异常时不写入缓存
+        """
+        ...
+
+    def generate_stream(
+        self,
+        prompt: str,
+        system="You are a helpful assistant.",
+        **kwargs,
+    ):
+        """
+        流式生成 json 数组，数组中每个元素完整后立即返回
+        默认实现等待完整回复后逐个返回，支持流式输出的模型应重写此方法
+        """
+        yield from self.generate(prompt, system, return_type="json", **kwargs)
 
 
 class OpenAIChatModel(ChatModel):
-    def __init__(self, model_name="gpt-4o", base_url=None, api_key=None):
-        self.model = OpenAI(base_url=base_url, api_key=api_key)
+    def __init__(
+        self,
+        model_name="gpt-4o",
+        base_url=None,
+        api_key=None,
+        cache: ResponseCache = None,
+        policy: RetryPolicy = None,
+    ):
+        self.policy = _init_policy(policy)
+        # 重试由 policy 负责，关闭客户端自带的重试
+        self.model = OpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            **({"max_retries": 0} if self.policy else {}),
+        )
         self.model_name = model_name
+        self.cache = cache
+
     def generate(
         self,
         prompt: str,
         system="You are a helpful assistant.",
         return_type="json",
+        validate=None,
+        **kwargs,
+    ):
+        key = None
+        response = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model_name, system, prompt, **kwargs)
+            response = self.cache.get(key)
+
+        cached = response is not None
+        if not cached:
+            completion = self._create(prompt, system, **kwargs)
+            response = completion.choices[0].message.content
+        text = response
+
+        if return_type == "json":
+            response = extract_json(response)
+        if validate is not None:
+            response = validate(response)
+
+        # 解析和校验成功后再写入缓存，避免缓存不合法的回复
+        if self.cache is not None and not cached:
+            self.cache.set(key, text)
+
+        return response
+
+    def generate_stream(
+        self,
+        prompt: str,
+        system="You are a helpful assistant.",
+        **kwargs,
+    ):
+        key = None
+        stream = JSONArrayStream()
+        if self.cache is not None:
+            key = self.cache.make_key(self.model_name, system, prompt, **kwargs)
+            response = self.cache.get(key)
+            if response is not None:
+                yield from stream.feed(response)
+                return
+
+        chunks = self._create(prompt, system, stream=True, **kwargs)
+        for chunk in chunks:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            yield from stream.feed(chunk.choices[0].delta.content)
+
+        # 只缓存完整的数组
+        if self.cache is not None and stream.done:
+            self.cache.set(key, stream.buffer)
+
+    def _create(self, prompt: str, system: str, **kwargs):
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ]
+        if self.policy is None:
+            return self.model.chat.completions.create(
+                model=self.model_name, messages=messages, **kwargs
+            )
+        if self.policy.timeout is not None:
+            kwargs["timeout"] = self.policy.timeout
+        return self.policy.call(
+            lambda: self.model.chat.completions.create(
+                model=self.model_name, messages=messages, **kwargs
+            ),
+            tokens=_estimate_request_tokens(prompt, system, kwargs),
+        )
+
+
+class AsyncChatModel(ABC):
+    @abstractmethod
+    async def generate(
+        self,
+        prompt: str,
+        system="You are a helpful assistant.",
+        return_type="json",
+        validate=None,
         **kwargs,
+    ): ...
+
+
+class AsyncOpenAIChatModel(AsyncChatModel):
+    """
+    基于 openai 异步接口的对话模型，通过信号量限制同时进行的请求数
+    Args:
+        max_concurrency (int): 最大并发请求数
+    """
+
+    def __init__(
+        self,
+        model_name="gpt-4o",
+        base_url=None,
+        api_key=None,
+        cache: ResponseCache = None,
+        max_concurrency: int = 8,
+        policy: RetryPolicy = None,
     ):
-        completion = self.model.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": prompt},
-            ],
-            **kwargs,
+        self.policy = _init_policy(policy)
+        self.model = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            **({"max_retries": 0} if self.policy else {}),
         )
-        response = completion.choices[0].message.content
+        self.model_name = model_name
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def generate(
+        self,
+        prompt: str,
+        system="You are a helpful assistant.",
+        return_type="json",
+        validate=None,
+        **kwargs,
+    ):
+        key = None
+        response = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.model_name, system, prompt, **kwargs)
+            response = self.cache.get(key)
+
+        cached = response is not None
+        if not cached:
+            completion = await self._create(prompt, system, **kwargs)
+            response = completion.choices[0].message.content
+        text = response
 
         if return_type == "json":
             response = extract_json(response)
+        if validate is not None:
+            response = validate(response)
+
+        if self.cache is not None and not cached:
+            self.cache.set(key, text)
+
+        return response
+
+    async def _create(self, prompt: str, system: str, **kwargs):
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ]
+
+        # 只在请求期间占用并发数，退避等待时让出
+        async def create():
+            async with self._get_semaphore():
+                return await self.model.chat.completions.create(
+                    model=self.model_name, messages=messages, **kwargs
+                )
+
+        if self.policy is None:
+            return await create()
+        if self.policy.timeout is not None:
+            kwargs["timeout"] = self.policy.timeout
+        return await self.policy.acall(
+            create, tokens=_estimate_request_tokens(prompt, system, kwargs)
+        )
+
+    def _get_semaphore(self):
+        # 信号量需要在事件循环中创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+
+def _init_policy(policy: RetryPolicy):
+    if policy is None:
+        return None
+    # 复制一份再修改，不影响调用方的策略对象；限流和熔断状态仍然共享
+    policy = copy.copy(policy)
+    # 超时和连接错误没有状态码，需要单独指定为可重试
+    policy.retryable_exceptions = policy.retryable_exceptions + tuple(
+        exception
+        for exception in (APITimeoutError, APIConnectionError)
+        if exception not in policy.retryable_exceptions
+    )
+    return policy
+
+
+def _estimate_request_tokens(prompt: str, system: str, kwargs: dict):
+    # 与服务端计算 TPM 的方式一致，输出按 max_completion_tokens 预留
+    max_tokens = kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 0
+    return estimate_tokens(system) + estimate_tokens(prompt) + max_tokens
+
+
+class ChatFixture:
+    """
+    对话录制文件，保存每个请求及其原始回复；每条录制追加一行 json，同一请求以最后一行为准，
+    兼容旧版整个文件为一个 json 对象的格式
+    """
+
+    def __init__(self, fixture_file: str):
+        self.fixture_file = fixture_file
+        self.records = {}
+        # 旧版格式，第一次录制时整体转换为逐行格式
+        self._legacy = False
+        if os.path.exists(fixture_file):
+            self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with open(self.fixture_file, "r") as f:
+            content = f.read()
+        try:
+            records = json.loads(content)
+            if isinstance(records, dict) and "response" not in records:
+                self.records, self._legacy = records, True
+                return
+        except json.JSONDecodeError:
+            pass
+        for line in content.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                self.records[record.pop("key")] = record
+
+    @staticmethod
+    def make_key(prompt: str, system: str, **kwargs):
+        # 不包含模型名，同一份录制可用于不同模型的回放
+        return ResponseCache.make_key(system, prompt, **kwargs)
+
+    def get(self, key: str):
+        record = self.records.get(key)
+        return record["response"] if record else None
+
+    def set(self, key: str, prompt: str, system: str, kwargs: dict, response: str):
+        record = {
+            "system": system,
+            "prompt": prompt,
+            "kwargs": kwargs,
+            "response": response,
+        }
+        with self._lock:
+            if os.path.dirname(self.fixture_file):
+                os.makedirs(os.path.dirname(self.fixture_file), exist_ok=True)
+            if self._legacy:
+                tmp_file = self.fixture_file + ".tmp"
+                with open(tmp_file, "w") as f:
+                    for old_key, old_record in self.records.items():
+                        f.write(json.dumps({"key": old_key, **old_record}, ensure_ascii=False) + "\n")
+                os.replace(tmp_file, self.fixture_file)
+                self._legacy = False
+            self.records[key] = record
+            # 每条录制只追加一行；同一文件可能被同步和异步模型同时录制，追加写入互不覆盖
+            with open(self.fixture_file, "a") as f:
+                f.write(json.dumps({"key": key, **record}, ensure_ascii=False) + "\n")
+
+
+class ReplayChatModel(ChatModel):
+    """
+    录制/回放对话模型，用于离线运行和测试
+    Args:
+        fixture_file (str): 录制文件
+        model (ChatModel): 录制时实际调用的模型，只回放时可以为 None
+        mode (str): "replay" 只回放，缺少录制时报错；"record" 总是调用模型并录制；"auto" 有录制时回放，否则调用模型并录制
+    """
+
+    def __init__(self, fixture_file: str, model: ChatModel = None, mode: str = "replay"):
+        assert mode in ("replay", "record", "auto"), f"Unknown mode: {mode}"
+        assert mode == "replay" or model is not None, "Please provide a model to record"
+        self.fixture = ChatFixture(fixture_file)
+        self.model = model
+        self.mode = mode
 
+    def generate(
+        self,
+        prompt: str,
+        system="You are a helpful assistant.",
+        return_type="json",
+        validate=None,
+        **kwargs,
+    ):
+        key = self.fixture.make_key(prompt, system, **kwargs)
+        response = self.fixture.get(key) if self.mode != "record" else None
+        if response is None:
+            if self.model is None:
+                raise KeyError(f"No recorded response in {self.fixture.fixture_file} for prompt: {prompt[:100]}")
+            response = self.model.generate(prompt, system, return_type="text", **kwargs)
+            self.fixture.set(key, prompt, system, kwargs, response)
+
+        if return_type == "json":
+            response = extract_json(response)
+        if validate is not None:
+            response = validate(response)
+        return response
+
+
+class AsyncReplayChatModel(AsyncChatModel):
+    """
+    ReplayChatModel 的异步版本，model 为 AsyncChatModel
+    """
+
+    def __init__(self, fixture_file: str, model: AsyncChatModel = None, mode: str = "replay"):
+        assert mode in ("replay", "record", "auto"), f"Unknown mode: {mode}"
+        assert mode == "replay" or model is not None, "Please provide a model to record"
+        self.fixture = ChatFixture(fixture_file)
+        self.model = model
+        self.mode = mode
+
+    async def generate(
+        self,
+        prompt: str,
+        system="You are a helpful assistant.",
+        return_type="json",
+        validate=None,
+        **kwargs,
+    ):
+        key = self.fixture.make_key(prompt, system, **kwargs)
+        response = self.fixture.get(key) if self.mode != "record" else None
+        if response is None:
+            if self.model is None:
+                raise KeyError(f"No recorded response in {self.fixture.fixture_file} for prompt: {prompt[:100]}")
+            response = await self.model.generate(prompt, system, return_type="text", **kwargs)
+            self.fixture.set(key, prompt, system, kwargs, response)
+
+        if return_type == "json":
+            response = extract_json(response)
+        if validate is not None:
+            response = validate(response)
         return response
 
 
-def extract_json(response: str):
-    if response.startswith("```json"):
-        # 去掉 ```
-        response = "\n".join(response.splitlines()[1:-1])
-    return json.loads(response)
+def with_fixture(init_model, fixture_file: str = None, fixture_mode: str = "replay", is_async: bool = False):
+    """
+    按录制设置包装对话模型
+    Args:
+        init_model: 创建实际模型的函数，只回放时不调用（不需要 API Key）
+        fixture_file (str): 录制文件，None 时直接返回实际模型
+        fixture_mode (str): 见 ReplayChatModel
+        is_async (bool): 是否为异步模型
+    """
+    if not fixture_file:
+        return init_model()
+    replay_cls = AsyncReplayChatModel if is_async else ReplayChatModel
+    if fixture_mode == "replay":
+        return replay_cls(fixture_file)
+    return replay_cls(fixture_file, init_model(), fixture_mode)
@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import zlib
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .file_cache import FileCache
+
+# 不影响音效含义的词
+STOP_WORDS = {"a", "an", "the", "of", "on", "in", "at", "with", "and", "is", "are", "sound", "sounds"}
+
+
+def normalize_desc(desc: str):
+    """
+    规范化英文音效描述：小写，去掉标点、冠词等虚词，合并空白
+    """
+    words = re.sub(r"[^a-z0-9]+", " ", desc.lower()).split()
+    return " ".join(word for word in words if word not in STOP_WORDS)
+
+
+def hash_embedding(descs: List[str], dim: int = 512):
+    """
+    不依赖模型的文本嵌入：词和相邻词对的哈希特征，用于没有文本编码器的音效模型
+    Returns:
+        embeddings (np.ndarray): (len(descs), dim)，已归一化
+    """
+    embeddings = np.zeros((len(descs), dim), dtype=np.float32)
+    for i, desc in enumerate(descs):
+        # 粗略去掉复数和进行时，footsteps / footstep、blowing / blow 视为同一个词
+        words = [re.sub(r"(ing|s)$", "", word) or word for word in normalize_desc(desc).split()]
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            embeddings[i, zlib.crc32(feature.encode("utf-8")) % dim] += 1.0
+    return _normalize(embeddings)
+
+
+# 各文本嵌入近似命中的默认阈值，没有列出的嵌入（如尚未校准的 CLAP）默认不做近似命中
+DEFAULT_THRESHOLDS = {"hash": 0.85}
+
+
+class EffectLibrary:
+    """
+    音效库，相同或相近的音效描述复用已生成的音频。库中保存模型生成的完整音效，不含时长，由调用方裁剪到所需的时长
+        精确命中：规范化的描述和模型版本（含采样步数、随机种子）相同，且保存的音效不短于所需的长度
+        近似命中：描述的文本嵌入余弦相似度不低于 threshold
+    Args:
+        cache_dir (str): 音效库目录
+        embed_fn (Callable): 文本嵌入函数 fn(descs) -> (N, D) 的归一化向量，默认 hash_embedding
+        embedding_name (str): 嵌入函数的名字，变化时重新计算库中描述的嵌入
+        threshold (float): 近似命中的相似度阈值，默认取 DEFAULT_THRESHOLDS 中该嵌入的阈值，为 None 时不做近似命中
+        max_bytes (int): 音效文件最多占用的字节数，超出时按最近使用时间淘汰
+    """
+
+    INDEX_FILE = "index.json"
+    EMBEDDING_FILE = "embeddings.npy"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        embed_fn: Callable = None,
+        embedding_name: str = "hash",
+        threshold: float = None,
+        max_bytes: int = None,
+    ):
+        self.cache_dir = cache_dir
+        self.embed_fn = embed_fn or hash_embedding
+        self.embedding_name = embedding_name
+        self.threshold = threshold if threshold is not None else DEFAULT_THRESHOLDS.get(embedding_name)
+        self.files = FileCache(os.path.join(cache_dir, "clips"), max_bytes)
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        # key -> {"desc", "duration", "version"}，顺序与嵌入矩阵的行一致
+        self.entries: Dict[str, Dict] = {}
+        self._embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._load()
+
+    def make_key(self, desc: str, version: str):
+        return self.files.make_key(normalize_desc(desc), version)
+
+    def fetch_exact(self, desc: str, version: str, min_duration: float = 0):
+        """
+        查找精确命中的音效
+        Args:
+            min_duration (float): 音效至少的时长，保存的音效更短时（如时长分桶不同）视为未命中
+        Returns:
+            音效文件，未命中时为 None
+        """
+        key = self.make_key(desc, version)
+        entry = self.entries.get(key)
+        path = self.files.path(key)
+        if entry is None or entry["duration"] < min_duration or not os.path.exists(path):
+            return None
+        os.utime(path)
+        self.exact_hits += 1
+        return path
+
+    def nearest(self, descs: List[str], version: str):
+        """
+        查找各描述最相近的音效
+        Returns:
+            [(音效文件, 音效时长, 相似度) 或 None]
+        """
+        results = [None] * len(descs)
+        if self.threshold is None:
+            self.misses += len(descs)
+            return results
+        rows, keys = [], []
+        for row, (key, entry) in enumerate(self.entries.items()):
+            if entry["version"] == version:
+                rows.append(row)
+                keys.append(key)
+        if descs and keys:
+            similarities = self.embed_fn(descs) @ self._embeddings[rows].T
+            for i, row in enumerate(similarities):
+                # 从最相似的开始，跳过已被淘汰的文件
+                for j in np.argsort(-row):
+                    if row[j] < self.threshold:
+                        break
+                    path = self.files.path(keys[j])
+                    if os.path.exists(path):
+                        os.utime(path)
+                        results[i] = (path, self.entries[keys[j]]["duration"], float(row[j]))
+                        break
+        for result in results:
+            if result is None:
+                self.misses += 1
+            else:
+                self.near_hits += 1
+        return results
+
+    def add(self, descs: List[str], durations: List[float], version: str, files: List[str]):
+        """
+        把生成好的完整音效加入库中，描述相同的替换原有的音效
+        Args:
+            durations (List[float]): 各音效文件的时长
+        """
+        new_keys = []
+        for desc, duration, file in zip(descs, durations, files):
+            key = self.make_key(desc, version)
+            self.files.put(key, file)
+            if key not in self.entries:
+                new_keys.append(key)
+            self.entries[key] = {"desc": desc, "duration": duration, "version": version}
+        if new_keys:
+            embeddings = self.embed_fn([self.entries[key]["desc"] for key in new_keys])
+            self._embeddings = _stack(self._embeddings, embeddings)
+
+    def save(self):
+        self.files.evict()
+        # 音效文件已被淘汰的条目不再保留
+        rows = [
+            row
+            for row, key in enumerate(self.entries)
+            if os.path.exists(self.files.path(key))
+        ]
+        keys = list(self.entries)
+        self.entries = {keys[row]: self.entries[keys[row]] for row in rows}
+        self._embeddings = self._embeddings[rows] if rows else np.zeros((0, 0), dtype=np.float32)
+        index_file = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_file = index_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {"embedding": self.embedding_name, "entries": self.entries},
+                f,
+                indent=4,
+                ensure_ascii=False,
+            )
+        np.save(os.path.join(self.cache_dir, self.EMBEDDING_FILE), self._embeddings)
+        os.replace(tmp_file, index_file)
+
+    def stats(self):
+        total = self.exact_hits + self.near_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.near_hits) / total if total else 0.0,
+            "entries": len(self.entries),
+        }
+
+    def _load(self):
+        index_file = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.exists(index_file):
+            return
+        with open(index_file, "r") as f:
+            index = json.load(f)
+        self.entries = index["entries"]
+        embedding_file = os.path.join(self.cache_dir, self.EMBEDDING_FILE)
+        if index["embedding"] == self.embedding_name and os.path.exists(embedding_file):
+            self._embeddings = np.load(embedding_file)
+        if self.entries and len(self._embeddings) != len(self.entries):
+            # 嵌入函数变化，重新计算
+            self._embeddings = self.embed_fn([entry["desc"] for entry in self.entries.values()])
+
+
+def _normalize(embeddings: np.ndarray):
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-8)
+
+
+def _stack(embeddings: np.ndarray, new: np.ndarray):
+    new = np.asarray(new, dtype=np.float32)
+    if len(embeddings) == 0:
+        return new
+    return np.concatenate([embeddings, new], axis=0)
@@ -0,0 +1,113 @@
+from typing import Callable, List, Sequence, Union
+
+import numpy as np
+
+
+def echo(
+    audio: np.ndarray,
+    sample_rate: int,
+    in_gain: float = 0.5,
+    out_gain: float = 0.8,
+    delays: Sequence[float] = (50,),
+    decays: Sequence[float] = (0.8,),
+):
+    """
+    回声，与 ffmpeg 的 aecho 滤镜一致：out = (in_gain * x[n] + Σ decay_i * x[n - delay_i]) * out_gain，
+    输出比输入长出最长的延迟，保留回声的尾音
+    Args:
+        audio (np.ndarray): [-1, 1] 范围的浮点音频，最后一维为采样点
+        delays (Sequence[float]): 各回声的延迟（毫秒）
+        decays (Sequence[float]): 各回声的衰减系数
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    offsets = [int(delay * sample_rate / 1000) for delay in delays]
+    length = audio.shape[-1]
+    output = np.zeros(audio.shape[:-1] + (length + max(offsets),), dtype=np.float32)
+    output[..., :length] += in_gain * audio
+    for offset, decay in zip(offsets, decays):
+        output[..., offset : offset + length] += decay * audio
+    return output * out_gain
+
+
+def gain(audio: np.ndarray, sample_rate: int, db: float = 0.0):
+    """
+    按分贝调整音量
+    """
+    return np.asarray(audio, dtype=np.float32) * np.float32(10 ** (db / 20))
+
+
+def trim(audio: np.ndarray, sample_rate: int, threshold_db: float = -50.0, pad: float = 0.05):
+    """
+    去掉首尾低于阈值的静音，两端各保留 pad 秒
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    amplitude = np.abs(audio).reshape(-1, audio.shape[-1]).max(axis=0)
+    voiced = np.flatnonzero(amplitude > 10 ** (threshold_db / 20))
+    if len(voiced) == 0:
+        return audio
+    pad_samples = int(pad * sample_rate)
+    start = max(0, voiced[0] - pad_samples)
+    end = min(audio.shape[-1], voiced[-1] + 1 + pad_samples)
+    return audio[..., start:end]
+
+
+def fit_duration(audio: np.ndarray, sample_rate: int, secs: float, fade: float = 0.05):
+    """
+    裁剪或循环到指定时长，末尾淡出避免截断处的爆音
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    length = max(1, int(secs * sample_rate))
+    if audio.shape[-1] == 0:
+        return np.zeros(audio.shape[:-1] + (length,), dtype=np.float32)
+    repeats = -(-length // audio.shape[-1])
+    audio = np.tile(audio, (1,) * (audio.ndim - 1) + (repeats,))[..., :length]
+    n = min(int(fade * sample_rate), length)
+    if n > 0:
+        audio[..., -n:] *= np.linspace(1.0, 0.0, n, dtype=np.float32)
+    return audio
+
+
+def crossfade(audios: List[np.ndarray], overlap: int):
+    """
+    按顺序拼接多段音频，相邻两段重叠 overlap 个采样点并线性淡入淡出，
+    总长度为各段长度之和减去各处实际重叠的采样点数
+    Args:
+        audios (List[np.ndarray]): 各段音频，最后一维为采样点
+        overlap (int): 重叠的采样点数，超过某段长度时按该段长度
+    """
+    result = np.asarray(audios[0], dtype=np.float32)
+    for audio in audios[1:]:
+        audio = np.asarray(audio, dtype=np.float32)
+        n = min(overlap, result.shape[-1], audio.shape[-1])
+        if n == 0:
+            result = np.concatenate([result, audio], axis=-1)
+            continue
+        fade_in = np.linspace(0.0, 1.0, n, dtype=np.float32)
+        mixed = result[..., -n:] * (1.0 - fade_in) + audio[..., :n] * fade_in
+        result = np.concatenate([result[..., :-n], mixed, audio[..., n:]], axis=-1)
+    return result
+
+
+# 预设的效果链，可以按名字引用，便于跨进程传递
+PRESETS = {
+    # 心理活动（os），目前仅加混响
+    "os": [echo],
+}
+
+
+Effect = Union[str, Callable]
+
+
+def apply_effects(audio: np.ndarray, sample_rate: int, effects: List[Effect] = None):
+    """
+    依次应用效果
+    Args:
+        audio (np.ndarray): [-1, 1] 范围的浮点音频，最后一维为采样点
+        effects (List): 效果函数 fn(audio, sample_rate) 或 PRESETS 中的名字
+    """
+    for effect in effects or []:
+        if isinstance(effect, str):
+            audio = apply_effects(audio, sample_rate, PRESETS[effect])
+        else:
+            audio = effect(audio, sample_rate)
+    return audio
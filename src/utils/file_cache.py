@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+
+class FileCache:
+    """
+    按内容哈希寻址的文件缓存，命中时用硬链接（不支持时复制）放到目标位置
+    Args:
+        cache_dir (str): 缓存目录，可以在多个分块、多本书之间共享
+        max_bytes (int): 缓存最多占用的字节数，超出时按最近使用时间淘汰
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # (路径, 大小, 修改时间) -> 内容哈希
+        self._file_hashes = {}
+        # 缓存目录的总字节数，第一次淘汰时统计，之后随 put 累加，未超出容量时不必遍历目录
+        self._total = None
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, *parts, files=()):
+        """
+        由若干字段和文件内容生成缓存键
+        Args:
+            parts: 参与哈希的字段，需要可以被 json 序列化
+            files: 参与哈希的文件，按内容而不是路径计算
+        """
+        payload = json.dumps(
+            [list(parts), [self.file_hash(file) for file in files]],
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def file_hash(self, path: str):
+        stat = os.stat(path)
+        file_id = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if file_id in self._file_hashes:
+                return self._file_hashes[file_id]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            self._file_hashes[file_id] = digest
+        return digest
+
+    def fetch(self, key: str, output_path: str):
+        """
+        命中时把缓存文件放到 output_path，返回是否命中
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return False
+        _remove(output_path)
+        _link_or_copy(path, output_path)
+        # 更新使用时间，供淘汰时参考
+        os.utime(path)
+        self.hits += 1
+        return True
+
+    def put(self, key: str, file: str):
+        """
+        把生成好的文件加入缓存
+        """
+        path = self.path(key)
+        # 已经是同一个文件（硬链接）时 rename 什么都不做，会留下临时文件
+        if os.path.exists(path) and os.path.samefile(file, path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        _remove(tmp_path)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        _link_or_copy(file, tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._total is not None:
+                self._total += os.path.getsize(path) - old_size
+
+    def evict(self):
+        """
+        超出容量时删除最久未使用的文件，返回删除的文件数
+        """
+        if self.max_bytes is None:
+            return 0
+        with self._lock:
+            if self._total is not None and self._total <= self.max_bytes:
+                return 0
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            # 已链接到结果目录的文件只删除缓存中的链接，不影响结果
+            os.remove(path)
+            total -= size
+            removed += 1
+        with self._lock:
+            self._total = total
+        return removed
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def path(self, key: str):
+        # 缓存文件的位置，不保证存在
+        return os.path.join(self.cache_dir, key[:2], key)
+
+
+class Manifest:
+    """
+    记录结果目录中每个文件对应的缓存键，用于判断已有文件是否过期
+    Args:
+        output_dir (str): 结果目录
+    Attributes:
+        legacy (bool): 目录中还没有记录文件，已有的文件来自不记录缓存键的旧版本
+    """
+
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, self.FILE_NAME)
+        self.entries = {}
+        self.legacy = not os.path.exists(self.path)
+        if not self.legacy:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+
+    def get(self, file_name: str):
+        return self.entries.get(file_name)
+
+    def set(self, file_name: str, key: str):
+        self.entries[file_name] = key
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _remove(path: str):
+    if os.path.lexists(path):
+        os.remove(path)
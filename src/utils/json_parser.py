@@ -0,0 +1,112 @@
+import json
+
+
+def extract_json(response: str):
+    if response.startswith("```json"):
+        # 去掉 ```
+        response = "\n".join(response.splitlines()[1:-1])
+    try:
+        return json.loads(response)
+    except json.JSONDecodeError as e:
+        # 回复中可能有多余的说明文字或不带 json 标记的 ```，从第一个 [ 或 { 开始解析
+        starts = [i for i in (response.find("["), response.find("{")) if i >= 0]
+        if not starts:
+            raise e
+        try:
+            result, _ = json.JSONDecoder().raw_decode(response[min(starts):])
+            return result
+        except json.JSONDecodeError:
+            pass
+        # 被截断或含有非法元素（如 ...）的数组，保留完整的元素
+        items, complete = parse_json_array(response)
+        if items:
+            if not complete:
+                print(f"Warning: truncated json array, salvaged {len(items)} items")
+            return items
+        raise e
+
+
+def parse_json_array(response: str):
+    """
+    容错地解析 json 数组，回复被截断时返回所有完整的元素
+    Returns:
+        items (list): 解析出的元素
+        complete (bool): 数组是否完整
+    """
+    stream = JSONArrayStream()
+    items = stream.feed(response)
+    return items, stream.done
+
+
+class JSONArrayStream:
+    """
+    增量解析 json 数组，每当数组中的一个元素完整时就将其返回
+
+    Example:
+        stream = JSONArrayStream()
+        for delta in deltas:
+            for item in stream.feed(delta):
+                ...
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._elem_start = None
+
+    def feed(self, text: str):
+        self.buffer += text
+        items = []
+        buf = self.buffer
+        while self._pos < len(buf) and not self.done:
+            i, c = self._pos, buf[self._pos]
+            self._pos += 1
+            if self._depth == 0:
+                # 跳过数组之前的内容，如 ```json
+                if c == "[":
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                continue
+            if c.isspace():
+                continue
+            if c == "," and self._depth == 1:
+                self._emit(buf[self._elem_start : i] if self._elem_start is not None else None, items)
+                continue
+            if c in "]}":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._emit(buf[self._elem_start : i + 1], items)
+                elif self._depth == 0:
+                    # 数组结束，最后一个元素可能是标量
+                    if self._elem_start is not None:
+                        self._emit(buf[self._elem_start : i], items)
+                    self.done = True
+                continue
+            if self._depth == 1 and self._elem_start is None:
+                self._elem_start = i
+            if c == '"':
+                self._in_string = True
+            elif c in "[{":
+                self._depth += 1
+        return items
+
+    def _emit(self, fragment: str, items: list):
+        self._elem_start = None
+        if fragment is None or not fragment.strip():
+            return
+        try:
+            items.append(json.loads(fragment))
+        except json.JSONDecodeError:
+            # 跳过无法解析的元素，如模型模仿示例输出的 ...
+            pass
@@ -0,0 +1,21 @@
+import importlib
+from typing import Dict
+
+
+def lazy_exports(package: str, exports: Dict[str, str]):
+    """
+    生成包的 __getattr__，第一次访问时才导入导出名所在的子模块
+    Args:
+        package (str): 包名，即 __name__
+        exports (Dict[str, str]): 导出名 -> 相对子模块，如 {"TTSModel": ".tts_model"}
+    """
+    module = importlib.import_module(package)
+
+    def __getattr__(name: str):
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(exports[name], package), name)
+        setattr(module, name, value)
+        return value
+
+    return __getattr__
@@ -0,0 +1,92 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    有容量上限的内存 LRU 缓存，可选持久化到文件
+    Args:
+        max_entries (int): 最多保留的条目数，超出时淘汰最久未使用的
+        cache_file (str): 持久化文件（pickle），存在且版本一致时自动载入
+        version (str): 缓存内容的版本，如模型版本，不一致时丢弃已持久化的内容
+    """
+
+    def __init__(self, max_entries: int = 10000, cache_file: str = None, version: str = None):
+        self.max_entries = max_entries
+        self.cache_file = cache_file
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_file and os.path.exists(cache_file):
+            self.load()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """
+        命中时返回缓存的值，否则调用 compute() 计算并缓存
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._items),
+        }
+
+    def save(self, cache_file: str = None):
+        cache_file = cache_file or self.cache_file
+        if os.path.dirname(cache_file):
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with self._lock:
+            payload = {"version": self.version, "items": list(self._items.items())}
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(payload, f)
+        os.replace(tmp_file, cache_file)
+
+    def load(self, cache_file: str = None):
+        cache_file = cache_file or self.cache_file
+        try:
+            with open(cache_file, "rb") as f:
+                payload = pickle.load(f)
+        except Exception as e:
+            print(f"Warning: broken cache file {cache_file}: {e}")
+            return
+        if payload.get("version") != self.version:
+            return
+        with self._lock:
+            for key, value in payload["items"][-self.max_entries :]:
+                self._items[key] = value
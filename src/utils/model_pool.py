@@ -0,0 +1,73 @@
+import gc
+import sys
+import time
+import threading
+
+
+class ModelPool:
+    """
+    进程内的模型池，同一个模型只加载一次，在分块和输入文本之间复用，阶段结束时显式释放
+
+    Example:
+        pool = ModelPool()
+        tts_model = pool.get("tts", init_tts_model, "cosyvoice")
+        ...
+        pool.release("tts")
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self.load_secs = {}
+
+    def get(self, name: str, factory, *args, **kwargs):
+        """
+        返回已加载的模型，没有或参数不同时调用 factory(*args, **kwargs) 加载
+        Args:
+            name (str): 模型在池中的名字，如 tts、tta
+            factory: 加载模型的函数
+        """
+        key = (factory, args, tuple(sorted(kwargs.items())))
+        with self._lock:
+            if name in self._models:
+                loaded_key, model = self._models[name]
+                if loaded_key == key:
+                    return model
+                # 同名但参数不同，先释放旧模型
+                self._release(name)
+            start = time.perf_counter()
+            model = factory(*args, **kwargs)
+            secs = time.perf_counter() - start
+            # 累计加载耗时，重复加载说明复用失效
+            self.load_secs[name] = self.load_secs.get(name, 0) + secs
+            print(f"Load model {name} in {secs:.1f}s")
+            self._models[name] = (key, model)
+            return model
+
+    def release(self, name: str = None):
+        """
+        释放指定模型，name 为 None 时释放全部模型
+        """
+        with self._lock:
+            for model_name in [name] if name is not None else list(self._models):
+                self._release(model_name)
+            free_memory()
+
+    def __contains__(self, name: str):
+        return name in self._models
+
+    def _release(self, name: str):
+        item = self._models.pop(name, None)
+        if item is None:
+            return
+        close = getattr(item[1], "close", None)
+        if callable(close):
+            close()
+
+
+def free_memory():
+    gc.collect()
+    # 只在已经导入 torch 时清理显存，不为此引入 torch
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
@@ -0,0 +1,249 @@
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    令牌桶，按每分钟的速率补充令牌
+    Args:
+        rate_per_minute (float): 每分钟补充的令牌数，如 RPM 或 TPM 限制
+        capacity (float): 桶容量，默认等于每分钟的速率
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """
+        预留令牌，返回需要等待的秒数。令牌可以预支，等待结束后视为已获得
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # 单次请求超过容量时最多等桶满
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, amount: float = 1):
+        time.sleep(self.reserve(amount))
+
+    async def acquire_async(self, amount: float = 1):
+        await asyncio.sleep(self.reserve(amount))
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后熔断 reset_timeout 秒，之后放行一次试探请求
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def wait_time(self) -> float:
+        """返回需要等待的秒数，0 表示可以发起请求"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return 0.0
+            if state == "open":
+                return self.reset_timeout - (self.clock() - self.opened_at)
+            # 半开状态只放行一个试探请求
+            if self._probing:
+                return min(1.0, self.reset_timeout)
+            self._probing = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self._probing = False
+
+    def release_probe(self):
+        """试探请求没有得出服务是否恢复的结论（如不可重试的错误、被取消），让下一个请求重新试探"""
+        with self._lock:
+            self._probing = False
+
+
+class RetryPolicy:
+    """
+    调用大模型接口的重试、限流和熔断策略
+    Args:
+        max_retries (int): 最大重试次数
+        base_delay (float): 指数退避的初始等待秒数
+        max_delay (float): 最长等待秒数
+        timeout (float): 单次请求超时秒数，None 表示使用客户端默认值
+        rpm (float): 每分钟请求数限制
+        tpm (float): 每分钟 token 数限制
+        failure_threshold (int): 连续失败多少次后熔断
+        reset_timeout (float): 熔断持续秒数
+        retryable_exceptions (tuple): 除 408/409/429/5xx 状态码外，其他需要重试的异常类型
+        fail_fast (bool): 熔断时直接抛出 CircuitOpenError，否则等待熔断结束
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        timeout: float = None,
+        rpm: float = None,
+        tpm: float = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+        retryable_exceptions: tuple = (),
+        fail_fast: bool = False,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retryable_exceptions = tuple(retryable_exceptions) + (TimeoutError, ConnectionError)
+        self.fail_fast = fail_fast
+
+    def call(self, fn, tokens: int = 0):
+        """
+        按策略调用 fn()，可重试的异常会在退避后重试
+        Args:
+            fn: 无参数的请求函数
+            tokens (int): 本次请求预计消耗的 token 数，用于 TPM 限流
+        """
+        for attempt in range(self.max_retries + 1):
+            # 等待结束后重新检查，半开状态下只有拿到试探名额的请求能发出
+            while (wait := self._wait_breaker()) > 0:
+                time.sleep(wait)
+            time.sleep(self._reserve(tokens))
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+            except BaseException:
+                self.breaker.release_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            time.sleep(delay)
+
+    async def acall(self, fn, tokens: int = 0):
+        """
+        call 的异步版本，fn() 返回 awaitable
+        """
+        for attempt in range(self.max_retries + 1):
+            while (wait := self._wait_breaker()) > 0:
+                await asyncio.sleep(wait)
+            await asyncio.sleep(self._reserve(tokens))
+            try:
+                result = await fn()
+            except Exception as e:
+                delay = self._on_failure(e, attempt)
+            except BaseException:
+                # 被取消时释放试探名额
+                self.breaker.release_probe()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+            await asyncio.sleep(delay)
+
+    def is_retryable(self, e: Exception):
+        status_code = getattr(e, "status_code", None)
+        if status_code is not None:
+            return status_code in (408, 409, 429) or status_code >= 500
+        return isinstance(e, self.retryable_exceptions)
+
+    def backoff(self, attempt: int, e: Exception = None):
+        retry_after = _retry_after(e)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _wait_breaker(self):
+        wait = self.breaker.wait_time()
+        if wait > 0 and self.fail_fast:
+            raise CircuitOpenError(f"Circuit open, retry in {wait:.1f}s")
+        return wait
+
+    def _reserve(self, tokens: int):
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.reserve(1))
+        if self.token_bucket is not None and tokens:
+            wait = max(wait, self.token_bucket.reserve(tokens))
+        return wait
+
+    def _on_failure(self, e: Exception, attempt: int):
+        """返回重试前需要等待的秒数，不可重试或重试次数用尽时抛出异常"""
+        if not self.is_retryable(e):
+            self.breaker.release_probe()
+            raise e
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            raise e
+        delay = self.backoff(attempt, e)
+        print(f"Warning: {type(e).__name__}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+
+def _retry_after(e: Exception):
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,40 @@
+import math
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+CJK_PATTERN = re.compile("[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+class Tokenizer:
+    """
+    本地估算 token 数，优先使用 tiktoken，不可用时（未安装或无法下载词表）按字符估算
+    Args:
+        model_name (str): 模型名，用于选择 tiktoken 的词表
+    """
+
+    def __init__(self, model_name: str = "gpt-4o"):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name)
+            except Exception:
+                try:
+                    self.encoding = tiktoken.get_encoding("o200k_base")
+                except Exception:
+                    self.encoding = None
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+
+def estimate_tokens(text: str) -> int:
+    # 中文字符及全角标点约 1 个 token，其余字符约 4 个一个 token
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+
+from fake_openai import FakeOpenAIServer
+
+
+@pytest.fixture
+def fake_openai():
+    server = FakeOpenAIServer().start()
+    yield server
+    server.stop()
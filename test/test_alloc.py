@@ -12,4 +12,35 @@ def test_alloc():
     allocator.get("5")
     allocator.get("1")
     allocator.get("2")
-    assert allocator.get("6") == 'c', allocator.get("6")
\ No newline at end of file
+    assert allocator.get("6") == 'c', allocator.get("6")
+
+
+def test_alloc_state():
+    allocator = LRUAllocator(["a", "b"], protect_top=1)
+    for key in ["旁白", "旁白", "萧炎", "旁白"]:
+        allocator.get(key)
+    # 旁白台词最多，即使最久未使用也不会被回收
+    allocator.get("萧炎")
+    assert allocator.get("药老") == allocator.allocated["药老"]
+    assert "旁白" in allocator.allocated and "萧炎" not in allocator.allocated
+
+    # 恢复后保留使用顺序和台词数，已分配的音色不会重复分配
+    restored = LRUAllocator.from_dict(["a", "b"], allocator.to_dict(), protect_top=1)
+    assert restored.free == []
+    assert list(restored.allocated) == ["旁白", "药老"]
+    # 已被回收的角色也保留台词数
+    assert restored.counts["萧炎"] == 2
+    restored.get("萧炎")
+    assert set(restored.allocated) == {"旁白", "萧炎"}
+    assert restored.counts["萧炎"] == 3
+
+
+def test_alloc_state_counts_capped():
+    allocator = LRUAllocator(["a"])
+    allocator.MAX_SAVED_COUNTS = 2
+    for i, key in enumerate(["甲", "乙", "丙", "丁"]):
+        for _ in range(i + 1):
+            allocator.get(key)
+    allocator.get("戊")
+    # 已分配的 key 之外只保留使用最多的
+    assert allocator.to_dict()["counts"] == {"丙": 3, "丁": 4, "戊": 1}
@@ -0,0 +1,14 @@
+import sys
+sys.path.append("..")
+
+from src.audio.tta import AudioGenTTAModel
+
+
+def test_duration_buckets():
+    model = AudioGenTTAModel()
+    assert [model.clip_duration(d) for d in (0.5, 5, 5.5, 10, 13, 30)] == [5, 5, 10, 10, 20, 40]
+
+    durations = [1, 2.5, 3, 4, 6, 7.2, 9, 12]
+    groups = model._groups([f"effect {d}" for d in durations], durations, [f"{d}.wav" for d in durations])
+    # 各不相同的时长只需三次生成，每桶按桶内最长的时长生成
+    assert [(gen_duration, len(requests)) for gen_duration, requests in groups] == [(4, 4), (9, 3), (12, 1)]
@@ -0,0 +1,33 @@
+import sys
+sys.path.append("..")
+
+from src.utils.cache import ResponseCache
+
+
+def test_response_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_entries=2)
+    key = cache.make_key("gpt-4o", "system", "prompt", max_completion_tokens=16384)
+    assert key == cache.make_key("gpt-4o", "system", "prompt", max_completion_tokens=16384)
+    assert key != cache.make_key("gpt-4o", "system", "prompt")
+
+    assert cache.get(key) is None
+    cache.set(key, "[]")
+    assert cache.get(key) == "[]"
+
+    # 另一个连接（如另一个进程）也能读到
+    assert ResponseCache(str(tmp_path / "cache.db")).get(key) == "[]"
+
+    cache.set("b", "1")
+    cache.set("c", "2")
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_response_cache_max_bytes(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    cache.set("c", "12345")
+    assert cache.get("a") is None
+    assert cache.get("c") == "12345"
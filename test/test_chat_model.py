@@ -1,9 +1,63 @@
 import sys
 sys.path.append("..")
 
-from src.utils.chat_model import OpenAIChatModel
+import os
+import json
+import asyncio
 
+import pytest
+
+from src.utils.chat_model import AsyncOpenAIChatModel, ChatFixture, OpenAIChatModel, ReplayChatModel
+
+@pytest.mark.skipif("OPENAI_API_KEY" not in os.environ, reason="需要 OPENAI_API_KEY")
 def test_openai_chat_model():
     model = OpenAIChatModel()
 
-    print(model.generate("hello", return_type="text"))
\ No newline at end of file
+    print(model.generate("hello", return_type="text"))
+
+def test_replay_chat_model(fake_openai, tmp_path):
+    fixture_file = str(tmp_path / "fixture.json")
+    fake_openai.default_content = '[{"name": "萧炎"}]'
+    model = OpenAIChatModel(base_url=fake_openai.base_url, api_key="test")
+
+    recorder = ReplayChatModel(fixture_file, model, mode="auto")
+    assert recorder.generate("hello", max_completion_tokens=10) == [{"name": "萧炎"}]
+    assert recorder.generate("hello", max_completion_tokens=10) == [{"name": "萧炎"}]
+    assert len(fake_openai.requests) == 1
+
+    replayer = ReplayChatModel(fixture_file)
+    assert replayer.generate("hello", return_type="text", max_completion_tokens=10) == '[{"name": "萧炎"}]'
+    assert list(replayer.generate_stream("hello", max_completion_tokens=10)) == [{"name": "萧炎"}]
+    with pytest.raises(KeyError):
+        replayer.generate("unknown")
+
+
+def test_fixture_append(tmp_path):
+    fixture_file = tmp_path / "fixture.json"
+    # 旧版格式在第一次录制时转换为逐行格式
+    legacy = ChatFixture(str(fixture_file))
+    legacy.set("a", "hello", "", {}, "1")
+    legacy_records = {"a": legacy.records["a"]}
+    fixture_file.write_text(json.dumps(legacy_records))
+
+    fixture = ChatFixture(str(fixture_file))
+    assert fixture.get("a") == "1"
+    fixture.set("b", "world", "", {}, "2")
+    fixture.set("a", "hello", "", {}, "3")
+    assert len(fixture_file.read_text().splitlines()) == 3
+    restored = ChatFixture(str(fixture_file))
+    assert restored.get("a") == "3" and restored.get("b") == "2"
+
+
+def test_async_max_concurrency(fake_openai):
+    fake_openai.delay = 0.1
+    fake_openai.default_content = '[{"name": "萧炎"}]'
+    model = AsyncOpenAIChatModel(base_url=fake_openai.base_url, api_key="test", max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*[model.generate(f"hello {i}") for i in range(6)])
+
+    assert asyncio.run(run()) == [[{"name": "萧炎"}]] * 6
+    assert len(fake_openai.requests) == 6
+    # 同时处理的请求数达到且不超过 max_concurrency
+    assert fake_openai.max_in_flight == 2
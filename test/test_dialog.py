@@ -0,0 +1,117 @@
+import sys
+sys.path.append("..")
+
+import json
+
+from src.dialog import RoleRegistry, extract_dialog, extract_role, gen_interval, gen_interval_local
+from src.utils.chat_model import ChatModel
+from src.utils.json_parser import extract_json
+
+
+class ScriptedChatModel(ChatModel):
+    def __init__(self, responses):
+        self.responses = responses
+        self.prompts = []
+
+    def generate(self, prompt, system="", return_type="json", validate=None, **kwargs):
+        self.prompts.append(prompt)
+        response = self.responses.pop(0)
+        if return_type == "json":
+            response = extract_json(response)
+        if validate is not None:
+            response = validate(response)
+        return response
+
+
+def test_extract_dialog_continuation():
+    text = "萧炎说：“我来了。”纳兰嫣然道：“你终于来了。”"
+    model = ScriptedChatModel(
+        [
+            '[{"role": "萧炎", "content": "我来了。", "speed": 3}, {"role": "旁白", "content": "纳兰',
+            '[{"role": "纳兰嫣然", "content": "你终于来了。", "speed": 3}]',
+        ]
+    )
+    dialogs = extract_dialog(text, model)
+
+    assert [d["content"] for d in dialogs] == ["我来了。", "你终于来了。"]
+    # 续写时只发送剩余的文本
+    assert "纳兰嫣然道：“你终于来了。”" in model.prompts[1]
+    assert "萧炎说" not in model.prompts[1]
+
+
+def test_extract_dialog_continuation_not_found():
+    text = "夜色渐深，山谷里起了风。萧炎说：“走吧。”"
+    model = ScriptedChatModel(
+        [
+            # 旁白被浓缩，原文中找不到，按字数估计截断位置而不是当作已完成
+            '[{"role": "旁白", "content": "入夜起风。", "speed": 3}, {"role": "萧炎", "content": "走',
+            '[{"role": "萧炎", "content": "走吧。", "speed": 3}]',
+        ]
+    )
+    dialogs = extract_dialog(text, model)
+
+    assert [d["content"] for d in dialogs] == ["入夜起风。", "走吧。"]
+    assert len(model.prompts) == 2 and "走吧" in model.prompts[1]
+
+
+def test_gen_interval_validation():
+    dialogs = [{"role": "旁白", "content": "a"}, {"role": "萧炎", "content": "b"}]
+    short = json.dumps([{"role": "萧炎", "content": "b", "interval": 0}])
+    model = ScriptedChatModel([short, short])
+    intervals = gen_interval(dialogs, model)
+
+    assert [i["interval"] for i in intervals] == [1, 0]
+    assert len(model.prompts) == 2
+
+
+def test_role_registry(tmp_path):
+    registry = RoleRegistry(str(tmp_path / "role_registry.json"))
+    model = ScriptedChatModel(
+        [
+            '[{"name": "萧炎", "gender": "男", "personality": "坚韧", "alias": ["少年"]},'
+            ' {"name": "纳兰嫣然", "gender": "男", "personality": "高傲", "alias": []}]',
+            # 增量提取：修正性别、补充称谓，未给出性别的已知角色保持原性别
+            '[{"name": "纳兰嫣然", "gender": "女", "alias": ["纳兰小姐"]}, {"name": "少年", "alias": ["萧家三少爷"]}]',
+            # 没有新角色，返回的角色列表仍包含文本中出现的已知角色
+            "[]",
+        ]
+    )
+    extract_role("萧炎 纳兰嫣然", model, registry)
+    roles = extract_role("纳兰小姐 萧家三少爷", model, registry)
+    unchanged = extract_role("少年笑了笑", model, registry)
+    registry.save()
+
+    assert "萧炎|男|少年" in model.prompts[1]
+    assert [role["name"] for role in roles] == ["纳兰嫣然", "萧炎"]
+    assert roles[0]["gender"] == "女" and roles[1]["personality"] == "坚韧"
+    assert [role["name"] for role in unchanged] == ["萧炎"]
+
+    registry = RoleRegistry(str(tmp_path / "role_registry.json"))
+    assert registry["纳兰小姐"]["gender"] == "女"
+    assert registry["萧家三少爷"]["name"] == "萧炎"
+    # 前缀匹配
+    assert registry["萧炎哥哥"]["name"] == "萧炎"
+    assert registry["萧炎(os)"]["name"] == "萧炎"
+    # 名字后不是敬称时可能是另一个人
+    assert registry.resolve("萧炎的父亲") is None
+    assert registry["纳兰"]["name"] == "纳兰嫣然"
+    assert registry.resolve("萧") is None
+
+
+def test_gen_interval_local():
+    dialogs = [
+        {"role": "旁白", "content": "萧炎淡淡道："},
+        {"role": "萧炎", "content": "三年之约——"},
+        {"role": "纳兰嫣然", "content": "我记得。"},
+        {"role": "纳兰嫣然(os)", "content": "他真的变了。"},
+        {"role": "萧炎", "content": "那就好……"},
+        {"role": "纳兰嫣然", "content": "嗯。"},
+    ]
+    intervals = gen_interval_local(dialogs)
+    assert [i["interval"] for i in intervals] == [0, 0, 1, 1, 1, 1]
+
+    # hybrid 只把无法确定的一句发给大模型
+    model = ScriptedChatModel(['[{"id": 4, "interval": 2}]'])
+    intervals = gen_interval(dialogs, model, mode="hybrid")
+    assert [i["interval"] for i in intervals] == [0, 0, 1, 1, 2, 1]
+    assert len(model.prompts) == 1 and "三年之约" not in model.prompts[0]
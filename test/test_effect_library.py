@@ -0,0 +1,81 @@
+import sys
+sys.path.append("..")
+
+from src.audio.tta import CachedTTAModel, StubTTAModel
+from src.audio.tts.sink import read_wav
+from src.utils.effect_library import EffectLibrary, hash_embedding, normalize_desc
+
+
+def test_effect_library(tmp_path):
+    assert normalize_desc("Footsteps on the wooden floor.") == "footsteps wooden floor"
+    similar, other = hash_embedding(["Footsteps on a wooden floor", "Wind blowing"]) @ hash_embedding(
+        ["footstep on wooden floor"]
+    )[0]
+    assert similar > 0.99 and other < 0.1
+
+    library_dir = str(tmp_path / "library")
+    library = EffectLibrary(library_dir, threshold=0.8)
+    clip = tmp_path / "clip.wav"
+    clip.write_bytes(b"footsteps")
+    library.add(["Footsteps on a wooden floor"], [3], "v1", [str(clip)])
+
+    # 规范化后相同的描述精确命中，保存的音效不够长时不命中
+    path = library.fetch_exact("footsteps on the wooden floor!", "v1", 3)
+    assert open(path, "rb").read() == b"footsteps"
+    assert library.fetch_exact("Footsteps on a wooden floor", "v1", 5) is None
+
+    # 描述相近时近似命中，模型版本不同时不命中
+    hit, miss, other_version = (
+        library.nearest(["Footsteps on wooden floor", "Wind blowing"], "v1")
+        + library.nearest(["Footsteps on a wooden floor"], "v2")
+    )
+    assert hit[1] == 3 and hit[2] > 0.8
+    assert miss is None and other_version is None
+    assert library.stats()["exact_hits"] == 1 and library.stats()["near_hits"] == 1
+
+    library.save()
+    restored = EffectLibrary(library_dir, threshold=0.8)
+    assert restored.nearest(["footsteps, wooden floor"], "v1")[0] is not None
+
+    # 未校准的文本嵌入默认不做近似命中
+    assert EffectLibrary(library_dir).threshold == 0.85
+    uncalibrated = EffectLibrary(str(tmp_path / "clap"), embedding_name="clap-cls")
+    uncalibrated.add(["Footsteps on a wooden floor"], [3], "v1", [str(clip)])
+    assert uncalibrated.threshold is None
+    assert uncalibrated.nearest(["Footsteps on wooden floor"], "v1") == [None]
+
+
+class FixedClipTTAModel(StubTTAModel):
+    """与 Make-An-Audio 一样总是生成固定时长的音效，记录每次生成的请求"""
+
+    def __init__(self):
+        super().__init__(sample_rate=8000)
+        self.requests = []
+
+    def clip_duration(self, duration):
+        return 10
+
+    def generate_batch(self, descs, durations, output_paths, **kwargs):
+        self.requests.append(list(zip(descs, durations)))
+        super().generate_batch(descs, durations, output_paths, **kwargs)
+
+
+def test_cached_tta_model(tmp_path):
+    model = FixedClipTTAModel()
+    cached = CachedTTAModel(model, str(tmp_path / "library"))
+    outputs = [str(tmp_path / f"a{i}.wav") for i in range(3)]
+    cached.generate_batch(["Wind blowing", "wind blowing.", "Door creaks"], [3, 8, 1], outputs)
+
+    # 相同的描述只生成一次完整的音效，再裁剪到各自的时长
+    assert model.requests == [[("Wind blowing", 10), ("Door creaks", 10)]]
+    assert [len(read_wav(output)[0]) / 8000 for output in outputs] == [3, 8, 1]
+
+    # 换一个时长仍然精确命中，从完整的音效裁剪而不是循环短音效
+    cached = CachedTTAModel(model, str(tmp_path / "library"))
+    output = str(tmp_path / "b.wav")
+    cached.generate_batch(["Wind blowing"], [8], [output])
+    assert len(model.requests) == 1
+    assert cached.library.stats()["exact_hits"] == 1
+    audio, _ = read_wav(output)
+    full, _ = read_wav(outputs[1])
+    assert len(audio) == len(full) and abs(audio[:-400] - full[:-400]).max() < 1e-4
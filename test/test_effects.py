@@ -0,0 +1,54 @@
+import sys
+sys.path.append("..")
+
+import numpy as np
+
+from src.utils.effects import apply_effects, crossfade, echo, fit_duration, gain, trim
+
+
+def test_echo():
+    audio = np.zeros(100, dtype=np.float32)
+    audio[0] = 1.0
+    # 1000 Hz 下 50 毫秒为 50 个采样点
+    output = echo(audio, 1000)
+    assert len(output) == 150
+    assert np.isclose(output[0], 0.5 * 0.8)
+    assert np.isclose(output[50], 0.8 * 0.8)
+    assert np.isclose(np.abs(output).sum(), 0.4 + 0.64)
+
+    assert np.allclose(apply_effects(audio, 1000, ["os"]), output)
+
+
+def test_gain_trim():
+    audio = np.zeros((1, 1000), dtype=np.float32)
+    audio[0, 400:600] = 0.5
+    assert np.isclose(gain(audio, 1000, db=-6).max(), 0.5 * 10 ** (-6 / 20))
+
+    trimmed = trim(audio, 1000, pad=0.01)
+    assert trimmed.shape == (1, 220)
+    assert np.allclose(apply_effects(audio, 1000, [trim, gain]), trim(audio, 1000))
+
+
+def test_fit_duration():
+    audio = np.ones(100, dtype=np.float32)
+    # 循环到 2.5 倍长，末尾淡出
+    looped = fit_duration(audio, 100, 2.5, fade=0.1)
+    assert looped.shape == (250,)
+    assert looped[200] == 1.0 and looped[-1] == 0.0
+    assert fit_duration(audio, 100, 0.5, fade=0).shape == (50,)
+
+
+def test_crossfade():
+    audios = [np.full((1, 10), 1.0), np.full((1, 8), 2.0), np.full((1, 3), 3.0), np.full((1, 6), 4.0)]
+    output = crossfade(audios, 4)
+    # 长度为各段之和减去重叠，短于 overlap 的段按自身长度重叠
+    assert output.shape == (1, 10 + 8 + 3 + 6 - 4 - 3 - 4)
+    # 各段按顺序出现，重叠处从前一段线性过渡到后一段
+    assert np.allclose(output[0, :6], 1.0)
+    assert np.allclose(output[0, 6:10], np.linspace(1.0, 2.0, 4))
+    assert np.allclose(output[0, 10:11], 2.0)
+    assert np.isclose(output[0, -1], 4.0)
+    assert np.all(np.diff(output[0]) >= -1e-6)
+
+    assert np.array_equal(crossfade(audios[:1], 4), audios[0].astype(np.float32))
+    assert crossfade([np.zeros(5), np.zeros(5)], 0).shape == (10,)
@@ -0,0 +1,89 @@
+import sys
+sys.path.append("..")
+
+import os
+
+from src.utils.file_cache import FileCache, Manifest
+
+
+def test_file_cache(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=10)
+    source = tmp_path / "source.wav"
+    source.write_bytes(b"voice")
+
+    key = cache.make_key("是。", "正常语速", files=[str(source)])
+    # 音源内容不变时与路径无关
+    copied = tmp_path / "copied.wav"
+    copied.write_bytes(b"voice")
+    assert key == cache.make_key("是。", "正常语速", files=[str(copied)])
+    assert key != cache.make_key("是。", "快速", files=[str(source)])
+
+    output = tmp_path / "out" / "a.wav"
+    output.parent.mkdir()
+    assert not cache.fetch(key, str(output))
+    output.write_bytes(b"123456")
+    cache.put(key, str(output))
+    other = tmp_path / "out" / "b.wav"
+    assert cache.fetch(key, str(other))
+    assert other.read_bytes() == b"123456"
+    assert cache.stats()["hits"] == 1
+
+    # 超出容量时淘汰，已放到结果目录的文件不受影响
+    cache.put(cache.make_key("b"), str(source))
+    assert cache.evict() == 1
+    assert other.read_bytes() == b"123456"
+
+    manifest = Manifest(str(output.parent))
+    manifest.set("a.wav", key)
+    manifest.save()
+    assert Manifest(str(output.parent)).get("a.wav") == key
+    assert os.path.exists(output.parent / Manifest.FILE_NAME)
+
+
+def test_file_cache_running_total(tmp_path, monkeypatch):
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=10)
+    source = tmp_path / "source.wav"
+    source.write_bytes(b"voice")
+    cache.put(cache.make_key("a"), str(source))
+    assert cache.evict() == 0
+
+    # 统计过一次后，未超出容量时不再遍历缓存目录
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, "walk", lambda *args: walks.append(args) or walk(*args))
+    cache.put(cache.make_key("a"), str(source))
+    cache.put(cache.make_key("b"), str(source))
+    assert cache.evict() == 0
+    assert walks == []
+
+    cache.put(cache.make_key("c"), str(source))
+    assert cache.evict() == 1
+    assert len(walks) == 1
+
+
+def test_reuse_speech(tmp_path):
+    from src.audio.speech import _reuse_speech
+
+    cache = FileCache(str(tmp_path / "cache"))
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    legacy = output_dir / "旁白_0.wav"
+    legacy.write_bytes(b"old")
+
+    # 没有记录文件的旧目录，已有文件视为有效
+    manifest = Manifest(str(output_dir))
+    assert manifest.legacy
+    assert _reuse_speech(str(legacy), "a", cache, manifest)
+    assert manifest.get("旁白_0.wav") == "a"
+    manifest.save()
+
+    # 已有记录文件时，没有记录的文件（如中断后留下的）不可信
+    manifest = Manifest(str(output_dir))
+    assert not manifest.legacy
+    stray = output_dir / "萧炎_1.wav"
+    stray.write_bytes(b"stray")
+    assert not _reuse_speech(str(stray), "b", cache, manifest)
+    assert not stray.exists()
+    assert _reuse_speech(str(legacy), "a", cache, manifest)
+    assert not _reuse_speech(str(legacy), "c", cache, manifest)
+    assert not legacy.exists()
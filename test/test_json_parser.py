@@ -0,0 +1,36 @@
+import sys
+sys.path.append("..")
+
+from src.utils.json_parser import JSONArrayStream, extract_json
+
+
+def test_json_array_stream():
+    response = """```json
+[
+    {"role": "旁白", "content": "他说：\\"[别走]\\"", "speed": 3},
+    {"role": "纳兰嫣然", "content": "{}", "speed": 2},
+    ...
+]
+```"""
+    stream = JSONArrayStream()
+    items = []
+    for i in range(0, len(response), 7):
+        items.extend(stream.feed(response[i : i + 7]))
+    assert stream.done
+    assert [item["role"] for item in items] == ["旁白", "纳兰嫣然"]
+    assert items[0]["content"] == '他说："[别走]"'
+
+
+def test_json_array_stream_partial():
+    stream = JSONArrayStream()
+    assert stream.feed('[{"a": 1}, {"a"') == [{"a": 1}]
+    assert stream.feed(": 2}") == [{"a": 2}]
+    assert not stream.done
+    assert stream.feed(", 3]") == [3]
+    assert stream.done
+
+
+def test_extract_json_truncated():
+    response = '```json\n[\n    {"role": "旁白", "content": "a"},\n    {"role": "旁白", "con'
+    assert extract_json(response) == [{"role": "旁白", "content": "a"}]
+    assert extract_json('好的，结果如下：\n{"first": 3}') == {"first": 3}
@@ -0,0 +1,26 @@
+import sys
+sys.path.append("..")
+
+from src.utils.lru import LRUCache
+
+
+def test_lru_cache(tmp_path):
+    cache_file = str(tmp_path / "cache.pkl")
+    cache = LRUCache(max_entries=2, cache_file=cache_file, version="v1")
+    calls = []
+    compute = lambda text: lambda: calls.append(text) or text.upper()
+
+    assert cache.get_or_compute("a", compute("a")) == "A"
+    assert cache.get_or_compute("a", compute("a")) == "A"
+    cache.get_or_compute("b", compute("b"))
+    cache.get("a")
+    # b 最久未使用，被淘汰
+    cache.set("c", "C")
+    assert "b" not in cache and "a" in cache
+    assert calls == ["a", "b"]
+    assert cache.stats()["hits"] == 2
+
+    cache.save()
+    assert LRUCache(2, cache_file, "v1").get("c") == "C"
+    # 版本不一致时丢弃
+    assert len(LRUCache(2, cache_file, "v2")) == 0
@@ -0,0 +1,30 @@
+import sys
+sys.path.append("..")
+
+from src.utils.model_pool import ModelPool
+
+
+class Model:
+    loads = 0
+
+    def __init__(self, name):
+        Model.loads += 1
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_model_pool():
+    pool = ModelPool()
+    a = pool.get("tts", Model, "a")
+    assert pool.get("tts", Model, "a") is a
+    assert Model.loads == 1
+
+    # 参数变化时替换旧模型
+    b = pool.get("tts", Model, "b")
+    assert a.closed and b is not a and Model.loads == 2
+
+    pool.release("tts")
+    assert b.closed and "tts" not in pool
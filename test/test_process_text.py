@@ -0,0 +1,192 @@
+import sys
+sys.path.append("..")
+
+import asyncio
+import json
+import os
+import re
+
+from process_text import process_chunks
+from src.dialog import RoleRegistry, extract_all_async
+from src.utils.chat_model import AsyncChatModel
+from src.utils.json_parser import extract_json
+
+
+class GatedAsyncChatModel(AsyncChatModel):
+    """
+    按请求类型返回固定的回复，角色请求在 role_gate 放行前阻塞，记录请求的先后
+    dialog_delays 为各块对话请求的耗时，默认 0.01 秒
+    """
+
+    def __init__(self, dialog_delays=None):
+        self.role_gate = asyncio.Event()
+        self.dialog_delays = dialog_delays or {}
+        self.events = []
+        self.prompts = {"dialog": [], "role": [], "interval": [], "all": []}
+
+    async def generate(self, prompt, system="", return_type="json", validate=None, **kwargs):
+        if "`roles`和`dialogs`" in prompt:
+            kind = "all"
+        else:
+            kind = "role" if "人物信息" in system else "dialog" if "对话信息" in system else "interval"
+        i = int(re.search(r"第(\d+)块", prompt).group(1))
+        self.prompts[kind].append(prompt)
+        self.events.append((kind, i, "start"))
+        if kind == "role":
+            await self.role_gate.wait()
+        elif kind == "dialog":
+            await asyncio.sleep(self.dialog_delays.get(i, 0.01))
+        else:
+            await asyncio.sleep(0.01)
+        self.events.append((kind, i, "end"))
+        if kind == "dialog":
+            response = json.dumps([{"role": f"角色{i}", "content": f"第{i}块。"}], ensure_ascii=False)
+        elif kind == "role":
+            response = json.dumps([{"name": f"角色{i}", "gender": "男", "personality": "沉稳", "alias": []}])
+        elif kind == "interval":
+            response = json.dumps([{"role": f"角色{i}", "content": f"第{i}块。", "interval": 1}])
+        else:
+            response = json.dumps(
+                {
+                    "roles": [{"name": f"角色{i}", "gender": "女", "personality": "沉稳"}],
+                    "dialogs": [{"role": f"角色{i}", "content": f"第{i}块。", "speed": 4, "interval": 0}],
+                },
+                ensure_ascii=False,
+            )
+        if return_type == "json":
+            response = extract_json(response)
+        if validate is not None:
+            response = validate(response)
+        return response
+
+
+def _write_chunks(tmp_path, n):
+    chunk_files = []
+    for i in range(n):
+        chunk_file = tmp_path / f"chunk_{i}.txt"
+        chunk_file.write_text(f"角色{i}：“第{i}块。”")
+        chunk_files.append(str(chunk_file))
+    return chunk_files
+
+
+async def _wait_for(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError()
+
+
+def test_intervals_do_not_wait_for_roles(tmp_path):
+    chunk_files = _write_chunks(tmp_path, 3)
+    registry = RoleRegistry(str(tmp_path / "role_registry.json"))
+    model = GatedAsyncChatModel()
+
+    async def run():
+        task = asyncio.ensure_future(
+            process_chunks(chunk_files, str(tmp_path), model, registry=registry, interval_mode="llm", registry_window=1)
+        )
+        # 角色请求全部阻塞时，各块的间隔仍然生成完毕
+        await _wait_for(lambda: all(os.path.exists(tmp_path / f"interval_{i}.json") for i in range(3)))
+        assert not any(os.path.exists(tmp_path / f"role_{i}.json") for i in range(3))
+        # 窗口为 1 时逐块提取角色
+        assert [e for e in model.events if e[0] == "role"] == [("role", 0, "start")]
+        model.role_gate.set()
+        await task
+
+    asyncio.run(run())
+    assert len(registry) == 3
+    for i in range(3):
+        roles = json.load(open(tmp_path / f"role_{i}.json"))
+        assert [role["name"] for role in roles] == [f"角色{i}"]
+
+
+def test_registry_window(tmp_path):
+    chunk_files = _write_chunks(tmp_path, 4)
+    registry = RoleRegistry(str(tmp_path / "role_registry.json"))
+    model = GatedAsyncChatModel()
+
+    async def run():
+        task = asyncio.ensure_future(
+            process_chunks(chunk_files, str(tmp_path), model, registry=registry, interval_mode="local", registry_window=2)
+        )
+        # 同一窗口的两块同时提取角色，下一个窗口等待前一个窗口合并
+        await _wait_for(lambda: len(model.prompts["role"]) == 2)
+        await asyncio.sleep(0.05)
+        assert sorted(e[1] for e in model.events if e[0] == "role") == [0, 1]
+        model.role_gate.set()
+        await task
+
+    asyncio.run(run())
+    first, second = model.prompts["role"][:2], model.prompts["role"][2:]
+    # 第一个窗口没有已知角色，第二个窗口带上第一个窗口的角色
+    assert not any("角色0|男" in prompt for prompt in first)
+    assert all("角色0|男" in prompt and "角色1|男" in prompt for prompt in second)
+    assert not any("角色2|男" in prompt for prompt in second)
+    assert list(RoleRegistry(str(tmp_path / "role_registry.json")).roles) == [f"角色{i}" for i in range(4)]
+
+
+def test_dialogs_and_roles_overlap(tmp_path):
+    chunk_files = _write_chunks(tmp_path, 1)
+    model = GatedAsyncChatModel(dialog_delays={0: 0.1})
+    model.role_gate.set()
+
+    asyncio.run(process_chunks(chunk_files, str(tmp_path), model, interval_mode="local"))
+    events = model.events
+    # 同一块的角色请求在对话请求完成前已经发出
+    assert events.index(("role", 0, "start")) < events.index(("dialog", 0, "end"))
+    assert events.index(("dialog", 0, "start")) < events.index(("role", 0, "end"))
+
+
+def test_intervals_wait_for_own_dialogs(tmp_path):
+    chunk_files = _write_chunks(tmp_path, 2)
+    model = GatedAsyncChatModel(dialog_delays={0: 0.01, 1: 0.2})
+    model.role_gate.set()
+
+    asyncio.run(process_chunks(chunk_files, str(tmp_path), model, interval_mode="llm"))
+    events = model.events
+    for i in range(2):
+        assert events.index(("dialog", i, "end")) < events.index(("interval", i, "start"))
+    # 第 0 块的间隔不等第 1 块的对话
+    assert events.index(("interval", 0, "end")) < events.index(("dialog", 1, "end"))
+
+
+def test_extract_all_async():
+    model = GatedAsyncChatModel()
+    dialogs, roles, intervals = asyncio.run(extract_all_async("角色0：“第0块。”", model))
+
+    assert len(model.prompts["all"]) == 1
+    assert roles == [{"name": "角色0", "gender": "女", "personality": "沉稳", "alias": []}]
+    assert [(d["role"], d["content"], d["speed"]) for d in dialogs] == [("角色0", "第0块。", 4)]
+    assert "interval" not in dialogs[0]
+    assert intervals == [{"role": "角色0", "content": "第0块。", "interval": 0}]
+
+
+def test_combined_mode(tmp_path):
+    chunk_files = _write_chunks(tmp_path, 2)
+    model = GatedAsyncChatModel()
+    model.role_gate.set()
+
+    asyncio.run(process_chunks(chunk_files, str(tmp_path), model, mode="combined", interval_mode="llm"))
+    # 每块只发一次请求，三个文件都由这次请求写出
+    assert len(model.prompts["all"]) == 2
+    assert not model.prompts["dialog"] and not model.prompts["role"] and not model.prompts["interval"]
+    for i in range(2):
+        assert json.load(open(tmp_path / f"dialog_{i}.json"))[0]["speed"] == 4
+        assert json.load(open(tmp_path / f"role_{i}.json"))[0]["gender"] == "女"
+        assert json.load(open(tmp_path / f"interval_{i}.json"))[0]["interval"] == 0
+
+
+def test_combined_mode_existing_dialogs(tmp_path):
+    chunk_files = _write_chunks(tmp_path, 1)
+    dialogs = [{"role": "角色0", "content": "第0块。", "speed": 2}]
+    (tmp_path / "dialog_0.json").write_text(json.dumps(dialogs, ensure_ascii=False))
+    model = GatedAsyncChatModel()
+    model.role_gate.set()
+
+    asyncio.run(process_chunks(chunk_files, str(tmp_path), model, mode="combined", interval_mode="llm"))
+    # 已有对话文件时不再整体提取，间隔按已有的对话生成
+    assert not model.prompts["all"] and not model.prompts["dialog"]
+    assert len(model.prompts["role"]) == 1 and len(model.prompts["interval"]) == 1
+    assert json.load(open(tmp_path / "dialog_0.json")) == dialogs
+    assert json.load(open(tmp_path / "interval_0.json"))[0]["interval"] == 1
@@ -0,0 +1,123 @@
+import sys
+sys.path.append("..")
+
+import asyncio
+
+import pytest
+from openai import BadRequestError, InternalServerError
+
+from src.utils.chat_model import OpenAIChatModel
+from src.utils.rate_limit import TokenBucket, CircuitBreaker, RetryPolicy, CircuitOpenError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    clock.now += 2
+    assert bucket.reserve(1) == 0
+
+
+def test_circuit_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.wait_time() == pytest.approx(10)
+    clock.now += 10
+    assert breaker.wait_time() == 0
+    assert breaker.wait_time() > 0
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_retry_after(fake_openai):
+    fake_openai.responses = [
+        (429, {"Retry-After": "0"}, "rate limited"),
+        (503, {}, "unavailable"),
+    ]
+    fake_openai.default_content = '{"ok": true}'
+    policy = RetryPolicy(max_retries=3, base_delay=0.01, rpm=6000, tpm=10**6)
+    model = OpenAIChatModel(base_url=fake_openai.base_url, api_key="test", policy=policy)
+
+    assert model.generate("hello") == {"ok": True}
+    assert len(fake_openai.requests) == 3
+
+
+def test_retry_exhausted(fake_openai):
+    fake_openai.responses = [(500, {}, "error")] * 3 + [(400, {}, "bad request")]
+    policy = RetryPolicy(max_retries=2, base_delay=0.01, failure_threshold=3, fail_fast=True)
+    model = OpenAIChatModel(base_url=fake_openai.base_url, api_key="test", policy=policy)
+
+    with pytest.raises(InternalServerError):
+        model.generate("hello")
+    assert len(fake_openai.requests) == 3
+    # 连续失败后熔断，直接失败不再请求
+    with pytest.raises(CircuitOpenError):
+        model.generate("hello")
+    assert len(fake_openai.requests) == 3
+
+
+def test_policy_not_mutated(fake_openai):
+    policy = RetryPolicy()
+    retryable_exceptions = policy.retryable_exceptions
+    model = OpenAIChatModel(base_url=fake_openai.base_url, api_key="test", policy=policy)
+    assert policy.retryable_exceptions == retryable_exceptions
+    assert len(model.policy.retryable_exceptions) > len(retryable_exceptions)
+
+
+def test_not_retryable(fake_openai):
+    fake_openai.responses = [(400, {}, "bad request")]
+    model = OpenAIChatModel(base_url=fake_openai.base_url, api_key="test", policy=RetryPolicy())
+
+    with pytest.raises(BadRequestError):
+        model.generate("hello")
+    assert len(fake_openai.requests) == 1
+
+
+def test_half_open_single_probe():
+    policy = RetryPolicy(base_delay=0.01)
+    policy.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    policy.breaker.record_failure()
+    events = []
+
+    async def request():
+        events.append("start")
+        await asyncio.sleep(0.1)
+        events.append("end")
+        return True
+
+    async def run():
+        return await asyncio.gather(*[policy.acall(request) for _ in range(3)])
+
+    assert asyncio.run(run()) == [True] * 3
+    # 熔断结束后只有一个试探请求，成功后其余请求才发出
+    assert events[:2] == ["start", "end"]
+    assert policy.breaker.state == "closed"
+
+
+def test_probe_not_retryable():
+    clock = FakeClock()
+    policy = RetryPolicy(fail_fast=True)
+    policy.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    policy.breaker.record_failure()
+    clock.now += 10
+
+    def bad_request():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        policy.call(bad_request)
+    # 不可重试的错误不影响熔断状态，但要释放试探名额
+    assert policy.breaker.state == "half-open"
+    assert policy.breaker.wait_time() == 0
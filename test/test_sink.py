@@ -0,0 +1,79 @@
+import sys
+sys.path.append("..")
+
+import os
+
+import numpy as np
+import pytest
+
+from src.audio.tts.sink import WavSink, read_wav, write_wav
+from src.audio.tts.stub import StubTTSModel
+from src.utils.effects import apply_effects
+
+
+def test_wav_sink(tmp_path):
+    output_path = str(tmp_path / "speech.wav")
+    with WavSink(output_path, 16000) as sink:
+        sink.write(np.full(100, 0.5, dtype=np.float32))
+        # 写入过程中只有 .part 文件
+        assert os.path.exists(output_path + ".part")
+        assert not os.path.exists(output_path)
+        sink.write(np.full((1, 60), 2.0, dtype=np.float32))
+
+    assert not os.path.exists(output_path + ".part")
+    audio, sample_rate = read_wav(output_path)
+    assert sample_rate == 16000 and len(audio) == 160
+    assert np.allclose(audio[:100], 0.5, atol=1e-4)
+    # 超出范围的采样被截断
+    assert np.allclose(audio[100:], 32767 / 32768)
+
+
+def test_wav_sink_discard(tmp_path):
+    output_path = str(tmp_path / "speech.wav")
+    with pytest.raises(RuntimeError):
+        with WavSink(output_path, 16000) as sink:
+            sink.write(np.zeros(100, dtype=np.float32))
+            raise RuntimeError("interrupted")
+
+    assert not os.path.exists(output_path)
+    assert not os.path.exists(output_path + ".part")
+
+
+def test_write_wav_roundtrip(tmp_path):
+    output_path = str(tmp_path / "speech.wav")
+    audio = np.sin(np.linspace(0, 20, 800)).astype(np.float32) * 0.8
+    write_wav(output_path, audio, 8000)
+
+    loaded, sample_rate = read_wav(output_path)
+    assert sample_rate == 8000
+    assert np.allclose(loaded, audio, atol=1e-4)
+
+
+def test_generate_stream(tmp_path):
+    model = StubTTSModel(sample_rate=8000)
+    model.register("male_0", "male_0.wav")
+    output_path = str(tmp_path / "speech.wav")
+    stats = model.generate_stream("萧炎淡淡道。", "", "male_0", output_path)
+
+    audio, sample_rate = read_wav(output_path)
+    assert sample_rate == 8000
+    assert np.isclose(stats["secs"], len(audio) / 8000)
+    assert stats["ttfa"] is not None and stats["ttfa"] <= stats["elapsed"]
+
+
+def test_generate_stream_effects(tmp_path):
+    model = StubTTSModel(sample_rate=8000)
+    model.register("male_0", "male_0.wav")
+    plain_path = str(tmp_path / "plain.wav")
+    os_path = str(tmp_path / "os.wav")
+    model.generate_stream("萧炎淡淡道。", "", "male_0", plain_path, block_secs=0.1)
+    stats = model.generate_stream("萧炎淡淡道。", "", "male_0", os_path, effects=["os"], block_secs=0.1)
+
+    plain, _ = read_wav(plain_path)
+    processed, _ = read_wav(os_path)
+    # 效果对整句应用一次，与整句生成后处理的结果一致
+    expected = apply_effects(plain, 8000, ["os"])
+    assert np.isclose(stats["secs"], len(processed) / 8000)
+    assert len(processed) == len(expected)
+    assert np.allclose(processed, np.clip(expected, -1, 32767 / 32768), atol=1e-3)
+    assert not os.path.exists(os_path + ".part")
@@ -0,0 +1,60 @@
+import sys
+sys.path.append("..")
+
+from src.dialog.text import split_text, chunk_token_report, _Budget, _best_cut, _pack_lines
+
+
+def test_split_text_local(tmp_path):
+    raw = []
+    for chapter in range(1, 4):
+        raw += [f"第{chapter}章 风起", ""]
+        raw += ["旁白" * 50, ""] * 10
+        raw += ["***", ""]
+        raw += ["“你来了。”", "“我来了。”", ""]
+    text_file = tmp_path / "book.txt"
+    text_file.write_text("\n".join(raw))
+
+    chunk_files = split_text(str(text_file), max_input_tokens=1500, max_output_tokens=4000)
+    chunks = [open(f).read().splitlines() for f in chunk_files]
+
+    assert sum(len(chunk) for chunk in chunks) == 3 * (1 + 10 + 2)
+    report = chunk_token_report(chunk_files)
+    assert all(item["input_tokens"] <= 1500 for item in report)
+    assert all(item["output_tokens"] <= 4000 for item in report)
+    assert (tmp_path / "book_tokens.json").exists()
+    # 每章从新的一块开始，分隔符被去掉
+    assert [chunk[0] for chunk in chunks if chunk[0].startswith("第")] == [
+        "第1章 风起", "第2章 风起", "第3章 风起"
+    ]
+    assert all("***" not in chunk for chunk in chunks)
+    # 不在连续对话中间切分
+    assert all(chunk[0] != "“我来了。”" for chunk in chunks)
+
+
+def test_split_text_long_paragraph(tmp_path):
+    text_file = tmp_path / "long.txt"
+    text_file.write_text("短句。\n" + "很长的一句话。" * 500)
+
+    chunk_files = split_text(str(text_file), max_input_tokens=1000, max_output_tokens=2000)
+    report = chunk_token_report(chunk_files)
+
+    assert len(chunk_files) > 1
+    assert all(item["input_tokens"] <= 1000 for item in report)
+    assert "".join(open(f).read().replace("\n", "") for f in chunk_files) == "短句。" + "很长的一句话。" * 500
+
+
+def test_pack_lines_oversized_trailing_line():
+    # 最后一行接近整块预算，前面的切分点落在空行处
+    costs = [(3, 0), (3, 0), (3, 0), (9, 0)]
+    budget = _Budget(costs, None, 10, 100)
+    boundaries = _pack_lines([0, 0, 5, 0], budget)
+
+    chunks = list(zip([0] + boundaries, boundaries + [len(costs)]))
+    assert all(budget.fits(start, end) for start, end in chunks)
+    assert boundaries == [2, 3]
+
+
+def test_best_cut_within_budget():
+    budget = _Budget([(3, 0), (3, 0), (9, 0)], None, 10, 100)
+    # 得分最高的位置会让本块超出预算，不能选
+    assert _best_cut([0, 0, 0, 10], budget, 0, 3, 0.5) == 2
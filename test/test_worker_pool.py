@@ -0,0 +1,60 @@
+import sys
+sys.path.append("..")
+
+import os
+
+import numpy as np
+
+from src.audio.tts import StubTTSModel, TTSWorkerPool
+from src.audio.tts.sink import read_wav
+
+
+class ClosingStubTTSModel(StubTTSModel):
+    """关闭时写出标记文件，检查子进程退出前是否关闭了模型"""
+
+    def __init__(self, closed_dir: str, sample_rate: int):
+        super().__init__(sample_rate=sample_rate)
+        self.closed_dir = closed_dir
+
+    def close(self):
+        with open(os.path.join(self.closed_dir, f"closed_{os.getpid()}"), "w") as f:
+            f.write(os.environ.get("OMP_NUM_THREADS", ""))
+
+
+def test_worker_pool(tmp_path):
+    omp_threads = os.environ.get("OMP_NUM_THREADS")
+    pool = TTSWorkerPool(ClosingStubTTSModel, (str(tmp_path), 8000), num_workers=2, threads_per_worker=1)
+    model = StubTTSModel(sample_rate=8000)
+    for key in ("male_0", "female_0"):
+        pool.register(key, f"{key}.wav")
+        model.register(key, f"{key}.wav")
+    try:
+        assert pool.sample_rate == 8000
+        assert pool.version == model.version
+
+        output_path = str(tmp_path / "single.wav")
+        audio = pool.generate("萧炎淡淡道。", "", "male_0", output_path)
+        assert np.allclose(audio, model.generate("萧炎淡淡道。", "", "male_0", str(tmp_path / "ref.wav")))
+
+        requests = [
+            {"tts_text": "三年之约。" * (i + 1), "instruct_text": "", "speech_key": key, "output_path": str(tmp_path / f"batch_{i}.wav")}
+            for i, key in enumerate(["male_0", "female_0", "male_0"])
+        ]
+        pool.generate_batch(requests)
+        for request in requests:
+            audio, sample_rate = read_wav(request["output_path"])
+            assert sample_rate == 8000
+            assert np.isclose(len(audio) / sample_rate, model.duration(request["tts_text"]), atol=1e-3)
+
+        stream_path = str(tmp_path / "stream.wav")
+        stats = pool.generate_stream("我记得。", "", "female_0", stream_path)
+        audio, _ = read_wav(stream_path)
+        assert np.isclose(stats["secs"], len(audio) / 8000)
+    finally:
+        pool.close()
+
+    # 每个启动过的子进程退出前都关闭了模型，线程数由启动环境传入
+    closed = [name for name in os.listdir(tmp_path) if name.startswith("closed_")]
+    assert 1 <= len(closed) <= 2
+    assert all(open(tmp_path / name).read() == "1" for name in closed)
+    assert os.environ.get("OMP_NUM_THREADS") == omp_threads